@@ -23,6 +23,9 @@ class AlertDispatcher:
     def history(self, trip_id: str) -> List[AlertPayload]:
         return self._history.get(trip_id, [])
 
+    def forget(self, trip_id: str) -> List[AlertPayload]:
+        return self._history.pop(trip_id, [])
+
 
 dispatcher = AlertDispatcher()
 
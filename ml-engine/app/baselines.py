@@ -0,0 +1,287 @@
+"""Running behavioural baselines, updated with every observation.
+
+A trip's baseline is a few fixed-size accumulators: Welford mean and
+variance of its moving speed plus a histogram of it, a 24-bin histogram of
+the hours it was active in, and a histogram of its inactivity gaps (how long
+it stood still between two moving fixes). Each observation updates them in
+constant time and memory, so reading a baseline never touches the
+observation history.
+
+A ``TouristProfile`` holds the same sketches summed over a tourist's closed
+trips, as one fixed-size record (``PROFILE_DTYPE``, a few hundred bytes) so
+it can be stored and read back whole. A new trip starts from its tourist's
+profile as a prior: every baseline figure is read from the trip's own
+accumulators plus the prior's, the prior scaled down to at most
+``PRIOR_OBSERVATIONS`` observations so the trip soon outweighs it.
+"""
+from __future__ import annotations
+
+import math
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .heartbeat import MOVING_SPEED_MPS, epoch_seconds
+from .schemas import Observation
+
+# Baseline of a trip without observations
+DEFAULT_SPEED_KMH = 4.0
+DEFAULT_HOURS = list(range(8, 22))  # 8 AM - 10 PM
+DEFAULT_MAX_INACTIVITY_MIN = 30.0
+
+# Upper edges, in minutes, of the inactivity-gap histogram bins; the last bin is open
+GAP_EDGES_MIN = np.array([1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240], dtype=float)
+# Gaps seen before the gap distribution replaces the default
+MIN_GAPS = 5
+# Share of gaps shorter than max_inactivity_min
+GAP_QUANTILE = 0.95
+
+# Upper edges, in km/h, of the moving-speed histogram bins; the last bin is open
+SPEED_EDGES_KMH = np.array([0.5, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 45, 60, 90], dtype=float)
+
+# Most observations a tourist profile counts as when merged into a trip baseline
+PRIOR_OBSERVATIONS = 50
+# Share of a profile's activity an hour needs to count as typical
+TYPICAL_HOUR_SHARE = 0.02
+
+PROFILE_VERSION = 1
+PROFILE_DTYPE = np.dtype(
+    [
+        ("version", "<u2"),
+        ("trips", "<u4"),
+        ("observations", "<u8"),
+        ("speed_count", "<u8"),
+        ("speed_mean", "<f8"),
+        ("speed_m2", "<f8"),
+        ("speed_hist", "<u4", (len(SPEED_EDGES_KMH) + 1,)),
+        ("hours", "<u4", (24,)),
+        ("gaps", "<u4", (len(GAP_EDGES_MIN) + 1,)),
+        ("updated_at", "<f8"),
+    ]
+)
+
+
+class RunningStats:
+    """Welford mean and variance.
+
+    ``remove`` reverses an ``add`` (for sliding windows) and ``merge``
+    combines two accumulators (Chan et al.).
+    """
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0) -> None:
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def remove(self, value: float) -> None:
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        mean = (self.mean * self.count - value) / (self.count - 1)
+        self.m2 -= (value - self.mean) * (value - mean)
+        self.mean = mean
+        self.count -= 1
+
+    def merge(self, other: "RunningStats") -> None:
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(max(self.variance, 0.0))
+
+
+def histogram_quantile(counts: np.ndarray, edges: np.ndarray, q: float) -> float:
+    """Quantile ``q`` of a histogram, as the upper edge of the bin holding it.
+
+    ``counts`` has one bin more than ``edges``: values above the last edge,
+    reported as that edge.
+    """
+    index = int(np.searchsorted(np.cumsum(counts), q * counts.sum()))
+    return float(edges[min(index, len(edges) - 1)])
+
+
+class TouristProfile:
+    """Baseline sketches of a tourist, summed over their closed trips."""
+
+    __slots__ = ("trips", "observations", "speed_kmh", "speed_hist", "hours", "gaps", "updated_at")
+
+    def __init__(self) -> None:
+        self.trips = 0
+        self.observations = 0
+        self.speed_kmh = RunningStats()
+        self.speed_hist = np.zeros(len(SPEED_EDGES_KMH) + 1, dtype=np.int64)
+        self.hours = np.zeros(24, dtype=np.int64)
+        self.gaps = np.zeros(len(GAP_EDGES_MIN) + 1, dtype=np.int64)
+        self.updated_at: Optional[float] = None
+
+    def absorb(self, trip: "TripBaseline") -> None:
+        """Add a finished trip's own accumulators (not its prior)."""
+        self.trips += 1
+        self.observations += trip.observations
+        self.speed_kmh.merge(trip.speed_kmh)
+        self.speed_hist += trip.speed_hist
+        self.hours += trip.hours
+        self.gaps += trip.gaps
+        if trip.updated_at is not None:
+            self.updated_at = epoch_seconds(trip.updated_at)
+
+    def to_bytes(self) -> bytes:
+        record = np.zeros((), dtype=PROFILE_DTYPE)
+        record["version"] = PROFILE_VERSION
+        record["trips"] = self.trips
+        record["observations"] = self.observations
+        record["speed_count"] = self.speed_kmh.count
+        record["speed_mean"] = self.speed_kmh.mean
+        record["speed_m2"] = self.speed_kmh.m2
+        record["speed_hist"] = self.speed_hist
+        record["hours"] = self.hours
+        record["gaps"] = self.gaps
+        record["updated_at"] = self.updated_at if self.updated_at is not None else np.nan
+        return record.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TouristProfile":
+        """Decode ``to_bytes`` output.
+
+        Raises:
+            ValueError: The data is not a profile of this version
+        """
+        if len(data) != PROFILE_DTYPE.itemsize:
+            raise ValueError(f"Expected {PROFILE_DTYPE.itemsize} bytes, got {len(data)}")
+        record = np.frombuffer(data, dtype=PROFILE_DTYPE)[0]
+        if record["version"] != PROFILE_VERSION:
+            raise ValueError(f"Unsupported profile version {record['version']}")
+        profile = cls()
+        profile.trips = int(record["trips"])
+        profile.observations = int(record["observations"])
+        profile.speed_kmh = RunningStats(
+            int(record["speed_count"]), float(record["speed_mean"]), float(record["speed_m2"])
+        )
+        profile.speed_hist = record["speed_hist"].astype(np.int64)
+        profile.hours = record["hours"].astype(np.int64)
+        profile.gaps = record["gaps"].astype(np.int64)
+        updated_at = float(record["updated_at"])
+        profile.updated_at = None if math.isnan(updated_at) else updated_at
+        return profile
+
+
+class TripBaseline:
+    """Running baseline of one trip, optionally on top of its tourist's profile."""
+
+    __slots__ = (
+        "speed_kmh",
+        "speed_hist",
+        "hours",
+        "gaps",
+        "observations",
+        "last_moving",
+        "prior",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(self, prior: Optional[TouristProfile] = None) -> None:
+        self.speed_kmh = RunningStats()
+        self.speed_hist = np.zeros(len(SPEED_EDGES_KMH) + 1, dtype=np.int64)
+        self.hours = np.zeros(24, dtype=np.int64)
+        self.gaps = np.zeros(len(GAP_EDGES_MIN) + 1, dtype=np.int64)
+        self.observations = 0
+        self.last_moving: Optional[float] = None
+        self.prior = prior if prior is not None and prior.observations else None
+        self.created_at = datetime.now()
+        self.updated_at: Optional[datetime] = None
+
+    def add(self, obs: Observation) -> None:
+        self.observations += 1
+        self.hours[obs.timestamp.hour] += 1
+        if obs.speed_mps > 0:
+            speed_kmh = obs.speed_mps * 3.6
+            self.speed_kmh.add(speed_kmh)
+            self.speed_hist[bisect_left(SPEED_EDGES_KMH, speed_kmh)] += 1
+        if obs.speed_mps > MOVING_SPEED_MPS:
+            now = epoch_seconds(obs.timestamp)
+            if self.last_moving is not None and now > self.last_moving:
+                gap_min = (now - self.last_moving) / 60.0
+                if gap_min >= GAP_EDGES_MIN[0]:
+                    self.gaps[bisect_left(GAP_EDGES_MIN, gap_min)] += 1
+            self.last_moving = now
+        self.updated_at = obs.timestamp
+
+    @property
+    def prior_weight(self) -> float:
+        """Scale applied to the prior's counts."""
+        if self.prior is None:
+            return 0.0
+        return min(1.0, PRIOR_OBSERVATIONS / self.prior.observations)
+
+    def _merged_speed(self) -> RunningStats:
+        merged = RunningStats(self.speed_kmh.count, self.speed_kmh.mean, self.speed_kmh.m2)
+        if self.prior is not None:
+            w = self.prior_weight
+            prior = self.prior.speed_kmh
+            merged.merge(RunningStats(prior.count * w, prior.mean, prior.m2 * w))  # type: ignore[arg-type]
+        return merged
+
+    def _merged(self, name: str) -> np.ndarray:
+        counts = getattr(self, name).astype(float)
+        if self.prior is not None:
+            counts += self.prior_weight * getattr(self.prior, name)
+        return counts
+
+    @property
+    def avg_speed_kmh(self) -> float:
+        speed = self._merged_speed()
+        return speed.mean if speed.count else DEFAULT_SPEED_KMH
+
+    def speed_quantile_kmh(self, q: float) -> Optional[float]:
+        counts = self._merged("speed_hist")
+        return histogram_quantile(counts, SPEED_EDGES_KMH, q) if counts.sum() else None
+
+    @property
+    def typical_hours(self) -> List[int]:
+        typical = self.hours > 0
+        if self.prior is not None:
+            typical |= self.prior.hours >= TYPICAL_HOUR_SHARE * self.prior.hours.sum()
+        if not typical.any():
+            return list(DEFAULT_HOURS)
+        return np.flatnonzero(typical).tolist()
+
+    @property
+    def max_inactivity_min(self) -> float:
+        gaps = self._merged("gaps")
+        if gaps.sum() < MIN_GAPS:
+            return DEFAULT_MAX_INACTIVITY_MIN
+        return histogram_quantile(gaps, GAP_EDGES_MIN, GAP_QUANTILE)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "avg_speed_kmh": self.avg_speed_kmh,
+            "speed_std_kmh": self._merged_speed().std,
+            "speed_p90_kmh": self.speed_quantile_kmh(0.9),
+            "typical_hours": self.typical_hours,
+            "max_inactivity_min": self.max_inactivity_min,
+            "observations": self.observations,
+            "profile_trips": self.prior.trips if self.prior is not None else 0,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
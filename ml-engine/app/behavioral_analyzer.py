@@ -8,13 +8,16 @@ assess distress probability, and support investigation.
 from __future__ import annotations
 
 import logging
-from datetime import datetime, timedelta
+from datetime import timedelta
 from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
 
-import numpy as np
 from haversine import haversine, Unit
 
+from .baselines import TouristProfile, TripBaseline
+from .profiles import ProfileStore
+from .heartbeat import epoch_seconds
+from .movement import MovementWindow
 from .schemas import Observation
 from .config import get_settings
 
@@ -25,9 +28,19 @@ settings = get_settings()
 class BehavioralAnalyzer:
     """Analyzes tourist behavior patterns for anomaly detection."""
     
-    def __init__(self):
-        # Store behavioral baselines per tourist
-        self._baselines: Dict[str, Dict] = {}
+    def __init__(
+        self,
+        movement_window: Optional[int] = None,
+        profiles: Optional[ProfileStore] = None,
+    ):
+        # Running behavioral baselines per trip, updated by add_observation
+        self._baselines: Dict[str, TripBaseline] = {}
+        # Cross-trip tourist profiles: a new trip's baseline starts from its
+        # tourist's profile, and closed trips are folded back into it
+        self.profiles = profiles
+        # Sliding movement metrics per trip, updated by add_observation
+        self._movement: Dict[str, MovementWindow] = {}
+        self.movement_window = movement_window or settings.movement_window_points
         # Store recent observation history
         self._history: Dict[str, List[Observation]] = defaultdict(list)
         # Maximum history to keep (24 hours of observations)
@@ -39,6 +52,16 @@ class BehavioralAnalyzer:
         
         # Add to history
         self._history[key].append(obs)
+
+        baseline = self._baselines.get(key)
+        if baseline is None:
+            baseline = self._baselines[key] = TripBaseline(self._profile(obs.tourist_id))
+        baseline.add(obs)
+
+        window = self._movement.get(key)
+        if window is None:
+            window = self._movement[key] = MovementWindow(self.movement_window)
+        window.add(epoch_seconds(obs.timestamp), obs.lat, obs.lng)
         
         # Prune old observations (keep last 24 hours)
         cutoff = obs.timestamp - timedelta(hours=self._max_history_hours)
@@ -116,8 +139,8 @@ class BehavioralAnalyzer:
                     'message': f'Location jumped {distance_m:.0f}m in {time_diff:.0f}s (impossible speed: {speed_kmh:.0f} km/h)'
                 }
         
-        # Check 3: Signal loss (implemented at storage level)
-        # This would be detected by lack of observations
+        # Check 3: Signal loss is detected by the lack of observations, so it
+        # is raised by the engine's heartbeat monitor rather than here
         
         return None
     
@@ -129,54 +152,19 @@ class BehavioralAnalyzer:
         """
         Analyze movement patterns for anomalies.
         
-        Detects: erratic movement, unusual speeds, backtracking, circling
+        Detects: erratic movement, unusual speeds, backtracking, circling.
+        Works on the trip's sliding window of its last ``movement_window``
+        fixes (within 2 hours), kept up to date by ``add_observation``, so
+        ``obs`` must already have been added; ``history`` is not needed.
         """
-        if history is None:
-            history = self.get_observation_history(obs.tourist_id, obs.trip_id, hours=2)
-        
-        if len(history) < 5:
-            return None  # Need at least 5 points for pattern analysis
-        
-        recent = history[-5:]  # Last 5 observations
-        
-        # Calculate movement metrics
-        speeds = []
-        directions = []
-        distances = []
-        
-        for i in range(1, len(recent)):
-            prev = recent[i-1]
-            curr = recent[i]
-            
-            time_diff = (curr.timestamp - prev.timestamp).total_seconds()
-            if time_diff > 0:
-                dist_km = haversine(
-                    (prev.lat, prev.lng),
-                    (curr.lat, curr.lng),
-                    unit=Unit.KILOMETERS
-                )
-                speed_kmh = (dist_km / time_diff) * 3600
-                speeds.append(speed_kmh)
-                distances.append(dist_km * 1000)  # meters
-                
-                # Calculate direction change
-                if i > 1:
-                    # Simple direction estimate based on lat/lng changes
-                    dx1 = recent[i-1].lng - recent[i-2].lng
-                    dy1 = recent[i-1].lat - recent[i-2].lat
-                    dx2 = curr.lng - prev.lng
-                    dy2 = curr.lat - prev.lat
-                    
-                    # Angle between vectors (simplified)
-                    if dx1 != 0 or dy1 != 0:
-                        directions.append((dx2 - dx1, dy2 - dy1))
-        
-        if not speeds:
-            return None
+        window = self._movement.get(f"{obs.tourist_id}::{obs.trip_id}")
+        metrics = window.metrics() if window is not None else None
+        if metrics is None:
+            return None  # Need a full window of points for pattern analysis
         
         # Anomaly 1: Erratic speed changes
-        speed_variance = np.var(speeds) if len(speeds) > 1 else 0
-        avg_speed = np.mean(speeds)
+        speed_variance = metrics.speed_variance
+        avg_speed = metrics.avg_speed_kmh
         
         if speed_variance > 100 and avg_speed > 5:  # High variance, not stationary
             return {
@@ -188,7 +176,7 @@ class BehavioralAnalyzer:
             }
         
         # Anomaly 2: Unusually high speed
-        max_speed = max(speeds)
+        max_speed = metrics.max_speed_kmh
         if max_speed > 60:  # Unrealistic for tourist on foot/vehicle in these areas
             return {
                 'type': 'high_speed',
@@ -198,12 +186,8 @@ class BehavioralAnalyzer:
             }
         
         # Anomaly 3: Backtracking pattern
-        total_distance = sum(distances)
-        straight_line_dist = haversine(
-            (recent[0].lat, recent[0].lng),
-            (recent[-1].lat, recent[-1].lng),
-            unit=Unit.METERS
-        )
+        total_distance = metrics.total_distance_m
+        straight_line_dist = metrics.straight_line_m
         
         if total_distance > 0:
             efficiency = straight_line_dist / total_distance
@@ -259,6 +243,10 @@ class BehavioralAnalyzer:
                 signals.append("Prolonged inactivity detected")
                 score += 20
             
+            if 'signal_loss' in alert_types:
+                signals.append("Location updates stopped")
+                score += 20
+            
             if 'location_jump' in alert_types or 'accuracy_degradation' in alert_types:
                 signals.append("GPS signal issues")
                 score += 10
@@ -302,42 +290,29 @@ class BehavioralAnalyzer:
         return (min(score, 100), risk_level, signals)
     
     def get_behavioral_baseline(self, tourist_id: str, trip_id: str) -> Dict:
-        """Get or create behavioral baseline for a tourist."""
+        """Current behavioral baseline of a trip (defaults before its first observation).
+
+        Baselines are kept up to date by ``add_observation``, so this is a
+        constant-time read.
+        """
+        baseline = self._baselines.get(f"{tourist_id}::{trip_id}")
+        return (baseline or TripBaseline(self._profile(tourist_id))).as_dict()
+    
+    def _profile(self, tourist_id: str) -> Optional[TouristProfile]:
+        return self.profiles.get(tourist_id) if self.profiles is not None else None
+    
+    def forget(self, tourist_id: str, trip_id: str) -> List[Observation]:
+        """Drop a trip's history and baseline; returns the dropped history.
+
+        The baseline is first folded into the tourist's profile, if profiles
+        are kept.
+        """
         key = f"{tourist_id}::{trip_id}"
-        
-        if key in self._baselines:
-            return self._baselines[key]
-        
-        # Create new baseline from history
-        history = self.get_observation_history(tourist_id, trip_id, hours=24)
-        
-        if not history:
-            # Default baseline
-            baseline = {
-                'avg_speed_kmh': 4.0,
-                'typical_hours': list(range(8, 22)),  # 8 AM - 10 PM
-                'max_inactivity_min': 30,
-                'created_at': datetime.now()
-            }
-        else:
-            # Calculate from history
-            speeds = []
-            hours = set()
-            
-            for obs in history:
-                if obs.speed_mps > 0:
-                    speeds.append(obs.speed_mps * 3.6)  # Convert to km/h
-                hours.add(obs.timestamp.hour)
-            
-            baseline = {
-                'avg_speed_kmh': np.mean(speeds) if speeds else 4.0,
-                'typical_hours': sorted(hours),
-                'max_inactivity_min': 30,
-                'created_at': datetime.now()
-            }
-        
-        self._baselines[key] = baseline
-        return baseline
+        baseline = self._baselines.pop(key, None)
+        if baseline is not None and baseline.observations and self.profiles is not None:
+            self.profiles.absorb(tourist_id, baseline)
+        self._movement.pop(key, None)
+        return self._history.pop(key, [])
 
 
 # Singleton instance
@@ -348,5 +323,7 @@ def get_behavioral_analyzer() -> BehavioralAnalyzer:
     """Get or create behavioral analyzer singleton."""
     global _analyzer
     if _analyzer is None:
-        _analyzer = BehavioralAnalyzer()
+        _analyzer = BehavioralAnalyzer(
+            profiles=ProfileStore(settings.profile_dir, settings.profile_cache_size)
+        )
     return _analyzer
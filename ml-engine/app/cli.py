@@ -0,0 +1,299 @@
+"""Command-line entry point for offline ML Engine jobs.
+
+Run from the ``ml-engine`` directory::
+
+    python -m app.cli zones compile [--src data/danger_zones.geojson] [--out data/danger_zones.zpk]
+    python -m app.cli raster build [--cell-m 100]
+    python -m app.cli density build [--cell-m 250] [--bandwidth-m 500]
+    python -m app.cli dataset migrate [--src data/historical_observations.csv] [--out data/observations]
+    python -m app.cli export observations --format csv [--from ...] [--to ...]
+        [--trip-id ID ...] [--bbox min_lng,min_lat,max_lng,max_lat] [--out FILE]
+    python -m app.cli replay [--set route_deviation_threshold_m=80 ...] [--model FILE]
+        [--from ...] [--to ...] [--trip-id ID ...] [--workers N] [--json FILE]
+    python -m app.cli model sweep [--metric average_precision] [--folds 4] [--workers N]
+        [--from ...] [--to ...] [--out FILE | --promote] [--json FILE]
+"""
+from __future__ import annotations
+
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+from .config import get_settings
+
+
+settings = get_settings()
+
+
+def _zones_compile(args: argparse.Namespace) -> None:
+    from .zone_pack import compile_zone_pack
+
+    header = compile_zone_pack(args.src, args.out)
+    print(
+        f"Zone-pack {header['count']} zones, {sum(header['level_sizes'])} index nodes, "
+        f"fingerprint={header['fingerprint'][:12]} -> {args.out}"
+    )
+
+
+def _raster_build(args: argparse.Namespace) -> None:
+    from .detection import engine
+    from .risk_raster import build_risk_raster
+    from .storage import store
+
+    raster = build_risk_raster(
+        engine._danger_polygons,
+        store.load_alerts_dataframe(),
+        args.out,
+        cell_size_m=args.cell_m,
+        incident_weight=args.incident_weight,
+        schedules=engine.zone_schedules,
+        fingerprint=engine.zones_fingerprint,
+    )
+    print(
+        f"Risk raster {raster.grid.rows}x{raster.grid.cols} cells, bands={list(raster.bands)}, "
+        f"zones={raster.meta['zones']}, alerts={raster.meta['alerts']} -> {args.out}"
+    )
+
+
+def _density_build(args: argparse.Namespace) -> None:
+    from .incident_density import LABEL_WEIGHTS, build_density_surface, incident_events
+    from .storage import store
+
+    observations = store.load_dataframe(columns=["lat", "lng", *LABEL_WEIGHTS])
+    events = incident_events(store.load_alerts_dataframe(), observations)
+    surface = build_density_surface(
+        events, args.out, cell_size_m=args.cell_m, bandwidth_m=args.bandwidth_m
+    )
+    print(
+        f"Incident density {surface.version}: {surface.grid.rows}x{surface.grid.cols} cells "
+        f"from {surface.meta['events']} events -> {args.out}"
+    )
+
+
+def _export(args: argparse.Namespace) -> None:
+    import contextlib
+    import sys
+
+    from .export import EXTENSIONS, ExportFilter, export_stream, parse_bbox
+
+    flt = ExportFilter(
+        start=args.start,
+        end=args.end,
+        trip_ids=frozenset(args.trip_id) if args.trip_id else None,
+        bbox=parse_bbox(args.bbox) if args.bbox else None,
+    )
+    from .storage import store
+
+    source = store.history_source() if args.dataset == "observations" else settings.alerts_dataset
+    out = args.out or Path(f"{args.dataset}.{EXTENSIONS[args.format]}")
+    written = 0
+    to_stdout = str(out) == "-"
+    with (contextlib.nullcontext(sys.stdout.buffer) if to_stdout else out.open("wb")) as f:
+        for data in export_stream(source, args.format, flt, args.chunk_rows):
+            f.write(data)
+            written += len(data)
+    if not to_stdout:
+        print(f"Exported {args.dataset} ({written / 1e6:.1f} MB) -> {out}")
+
+
+def _dataset_migrate(args: argparse.Namespace) -> None:
+    import time
+
+    from .observation_dataset import ObservationDataset, migrate_csv
+
+    dataset = ObservationDataset(
+        args.out,
+        region_cell_deg=settings.observations_region_cell_deg,
+        row_group_rows=settings.observations_row_group_rows,
+    )
+    if dataset.migrated() and not args.append:
+        raise SystemExit(f"{args.out} already holds a migrated CSV; pass --append to copy again")
+    start = time.perf_counter()
+    total = sum(migrate_csv(args.src, dataset, args.chunk_rows))
+    print(f"Migrated {total:,} rows from {args.src} -> {args.out} in {time.perf_counter() - start:.1f} s")
+
+
+def _replay(args: argparse.Namespace) -> None:
+    import json
+
+    from pydantic import ValidationError
+
+    from .replay import run_replay
+
+    overrides = {}
+    for item in args.set or []:
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--set expects NAME=VALUE, got {item!r}")
+        overrides[name.strip()] = value.strip()
+    try:
+        report = run_replay(
+            overrides,
+            model_path=args.model,
+            start=args.start,
+            end=args.end,
+            trip_ids=args.trip_id,
+            workers=args.workers,
+            tolerance_minutes=args.tolerance_minutes,
+        )
+    except ValidationError as exc:
+        raise SystemExit(f"Invalid --set: {exc}")
+
+    rate = report.observations / report.seconds if report.seconds else 0.0
+    print(
+        f"Replayed {report.observations:,} observations of {report.trips:,} trips "
+        f"in {report.seconds:.1f} s ({rate:,.0f}/s); {report.skipped_rows:,} invalid rows skipped"
+    )
+    print("Alerts:")
+    for alert_type, count in sorted(report.alerts.items()):
+        print(f"  {alert_type:24}{count:10,}")
+    if report.labels:
+        print(f"{'':24}{'episodes':>10}{'detected':>10}{'recall':>8}{'alerts':>10}{'precision':>10}")
+        for name, score in sorted(report.labels.items()):
+            recall = f"{score.recall:.2f}" if score.recall is not None else "-"
+            precision = f"{score.precision:.2f}" if score.precision is not None else "-"
+            print(
+                f"{name:24}{score.episodes:10,}{score.detected:10,}{recall:>8}"
+                f"{score.alerts:10,}{precision:>10}"
+            )
+    if args.json:
+        args.json.write_text(json.dumps(report.as_dict(), indent=2))
+
+
+def _model_sweep(args: argparse.Namespace) -> None:
+    import json
+    import time
+
+    from .model_selection import METRICS, fit_and_save, load_history, sweep_frame, sweep_frame_columns
+    from .training import LABEL_COLUMNS
+
+    if args.metric not in METRICS:
+        raise SystemExit(f"--metric must be one of {', '.join(METRICS)}")
+    feature_sets = settings.training_feature_sets
+    frame = load_history(
+        sweep_frame_columns(feature_sets), args.start, args.end, settings.training_sweep_max_rows
+    )
+    labels = [c for c in LABEL_COLUMNS if c in frame.columns]
+    if not labels:
+        raise SystemExit(f"No label columns ({', '.join(LABEL_COLUMNS)}) in the historical data")
+    if len(frame.index) < (args.folds + 1) * 10:
+        raise SystemExit(f"Only {len(frame.index):,} historical rows; too few to sweep")
+
+    began = time.perf_counter()
+    results = sweep_frame(
+        frame, settings.training_sweep_grid, feature_sets, folds=args.folds, workers=args.workers
+    )
+    elapsed = time.perf_counter() - began
+    print(f"Evaluated {len(results)} candidates on {len(frame.index):,} rows in {elapsed:.1f} s")
+    print(f"{'':56}{args.metric[:12]:>12}{'fit s':>8}{'us/row':>8}{'1-row ms':>9}{'KB':>7}")
+    for result in sorted(
+        results, key=lambda r: r.metrics.get(args.metric) or float("-inf"), reverse=True
+    ):
+        value = result.metrics.get(args.metric)
+        shown = f"{value:.4f}" if value is not None else "-"
+        print(
+            f"{result.candidate.name[:56]:56}{shown:>12}{result.fit_seconds:8.2f}"
+            f"{result.batch_us_per_row:8.2f}{result.single_row_ms:9.2f}{result.model_bytes / 1e3:7.0f}"
+        )
+
+    if args.promote:
+        out = settings.model_dir / settings.model_filename
+    else:
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        out = args.out or settings.model_dir / "candidates" / f"iforest-{stamp}.joblib"
+    from .storage import store
+
+    history = store.history_source()
+    source = str(getattr(history, "root", history))
+    best, metadata = fit_and_save(frame, results, args.metric, args.folds, out, source=source)
+    print(f"Selected {best.candidate.name} -> {out}")
+    if args.json:
+        args.json.write_text(json.dumps(metadata, indent=2))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="TourGuard ML Engine jobs")
+    groups = parser.add_subparsers(dest="group", required=True)
+
+    zones = groups.add_parser("zones", help="Danger-zone registry")
+    zones_cmds = zones.add_subparsers(dest="command", required=True)
+    compile_cmd = zones_cmds.add_parser("compile", help="Compile GeoJSON zones into a zone-pack")
+    compile_cmd.add_argument("--src", type=Path, default=settings.danger_zones_path)
+    compile_cmd.add_argument("--out", type=Path, default=settings.zone_pack_path)
+    compile_cmd.set_defaults(func=_zones_compile)
+
+    raster = groups.add_parser("raster", help="Precomputed risk raster")
+    raster_cmds = raster.add_subparsers(dest="command", required=True)
+    build = raster_cmds.add_parser("build", help="Rasterize danger zones and alert density")
+    build.add_argument("--out", type=Path, default=settings.risk_raster_dir)
+    build.add_argument("--cell-m", type=float, default=settings.risk_raster_cell_m)
+    build.add_argument(
+        "--incident-weight", type=float, default=settings.risk_raster_incident_weight
+    )
+    build.set_defaults(func=_raster_build)
+
+    density = groups.add_parser("density", help="Historical incident density surface")
+    density_cmds = density.add_subparsers(dest="command", required=True)
+    build = density_cmds.add_parser("build", help="KDE over alerts and labelled observations")
+    build.add_argument("--out", type=Path, default=settings.incident_density_dir)
+    build.add_argument("--cell-m", type=float, default=settings.incident_density_cell_m)
+    build.add_argument("--bandwidth-m", type=float, default=settings.incident_density_bandwidth_m)
+    build.set_defaults(func=_density_build)
+
+    dataset = groups.add_parser("dataset", help="Historical observation dataset")
+    dataset_cmds = dataset.add_subparsers(dest="command", required=True)
+    migrate = dataset_cmds.add_parser("migrate", help="Copy the legacy CSV into the Parquet dataset")
+    migrate.add_argument("--src", type=Path, default=settings.historical_dataset)
+    migrate.add_argument("--out", type=Path, default=settings.observations_dataset_dir)
+    migrate.add_argument("--chunk-rows", type=int, default=1_000_000)
+    migrate.add_argument("--append", action="store_true", help="Copy even if a CSV was already migrated")
+    migrate.set_defaults(func=_dataset_migrate)
+
+    export = groups.add_parser("export", help="Stream observations or alerts to a file")
+    export.add_argument("dataset", choices=["observations", "alerts"])
+    export.add_argument("--format", choices=["csv", "geojsonseq", "parquet"], default="csv")
+    export.add_argument("--from", dest="start", type=datetime.fromisoformat)
+    export.add_argument("--to", dest="end", type=datetime.fromisoformat)
+    export.add_argument("--trip-id", action="append", help="Repeat for several trips")
+    export.add_argument("--bbox", help="min_lng,min_lat,max_lng,max_lat")
+    export.add_argument("--out", type=Path, help="Output file, or - for stdout")
+    export.add_argument("--chunk-rows", type=int, default=settings.export_chunk_rows)
+    export.set_defaults(func=_export)
+
+    replay = groups.add_parser("replay", help="Backtest detection rules on historical data")
+    replay.add_argument("--set", action="append", metavar="NAME=VALUE", help="Override a setting")
+    replay.add_argument("--model", type=Path, help="Joblib anomaly model to evaluate")
+    replay.add_argument("--from", dest="start", type=datetime.fromisoformat)
+    replay.add_argument("--to", dest="end", type=datetime.fromisoformat)
+    replay.add_argument("--trip-id", action="append", help="Repeat for several trips")
+    replay.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    replay.add_argument("--tolerance-minutes", type=float, default=5.0)
+    replay.add_argument("--json", type=Path, help="Also write the report as JSON")
+    replay.set_defaults(func=_replay)
+
+    model = groups.add_parser("model", help="Anomaly model")
+    model_cmds = model.add_subparsers(dest="command", required=True)
+    sweep = model_cmds.add_parser(
+        "sweep", help="Cross-validate hyperparameters and feature sets, save the best model"
+    )
+    sweep.add_argument("--metric", default=settings.training_sweep_metric)
+    sweep.add_argument("--folds", type=int, default=settings.training_cv_folds)
+    sweep.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    sweep.add_argument("--from", dest="start", type=datetime.fromisoformat)
+    sweep.add_argument("--to", dest="end", type=datetime.fromisoformat)
+    target = sweep.add_mutually_exclusive_group()
+    target.add_argument("--out", type=Path, help="Where to save the selected model")
+    target.add_argument("--promote", action="store_true", help="Replace the live model")
+    sweep.add_argument("--json", type=Path, help="Also write the model metadata as JSON")
+    sweep.set_defaults(func=_model_sweep)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
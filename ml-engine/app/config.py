@@ -1,6 +1,6 @@
 from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Union
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -16,14 +16,119 @@ class Settings(BaseSettings):
     model_dir: Path = Field(default=BASE_DIR / "models")
     historical_dataset: Path = Field(
         default=BASE_DIR / "data" / "historical_observations.csv"
-    )
+    )  # legacy CSV, read until migrated into observations_dataset_dir
+    observations_dataset_dir: Path = Field(default=BASE_DIR / "data" / "observations")
+    observations_region_cell_deg: float = Field(default=1.0)  # region partition size
+    observations_row_group_rows: int = Field(default=128_000)
+    observations_flush_rows: int = Field(default=10_000)  # live rows buffered per write
+    observations_flush_seconds: float = Field(default=30.0)  # longest a live row stays buffered
     danger_zones_path: Path = Field(default=BASE_DIR / "data" / "danger_zones.geojson")
+    zone_pack_path: Path = Field(default=BASE_DIR / "data" / "danger_zones.zpk")
+    alerts_dataset: Path = Field(default=BASE_DIR / "data" / "alerts.csv")
+    risk_raster_dir: Path = Field(default=BASE_DIR / "data" / "risk_raster")
+    incident_density_dir: Path = Field(default=BASE_DIR / "data" / "incident_density")
 
     route_deviation_threshold_m: float = Field(default=120.0)
     inactivity_threshold_minutes: int = Field(default=15)
+    movement_window_points: int = Field(default=5)  # fixes in the movement-pattern window
+    profile_dir: Path = Field(default=BASE_DIR / "data" / "profiles")
+    profile_cache_size: int = Field(default=1024)  # tourist profiles kept in memory
+    signal_loss_minutes: int = Field(default=10)
+    heartbeat_tick_seconds: float = Field(default=1.0)
     alert_buffer_minutes: int = Field(default=5)
 
+    # Route score cache
+    route_cache_max_entries: int = Field(default=2048)
+    route_cache_ttl_seconds: float = Field(default=900.0)
+    route_cache_precision: int = Field(default=5)  # decimal places (~1 m)
+
+    # Exposure-weighted zone penalties (points per metre inside a zone, capped per zone)
+    exposure_risk_per_m: Dict[str, float] = Field(
+        default_factory=lambda: {"high": 0.15, "medium": 0.10, "low": 0.05}
+    )
+    exposure_max_penalty: Dict[str, float] = Field(
+        default_factory=lambda: {"high": 45.0, "medium": 30.0, "low": 15.0}
+    )
+    exposure_cache_max_pairs: int = Field(default=100_000)
+
+    # Precomputed risk raster
+    risk_raster_cell_m: float = Field(default=100.0)
+    risk_raster_incident_weight: float = Field(default=0.5)
+
+    # Region-partitioned zone tiles
+    zone_tile_zoom: int = Field(default=12)  # ~9 km tiles at Meghalaya's latitude
+    zone_tile_cache_size: int = Field(default=256)  # loaded tiles kept before LRU eviction
+
+    # Admin-panel heatmap tiles
+    heatmap_zooms: List[int] = Field(default_factory=lambda: [8, 11, 14])
+    heatmap_tile_bins: int = Field(default=32)  # cells per tile edge, power of two
+
+    # Bulk export
+    export_chunk_rows: int = Field(default=50_000)
+
+    # Stateless bulk geofence checks
+    geofence_check_max_points: int = Field(default=100_000)
+
+    # Trip lifecycle: idle trips are evicted from memory and archived
+    trip_idle_ttl_minutes: float = Field(default=360.0)
+    trip_sweep_interval_seconds: float = Field(default=60.0)
+    trip_archive_dir: Path = Field(default=BASE_DIR / "data" / "trip_archive")
+    trip_archive_cache_size: int = Field(default=32)  # rehydrated archives kept in memory
+
+    # Warm-tier trajectory segments (per trip, time-partitioned)
+    trajectory_dir: Path = Field(default=BASE_DIR / "data" / "trajectories")
+    trajectory_segment_points: int = Field(default=512)
+    trajectory_segment_minutes: float = Field(default=60.0)
+    trajectory_lod_pixel_tolerance: float = Field(default=1.0)  # simplification error, in pixels
+    trajectory_max_points: int = Field(default=2000)  # per /trips/{id}/trajectory response
+
+    # Live tourist position index
+    tourist_index_cell_m: float = Field(default=250.0)
+    tourists_nearby_radius_m: float = Field(default=1000.0)
+
+    # Zone proximity
+    proximity_radii_m: List[float] = Field(default_factory=lambda: [200.0, 500.0, 1000.0])
+    zone_approach_radius_m: float = Field(default=200.0)
+    advisory_nearby_radius_m: float = Field(default=1000.0)
+
+    # Historical incident density surface
+    incident_density_cell_m: float = Field(default=250.0)
+    incident_density_bandwidth_m: float = Field(default=500.0)
+    incident_max_penalty: float = Field(default=20.0)  # points at peak density
+
     model_filename: str = Field(default="anomaly_iforest.joblib")
+    training_window_days: Optional[int] = Field(default=None)  # None trains on all history
+    trip_feature_window: int = Field(default=10)  # fixes per trip in rolling features
+
+    # Hyperparameter sweep (python -m app.cli model sweep)
+    training_sweep_grid: Dict[str, List[Union[int, float, str]]] = Field(
+        default_factory=lambda: {
+            "n_estimators": [100, 200, 400],
+            "max_samples": ["auto", 1024],
+            "contamination": [0.02, 0.05, 0.1],
+        }
+    )
+    training_feature_sets: Dict[str, List[str]] = Field(
+        default_factory=lambda: {
+            "core": ["speed_mps", "accuracy_m", "battery_pct"],
+            "motion": ["speed_mps", "accuracy_m"],
+            "core_hour": ["speed_mps", "accuracy_m", "battery_pct", "hour_sin", "hour_cos"],
+            "core_trip": [
+                "speed_mps", "accuracy_m", "battery_pct", "gap_s", "speed_delta_mps",
+                "heading_change_deg", "turn_mean_deg", "speed_std_mps",
+                "battery_drain_pct_h", "route_distance_m",
+            ],
+        }
+    )
+    training_sweep_metric: str = Field(default="average_precision")
+    training_cv_folds: int = Field(default=4)
+    training_sweep_max_rows: int = Field(default=1_000_000)  # most recent rows swept
+
+    # Shadow scoring of candidate anomaly models on sampled live traffic
+    shadow_model_paths: List[Path] = Field(default_factory=list)
+    shadow_sample_rate: float = Field(default=0.1)
+    shadow_queue_size: int = Field(default=10_000)  # samples dropped beyond this backlog
+    shadow_batch_size: int = Field(default=256)
     random_state: Optional[int] = Field(default=42)
 
     # LLM Configuration
@@ -1,82 +1,159 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
+import time
+from datetime import timedelta
+from typing import Callable, List, Optional, Sequence
 
-from haversine import Unit, haversine
-from shapely import geometry
-from shapely.geometry import Point, shape
 import joblib
 import numpy as np
 
-from .config import get_settings
-from .schemas import AlertPayload, GeofenceStatus, Observation, RoutePlan
-from .storage import store
-from .training import ModelBundle, load_or_train_model
+from .behavioral_analyzer import BehavioralAnalyzer, get_behavioral_analyzer
+from .config import Settings, get_settings
+from .heartbeat import SIGNAL_LOSS, HeartbeatMonitor
+from .incident_density import IncidentDensitySurface
+from .proximity import ZoneProximityIndex
+from .risk_raster import NO_ZONE, RiskRaster, ZoneRecord, load_risk_raster
+from .schemas import AlertPayload, GeofenceStatus, Observation
+from .shadow import ShadowScorer
+from .storage import ObservationStore
+from .storage import store as _shared_store
+from .training import ANOMALY_THRESHOLD, ModelBundle, load_or_train_model
+from .trip_features import TripFeatureTracker, min_distance_to_route
+from .zone_pack import ZonePack, open_zone_registry
+from .zone_schedule import ZoneScheduleTable
+from .zone_tiles import ZoneTileIndex
 
 
-settings = get_settings()
+class DetectionEngine:
+    """Per-observation alert checks plus heartbeat deadlines.
+
+    By default the engine works on the service's settings, store, analyzer and
+    model. Passing other ones gives an independent engine, e.g. for offline
+    replay with different thresholds (see ``app/replay.py``); a replacement
+    store only needs ``get_route``, ``update_geofence_status`` and
+    ``record_alert``.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[Settings] = None,
+        store: Optional[ObservationStore] = None,
+        analyzer: Optional[BehavioralAnalyzer] = None,
+        model_bundle: Optional[ModelBundle] = None,
+    ) -> None:
+        self.settings = settings or get_settings()
+        self.store = store if store is not None else _shared_store
+        self._analyzer = analyzer
+        self.model_bundle: ModelBundle = model_bundle or load_or_train_model()
+        self.zone_pack: Optional[ZonePack] = None
+        self.zones_fingerprint = ""
+        self.zone_schedules = ZoneScheduleTable([])
+        self._danger_polygons = self._load_danger_zones()
+        self.zone_tiles = self._build_zone_tiles()
+        self._proximity: Optional[ZoneProximityIndex] = None
+        self.risk_raster: Optional[RiskRaster] = load_risk_raster(
+            self.settings.risk_raster_dir, self.zones_fingerprint
+        )
+        self.incident_surface: Optional[IncidentDensitySurface] = IncidentDensitySurface.load(
+            self.settings.incident_density_dir
+        )
+        self.zones_version = 0
+        self.heartbeats = self.new_heartbeat_monitor(time.time(), clock=time.time)
+        # Rolling per-trip model inputs, updated as each observation is scored
+        self.trip_features = TripFeatureTracker(self.settings.trip_feature_window)
+        # Candidate models scored on sampled live traffic; the service starts it
+        self.shadow: Optional[ShadowScorer] = None
+        if self.settings.shadow_model_paths:
+            self.shadow = ShadowScorer.from_paths(
+                self.settings.shadow_model_paths,
+                sample_rate=self.settings.shadow_sample_rate,
+                queue_size=self.settings.shadow_queue_size,
+                batch_size=self.settings.shadow_batch_size,
+                threshold=ANOMALY_THRESHOLD,
+            )
 
+    @property
+    def analyzer(self) -> BehavioralAnalyzer:
+        return self._analyzer or get_behavioral_analyzer()
+
+    def new_heartbeat_monitor(
+        self, start: float, clock: Optional[Callable[[], float]] = None
+    ) -> HeartbeatMonitor:
+        """A heartbeat monitor with this engine's timeouts, clocked from ``start``.
+
+        ``clock`` gives receive times (the server clock when live); without
+        it observation timestamps are used, as in a replay.
+        """
+        return HeartbeatMonitor(
+            signal_loss_after=timedelta(minutes=self.settings.signal_loss_minutes),
+            inactivity_after=timedelta(minutes=self.settings.inactivity_threshold_minutes),
+            start=start,
+            tick_seconds=self.settings.heartbeat_tick_seconds,
+            clock=clock,
+        )
 
-def distance_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
-    return haversine(a, b, unit=Unit.METERS)
+    def reload_danger_zones(self) -> int:
+        """Re-read danger zones and derived risk layers; bump the registry version."""
+        self._danger_polygons = self._load_danger_zones()
+        self.zone_tiles = self._build_zone_tiles()
+        self._proximity = None
+        self.risk_raster = load_risk_raster(self.settings.risk_raster_dir, self.zones_fingerprint)
+        self.incident_surface = IncidentDensitySurface.load(self.settings.incident_density_dir)
+        self.zones_version += 1
+        return self.zones_version
+
+    def _build_zone_tiles(self) -> ZoneTileIndex:
+        return ZoneTileIndex(
+            self._danger_polygons,
+            self.settings.zone_tile_zoom,
+            self.settings.zone_tile_cache_size,
+            self.zone_schedules,
+        )
 
+    @property
+    def proximity(self) -> ZoneProximityIndex:
+        """Registry-wide proximity index, built on first use.
 
-def min_distance_to_route(obs: Observation, plan: RoutePlan) -> float:
-    observed = (obs.lat, obs.lng)
-    coords = [(p.lat, p.lng) for p in plan.points]
-    if len(coords) < 2:
-        return distance_m(observed, coords[0])
-    return min(distance_m(observed, pt) for pt in coords)
+        It needs every geometry, which a zone-pack only decodes on demand.
+        """
+        if self._proximity is None:
+            self._proximity = ZoneProximityIndex(
+                self._danger_polygons, self.settings.proximity_radii_m
+            )
+        return self._proximity
 
+    def _load_danger_zones(self) -> Sequence[ZoneRecord]:
+        """Open the compiled zone-pack when present and current, else parse the GeoJSON."""
+        zones, properties, self.zone_pack, self.zones_fingerprint = open_zone_registry(
+            self.settings.danger_zones_path, self.settings.zone_pack_path
+        )
+        self.zone_schedules = ZoneScheduleTable(properties)
+        return zones
 
-class DetectionEngine:
-    def __init__(self) -> None:
-        self.model_bundle: ModelBundle = load_or_train_model()
-        self._danger_polygons = self._load_danger_zones()
-        self._last_motion: dict[str, datetime] = {}
-
-    def _load_danger_zones(self) -> List[Tuple[geometry.Polygon, str, str, str]]:
-        danger_features: List[Tuple[geometry.Polygon, str, str, str]] = []
-        path = settings.danger_zones_path
-        if not path.exists():
-            return danger_features
-
-        import json
-
-        with path.open() as f:
-            data = json.load(f)
-            for feature in data.get("features", []):
-                geom = shape(feature["geometry"])
-                props = feature.get("properties", {})
-                danger_features.append(
-                    (
-                        geom,
-                        props.get("name", "Danger Zone"),
-                        props.get("risk_level", "medium"),
-                        props.get("advisory", ""),
-                    )
-                )
-        return danger_features
+    def process_observation(
+        self, obs: Observation, anomaly_score: Optional[float] = None
+    ) -> List[AlertPayload]:
+        """Run every check on one observation; returns the alerts the store accepted.
 
-    def process_observation(self, obs: Observation) -> List[AlertPayload]:
+        ``anomaly_score`` may carry the model's score when the caller has
+        already scored a batch of observations at once.
+        """
         alerts: List[AlertPayload] = []
-        route = store.get_route(obs.tourist_id, obs.trip_id)
+        route = self.store.get_route(obs.tourist_id, obs.trip_id)
         deviation_threshold = (
             route.allowable_deviation_m
             if route and route.allowable_deviation_m is not None
-            else settings.route_deviation_threshold_m
+            else self.settings.route_deviation_threshold_m
         )
 
-        # Import and use behavioral analyzer
-        from .behavioral_analyzer import get_behavioral_analyzer
-        analyzer = get_behavioral_analyzer()
-        
+        analyzer = self.analyzer
+
         # Add observation to behavioral history
         analyzer.add_observation(obs)
         history = analyzer.get_observation_history(obs.tourist_id, obs.trip_id, hours=2)
 
         # Check 1: Route deviation (existing)
+        deviation_m: Optional[float] = None
         if route:
             deviation_m = min_distance_to_route(obs, route)
             if deviation_m > deviation_threshold:
@@ -90,10 +167,9 @@ class DetectionEngine:
                     )
                 )
 
-        # Check 2: Inactivity (existing)
-        inactivity_alert = self._check_inactivity(obs)
-        if inactivity_alert:
-            alerts.append(inactivity_alert)
+        # Check 2: Inactivity and signal loss. The observation only pushes
+        # the trip's deadlines back; expire_heartbeats raises the alerts
+        self.heartbeats.observe(f"{obs.tourist_id}::{obs.trip_id}", obs)
 
         # Check 3: Danger zone (existing)
         danger_alert = self._check_danger_zone(obs)
@@ -101,7 +177,12 @@ class DetectionEngine:
             alerts.append(danger_alert)
 
         # Check 4: Basic anomaly (existing Isolation Forest)
-        anomaly_alert = self._anomaly_score(obs)
+        if anomaly_score is None:
+            anomaly_score = float(self.anomaly_scores([obs], [deviation_m])[0])
+        if self.shadow is not None:
+            trip_features = self.trip_features.latest(obs.tourist_id, obs.trip_id)
+            self.shadow.submit(obs, anomaly_score, trip_features)
+        anomaly_alert = self._anomaly_score(obs, anomaly_score)
         if anomaly_alert:
             alerts.append(anomaly_alert)
 
@@ -134,27 +215,43 @@ class DetectionEngine:
         # Record alerts and return
         dispatched = []
         for alert in alerts:
-            if store.record_alert(alert):
+            if self.store.record_alert(alert):
                 dispatched.append(alert)
         return dispatched
 
-    def _check_inactivity(self, obs: Observation) -> Optional[AlertPayload]:
-        key = f"{obs.tourist_id}::{obs.trip_id}"
-        last_motion = self._last_motion.get(key, obs.timestamp)
-        if obs.speed_mps > 0.4:
-            self._last_motion[key] = obs.timestamp
-            return None
-
-        threshold = timedelta(minutes=settings.inactivity_threshold_minutes)
-        if obs.timestamp - last_motion > threshold:
-            return self._build_alert(
-                obs,
-                "long_inactivity",
-                "medium",
-                f"No movement detected for {settings.inactivity_threshold_minutes}+ minutes.",
-                {},
-            )
-        return None
+    def expire_heartbeats(self, now: float) -> List[AlertPayload]:
+        """Raise signal-loss/inactivity alerts for trips whose deadline passed.
+
+        Args:
+            now: Current POSIX time
+
+        Returns:
+            Alerts accepted by the store (after rate limiting)
+        """
+        alerts = []
+        for kind, last, deadline in self.heartbeats.expire(now):
+            if kind == SIGNAL_LOSS:
+                minutes = self.settings.signal_loss_minutes
+                alert = self._build_alert(
+                    last,
+                    "signal_loss",
+                    "high",
+                    f"No location update for {minutes}+ minutes; last seen at "
+                    f"{last.lat:.5f}, {last.lng:.5f}.",
+                    {"last_seen": last.timestamp.isoformat(), "battery_pct": str(last.battery_pct)},
+                )
+            else:
+                alert = self._build_alert(
+                    last,
+                    "long_inactivity",
+                    "medium",
+                    f"No movement detected for {self.settings.inactivity_threshold_minutes}+ minutes.",
+                    {},
+                )
+            alert.timestamp = deadline
+            if self.store.record_alert(alert):
+                alerts.append(alert)
+        return alerts
 
     def _check_danger_zone(self, obs: Observation) -> Optional[AlertPayload]:
         zone = self._detect_zone(obs)
@@ -169,7 +266,7 @@ class DetectionEngine:
             lng=obs.lng,
             last_updated=obs.timestamp,
         )
-        store.update_geofence_status(status)
+        self.store.update_geofence_status(status)
 
         if zone:
             return self._build_alert(
@@ -179,28 +276,86 @@ class DetectionEngine:
                 f"Entered {zone['name']}. {zone['advisory']}",
                 {"zone": zone["name"]},
             )
-        return None
+        return self._check_zone_approach(obs)
+
+    def _check_zone_approach(self, obs: Observation) -> Optional[AlertPayload]:
+        """Warn before a tourist enters a zone, from the tiles around them."""
+        slot = self.zone_schedules.slot_for(obs.timestamp)
+        nearby = self.zone_tiles.within(
+            obs.lat, obs.lng, self.settings.zone_approach_radius_m, slot
+        )
+        if not nearby:
+            return None
+        zone_idx, distance = nearby[0]
+        _, name, _, advisory = self._danger_polygons[zone_idx]
+        risk = self.zone_schedules.risk_level(zone_idx, slot)
+        return self._build_alert(
+            obs,
+            "zone_approach",
+            "low",
+            f"Approaching {name} ({int(distance)} m away). {advisory}",
+            {"zone": name, "distance_m": f"{distance:.0f}", "zone_risk": risk},
+        )
 
     def _detect_zone(self, obs: Observation) -> Optional[dict[str, str]]:
-        point = Point(obs.lng, obs.lat)
-        for polygon, name, risk, advisory in self._danger_polygons:
-            if polygon.contains(point):
-                return {"name": name, "risk": risk, "advisory": advisory}
+        """Zone (active at the observation's time) containing the observation."""
+        slot = self.zone_schedules.slot_for(obs.timestamp)
+        # The raster answers most points by indexing; only cells on a zone
+        # boundary fall through to the exact polygon checks
+        if self.risk_raster is not None:
+            cell_zone = self.risk_raster.zone_at(obs.lat, obs.lng)
+            if cell_zone == NO_ZONE:
+                return None
+            if cell_zone >= 0:
+                # Interior cells belong to one zone only
+                if not self.zone_schedules.is_active(cell_zone, slot):
+                    return None
+                return self._zone_info(cell_zone, slot)
+
+        # Only the tile under the point is loaded, and only its zones active
+        # in this slot are searched
+        for zone_idx in self.zone_tiles.containing(obs.lat, obs.lng, slot):
+            return self._zone_info(zone_idx, slot)
         return None
 
-    def _anomaly_score(self, obs: Observation) -> Optional[AlertPayload]:
-        features = np.array(
-            [
-                [
-                    obs.speed_mps,
-                    obs.accuracy_m,
-                    obs.battery_pct or 50,
-                ]
-            ]
-        )
-        model = self.model_bundle.model
-        score = model.decision_function(features)[0]
-        if score < -0.1:
+    def _zone_info(self, zone_idx: int, slot: Optional[int]) -> dict[str, str]:
+        _, name, _, advisory = self._danger_polygons[zone_idx]
+        risk = self.zone_schedules.risk_level(zone_idx, slot)
+        return {"name": name, "risk": risk, "advisory": advisory}
+
+    def anomaly_scores(
+        self,
+        observations: Sequence[Observation],
+        route_distances: Optional[Sequence[Optional[float]]] = None,
+    ) -> np.ndarray:
+        """Anomaly model scores of many observations in one call.
+
+        Each observation also advances its trip's rolling features, so
+        observations must come in time order and be scored exactly once.
+
+        Args:
+            observations: Observations to score
+            route_distances: Each observation's distance to its planned route
+                when already known; looked up otherwise
+        """
+        if route_distances is None:
+            route_distances = [self._route_distance(obs) for obs in observations]
+        trip_features = [
+            self.trip_features.observe(obs, distance)
+            for obs, distance in zip(observations, route_distances)
+        ]
+        return self.model_bundle.scores(observations, trip_features)
+
+    def _route_distance(self, obs: Observation) -> Optional[float]:
+        route = self.store.get_route(obs.tourist_id, obs.trip_id)
+        return min_distance_to_route(obs, route) if route else None
+
+    def _anomaly_score(
+        self, obs: Observation, score: Optional[float] = None
+    ) -> Optional[AlertPayload]:
+        if score is None:
+            score = self.anomaly_scores([obs])[0]
+        if score < ANOMALY_THRESHOLD:
             return self._build_alert(
                 obs,
                 "anomaly",
@@ -226,6 +381,8 @@ class DetectionEngine:
             severity=severity,  # type: ignore[arg-type]
             message=message,
             metadata=metadata,
+            lat=obs.lat,
+            lng=obs.lng,
         )
 
 
@@ -0,0 +1,190 @@
+"""Streaming bulk export of observations and alerts.
+
+Rows are read in chunks of ``export_chunk_rows`` (from the observation
+Parquet dataset or a CSV file), filtered by time range, trip ids and
+bounding box, then encoded and yielded chunk by chunk, so an export holds at
+most one chunk in memory however much data it covers. Supported formats are
+CSV, GeoJSON text sequences (RFC 8142, one Feature per record) and Parquet
+(one row group per chunk).
+"""
+from __future__ import annotations
+
+import json
+import math
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, FrozenSet, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DATASETS = ("observations", "alerts")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "geojsonseq": "application/geo+json-seq",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXTENSIONS = {"csv": "csv", "geojsonseq": "geojsons", "parquet": "parquet"}
+
+# Everything else except the timestamp is exported as float
+STRING_COLUMNS = ("tourist_id", "trip_id", "alert_type", "severity", "message")
+
+RECORD_SEPARATOR = b"\x1e"
+
+if TYPE_CHECKING:
+    from .observation_dataset import ObservationDataset
+
+
+@dataclass(frozen=True)
+class ExportFilter:
+    """Row filter; unset fields match everything."""
+
+    start: Optional[datetime] = None  # inclusive
+    end: Optional[datetime] = None  # exclusive
+    trip_ids: Optional[FrozenSet[str]] = None
+    bbox: Optional[Tuple[float, float, float, float]] = None  # min_lng, min_lat, max_lng, max_lat
+
+    def mask(self, chunk: pd.DataFrame, timestamps: pd.Series) -> pd.Series:
+        keep = pd.Series(True, index=chunk.index)
+        if self.start is not None:
+            keep &= timestamps >= _utc(self.start)
+        if self.end is not None:
+            keep &= timestamps < _utc(self.end)
+        if self.trip_ids is not None:
+            keep &= chunk["trip_id"].isin(self.trip_ids)
+        if self.bbox is not None:
+            min_lng, min_lat, max_lng, max_lat = self.bbox
+            keep &= chunk["lng"].between(min_lng, max_lng) & chunk["lat"].between(min_lat, max_lat)
+        return keep
+
+
+def parse_bbox(text: str) -> Tuple[float, float, float, float]:
+    """``"min_lng,min_lat,max_lng,max_lat"`` to a tuple; raises ValueError."""
+    parts = [float(p) for p in text.split(",")]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+    return parts[0], parts[1], parts[2], parts[3]
+
+
+def _utc(timestamp: datetime) -> pd.Timestamp:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return pd.Timestamp(timestamp).tz_convert("UTC")
+
+
+def iter_rows(path: Path, flt: ExportFilter, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Filtered chunks of a CSV dataset, with ``timestamp`` parsed to UTC.
+
+    Naive timestamps are taken as UTC.
+    """
+    if not path.exists():
+        return
+    reader = pd.read_csv(path, chunksize=chunk_rows, dtype={c: str for c in STRING_COLUMNS})
+    for chunk in reader:
+        timestamps = pd.to_datetime(chunk["timestamp"], utc=True, format="ISO8601", errors="coerce")
+        keep = flt.mask(chunk, timestamps)
+        if not keep.any():
+            continue
+        chunk = chunk[keep].copy()
+        chunk["timestamp"] = timestamps[keep]
+        for column in chunk.columns:
+            if column not in STRING_COLUMNS and column != "timestamp":
+                chunk[column] = pd.to_numeric(chunk[column], errors="coerce").astype(float)
+        yield chunk
+
+
+def iter_dataset_rows(
+    dataset: "ObservationDataset", flt: ExportFilter, chunk_rows: int
+) -> Iterator[pd.DataFrame]:
+    """Filtered chunks of the observation dataset; filters are pushed down."""
+    yield from dataset.iter_batches(
+        start=flt.start,
+        end=flt.end,
+        trip_ids=sorted(flt.trip_ids) if flt.trip_ids is not None else None,
+        bbox=flt.bbox,
+        batch_rows=chunk_rows,
+    )
+
+
+def encode_csv(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    header = True
+    for chunk in chunks:
+        out = chunk.assign(timestamp=chunk["timestamp"].map(lambda t: t.isoformat()))
+        yield out.to_csv(index=False, header=header).encode()
+        header = False
+
+
+def encode_geojsonseq(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    for chunk in chunks:
+        lngs, lats = chunk["lng"].tolist(), chunk["lat"].tolist()
+        props = chunk.drop(columns=["lat", "lng"])
+        props["timestamp"] = props["timestamp"].map(lambda t: t.isoformat())
+        lines: List[bytes] = []
+        for lng, lat, record in zip(lngs, lats, props.to_dict("records")):
+            geometry = (
+                None if math.isnan(lng) or math.isnan(lat)
+                else {"type": "Point", "coordinates": [lng, lat]}
+            )
+            properties = {
+                k: None if isinstance(v, float) and math.isnan(v) else v for k, v in record.items()
+            }
+            feature = {"type": "Feature", "geometry": geometry, "properties": properties}
+            lines.append(RECORD_SEPARATOR + json.dumps(feature, separators=(",", ":")).encode() + b"\n")
+        yield b"".join(lines)
+
+
+class _Sink:
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def encode_parquet(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    sink = _Sink()
+    writer = None
+    for chunk in chunks:
+        if writer is None:
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+ENCODERS = {"csv": encode_csv, "geojsonseq": encode_geojsonseq, "parquet": encode_parquet}
+
+
+def export_stream(
+    source: Union[Path, "ObservationDataset"], fmt: str, flt: ExportFilter, chunk_rows: int = 50_000
+) -> Iterator[bytes]:
+    """Encoded export of a CSV file or the observation dataset, as byte chunks."""
+    if isinstance(source, Path):
+        return ENCODERS[fmt](iter_rows(source, flt, chunk_rows))
+    return ENCODERS[fmt](iter_dataset_rows(source, flt, chunk_rows))
@@ -0,0 +1,130 @@
+"""Regular lng/lat grids shared by the raster risk layers.
+
+Also holds the helpers used to publish grid arrays as memory-mappable
+``.npy`` files with atomic replacement.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+
+from .exposure import METRES_PER_DEGREE
+
+
+@dataclass(frozen=True)
+class GridSpec:
+    """Regular lng/lat grid; row 0 is the southernmost row."""
+
+    min_lng: float
+    min_lat: float
+    cell_lng: float
+    cell_lat: float
+    rows: int
+    cols: int
+
+    @classmethod
+    def covering(
+        cls,
+        min_lng: float,
+        min_lat: float,
+        max_lng: float,
+        max_lat: float,
+        cell_size_m: float,
+        padding_cells: int = 0,
+    ) -> "GridSpec":
+        """Grid of roughly ``cell_size_m`` square cells covering a bbox."""
+        cell_lat = cell_size_m / METRES_PER_DEGREE
+        cell_lng = cell_lat / math.cos(math.radians((min_lat + max_lat) / 2.0))
+        min_lng -= padding_cells * cell_lng
+        min_lat -= padding_cells * cell_lat
+        cols = int(math.ceil((max_lng - min_lng) / cell_lng)) + padding_cells
+        rows = int(math.ceil((max_lat - min_lat) / cell_lat)) + padding_cells
+        return cls(min_lng, min_lat, cell_lng, cell_lat, max(rows, 1), max(cols, 1))
+
+    @classmethod
+    def from_meta(cls, meta: Dict) -> "GridSpec":
+        return cls(
+            float(meta["min_lng"]),
+            float(meta["min_lat"]),
+            float(meta["cell_lng"]),
+            float(meta["cell_lat"]),
+            int(meta["rows"]),
+            int(meta["cols"]),
+        )
+
+    def to_meta(self) -> Dict:
+        return {
+            "min_lng": self.min_lng,
+            "min_lat": self.min_lat,
+            "cell_lng": self.cell_lng,
+            "cell_lat": self.cell_lat,
+            "rows": self.rows,
+            "cols": self.cols,
+        }
+
+    def edges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Latitude and longitude bin edges, for ``np.histogram2d``."""
+        lat_edges = self.min_lat + np.arange(self.rows + 1) * self.cell_lat
+        lng_edges = self.min_lng + np.arange(self.cols + 1) * self.cell_lng
+        return lat_edges, lng_edges
+
+    def cells(self, lats: np.ndarray, lngs: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Row/col indexes for coordinate arrays plus an in-grid mask."""
+        rows = np.floor((np.asarray(lats) - self.min_lat) / self.cell_lat).astype(np.int64)
+        cols = np.floor((np.asarray(lngs) - self.min_lng) / self.cell_lng).astype(np.int64)
+        return self._clip(rows, cols)
+
+    def sample_path(
+        self, coords: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Cells crossed by a (lng, lat) polyline.
+
+        Samples every half cell so no crossed cell is skipped. Returns rows,
+        cols, the in-grid mask and the segment index of every sample.
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        fx = (coords[:, 0] - self.min_lng) / self.cell_lng
+        fy = (coords[:, 1] - self.min_lat) / self.cell_lat
+        if len(coords) < 2:
+            xs, ys, seg = fx, fy, np.zeros(len(coords), dtype=np.int64)
+        else:
+            dx, dy = np.diff(fx), np.diff(fy)
+            counts = np.ceil(np.hypot(dx, dy) * 2).astype(np.int64) + 1
+            seg = np.repeat(np.arange(len(counts)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            t = offsets / np.maximum(counts[seg] - 1, 1)
+            xs = fx[seg] + dx[seg] * t
+            ys = fy[seg] + dy[seg] * t
+        rows, cols, inside = self._clip(
+            np.floor(ys).astype(np.int64), np.floor(xs).astype(np.int64)
+        )
+        return rows, cols, inside, seg
+
+    def _clip(
+        self, rows: np.ndarray, cols: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        return np.clip(rows, 0, self.rows - 1), np.clip(cols, 0, self.cols - 1), inside
+
+
+def publish_array(path: Path, array: np.ndarray) -> None:
+    """Write ``array`` as ``.npy`` through a temp memmap, then swap it in."""
+    tmp = path.with_name(path.stem + ".tmp.npy")
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=array.dtype, shape=array.shape)
+    out[...] = array
+    out.flush()
+    del out
+    os.replace(tmp, path)
+
+
+def publish_json(path: Path, payload: Dict) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp, path)
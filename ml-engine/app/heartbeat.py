@@ -0,0 +1,97 @@
+"""Per-trip heartbeat deadlines for signal-loss and inactivity alerts.
+
+Every observation pushes its trip's signal-loss deadline forward, and every
+observation with movement pushes the inactivity deadline forward, each an
+O(1) reschedule on a hierarchical timer wheel. A periodic task advances the
+wheel to the current time and alerts only on the deadlines that expired, so
+a phone that goes silent is noticed without scanning every trip.
+
+Deadlines run on the monitor's clock, the server's when live: they count
+from when an observation was received, not from its device timestamp, so
+client clock offsets and fixes uploaded late cannot fire them early. Without
+a clock (a replay) the observation timestamps are the clock. A fix older
+than the trip's latest one is ignored.
+"""
+from __future__ import annotations
+
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .schemas import Observation
+from .timer_wheel import TimerWheel
+
+SIGNAL_LOSS = "signal_loss"
+INACTIVITY = "long_inactivity"
+
+# Speed above which an observation counts as movement
+MOVING_SPEED_MPS = 0.4
+
+
+def epoch_seconds(timestamp: datetime) -> float:
+    """POSIX time of a timestamp; naive timestamps are taken as UTC."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class HeartbeatMonitor:
+    """Signal-loss and inactivity deadlines for every active trip."""
+
+    def __init__(
+        self,
+        signal_loss_after: timedelta,
+        inactivity_after: timedelta,
+        start: float,
+        tick_seconds: float = 1.0,
+        clock: Optional[Callable[[], float]] = None,
+    ) -> None:
+        self.timeouts = {SIGNAL_LOSS: signal_loss_after, INACTIVITY: inactivity_after}
+        self.clock = clock
+        self._wheel: TimerWheel[Tuple[str, str]] = TimerWheel(start, tick_seconds)
+        # Latest observation per trip and when it was received, on the clock
+        self._last: Dict[str, Tuple[Observation, float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    def observe(self, key: str, obs: Observation) -> None:
+        """Record a heartbeat for trip ``key`` and reschedule its deadlines."""
+        received = self.clock() if self.clock is not None else epoch_seconds(obs.timestamp)
+        with self._lock:
+            previous = self._last.get(key)
+            if previous is not None and epoch_seconds(obs.timestamp) < epoch_seconds(
+                previous[0].timestamp
+            ):
+                return
+            self._last[key] = (obs, received)
+            self._schedule(key, SIGNAL_LOSS, received)
+            if previous is None or obs.speed_mps > MOVING_SPEED_MPS:
+                self._schedule(key, INACTIVITY, received)
+
+    def _schedule(self, key: str, kind: str, since: float) -> None:
+        self._wheel.schedule((key, kind), since + self.timeouts[kind].total_seconds())
+
+    def expire(self, now: float) -> List[Tuple[str, Observation, datetime]]:
+        """Advance to ``now`` (POSIX seconds).
+
+        Returns (kind, last observation, deadline) for every expired deadline,
+        the deadline on the device clock of the last observation. Each
+        deadline fires once; the trip's next heartbeat re-arms it.
+        """
+        fired = []
+        with self._lock:
+            for (key, kind), deadline in self._wheel.advance(now):
+                if key not in self._last:
+                    continue
+                last, received = self._last[key]
+                fired.append((kind, last, last.timestamp + timedelta(seconds=deadline - received)))
+        return fired
+
+    def forget(self, key: str) -> None:
+        """Drop a trip's deadlines, e.g. when the trip ends."""
+        with self._lock:
+            self._last.pop(key, None)
+            for kind in self.timeouts:
+                self._wheel.cancel((key, kind))
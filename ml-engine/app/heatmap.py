@@ -0,0 +1,92 @@
+"""Incrementally maintained density heatmap tiles for the admin panel.
+
+Counts are kept per slippy-map tile at a few fixed zoom levels, each tile
+split into ``bins`` x ``bins`` cells. Every observation or alert adjusts one
+cell per zoom level, so tiles are always current and serving one is a copy of
+its non-zero cells. Each change stamps the tile with a new layer-wide
+version which, with a per-process epoch, makes up its ETag.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .zone_tiles import tile_xy
+
+TileKey = Tuple[int, int, int]
+
+
+def tile_cell(lat: float, lng: float, zoom: int, bins: int) -> Tuple[int, int, int]:
+    """Tile column/row at ``zoom`` plus the flat cell index inside the tile."""
+    fine_x, fine_y = tile_xy(np.array([lng]), np.array([lat]), zoom + int(np.log2(bins)))
+    x, y = int(fine_x[0]), int(fine_y[0])
+    return x // bins, y // bins, (y % bins) * bins + (x % bins)
+
+
+class _Tile:
+    __slots__ = ("counts", "version")
+
+    def __init__(self, bins: int) -> None:
+        self.counts = np.zeros(bins * bins, dtype=np.int64)
+        self.version = 0
+
+
+class DensityTiles:
+    """Per-tile cell counts at several zoom levels for one heatmap layer."""
+
+    def __init__(self, name: str, zooms: Sequence[int] = (8, 11, 14), bins: int = 32) -> None:
+        if bins & (bins - 1):
+            raise ValueError("bins must be a power of two")
+        self.name = name
+        self.zooms = tuple(sorted(zooms))
+        self.bins = bins
+        self._tiles: Dict[TileKey, _Tile] = {}
+        self._version = 0
+        # Versions restart with the process; the epoch keeps old ETags from matching
+        self._epoch = f"{time.time_ns():x}{os.getpid():x}"
+        self._lock = threading.Lock()
+
+    def add(self, lat: float, lng: float, delta: int = 1) -> None:
+        """Add ``delta`` to the cell holding the point at every zoom level."""
+        with self._lock:
+            self._version += 1
+            for zoom in self.zooms:
+                x, y, cell = tile_cell(lat, lng, zoom, self.bins)
+                key = (zoom, x, y)
+                tile = self._tiles.get(key)
+                if tile is None:
+                    if delta <= 0:
+                        continue
+                    tile = self._tiles[key] = _Tile(self.bins)
+                tile.counts[cell] = max(tile.counts[cell] + delta, 0)
+                tile.version = self._version
+                if delta < 0 and not tile.counts.any():
+                    del self._tiles[key]
+
+    def move(
+        self,
+        previous: Optional[Tuple[float, float]],
+        current: Optional[Tuple[float, float]],
+    ) -> None:
+        """Move one count between points (either may be None)."""
+        if previous is not None and current is not None and previous == current:
+            return
+        if previous is not None:
+            self.add(previous[0], previous[1], -1)
+        if current is not None:
+            self.add(current[0], current[1], 1)
+
+    def tile(self, zoom: int, x: int, y: int) -> Tuple[str, List[int], List[int]]:
+        """ETag plus the non-zero cell indexes and counts of one tile."""
+        with self._lock:
+            tile = self._tiles.get((zoom, x, y))
+            if tile is None:
+                return f'"{self.name}-{zoom}-empty"', [], []
+            cells = np.flatnonzero(tile.counts)
+            counts = tile.counts[cells]
+            etag = f'"{self.name}-{self._epoch}-{zoom}-{tile.version}"'
+        return etag, cells.tolist(), counts.tolist()
@@ -0,0 +1,194 @@
+"""Historical incident density layer for TourGuard ML Engine.
+
+A batch pipeline turns stored alerts and labelled historical observations
+into a kernel-density risk surface. Events are binned onto a regular grid
+and smoothed with a Gaussian kernel by FFT convolution, so the cost depends
+on the grid size rather than on the number of events. Each build is
+published as a new versioned artifact; route scoring samples the current
+version along the route.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from .grid import GridSpec, publish_array, publish_json
+
+logger = logging.getLogger(__name__)
+
+# Event weights: alerts by severity, observations by positive label
+ALERT_SEVERITY_WEIGHTS = {"high": 1.0, "medium": 0.6, "low": 0.3}
+LABEL_WEIGHTS = {
+    "label_danger": 1.0,
+    "label_inactivity": 0.5,
+    "label_route_deviation": 0.3,
+}
+
+CURRENT_FILE = "CURRENT"
+
+
+def incident_events(alerts: pd.DataFrame, observations: pd.DataFrame) -> pd.DataFrame:
+    """Collect weighted incident locations as ``lat``, ``lng``, ``weight`` columns."""
+    frames = []
+    if len(alerts.index) and {"lat", "lng", "severity"} <= set(alerts.columns):
+        located = alerts.dropna(subset=["lat", "lng"])
+        frames.append(
+            pd.DataFrame(
+                {
+                    "lat": located["lat"].astype(float),
+                    "lng": located["lng"].astype(float),
+                    "weight": located["severity"].map(ALERT_SEVERITY_WEIGHTS).fillna(0.3),
+                }
+            )
+        )
+    labels = [c for c in LABEL_WEIGHTS if c in observations.columns]
+    if len(observations.index) and labels:
+        weight = sum(observations[c].fillna(0).clip(0, 1) * LABEL_WEIGHTS[c] for c in labels)
+        positive = weight > 0
+        frames.append(
+            pd.DataFrame(
+                {
+                    "lat": observations.loc[positive, "lat"].astype(float),
+                    "lng": observations.loc[positive, "lng"].astype(float),
+                    "weight": weight[positive],
+                }
+            )
+        )
+    if not frames:
+        return pd.DataFrame(columns=["lat", "lng", "weight"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def gaussian_kernel(sigma_cells: float) -> np.ndarray:
+    radius = max(int(math.ceil(3 * sigma_cells)), 1)
+    offsets = np.arange(-radius, radius + 1)
+    profile = np.exp(-0.5 * (offsets / max(sigma_cells, 1e-6)) ** 2)
+    kernel = np.outer(profile, profile)
+    return kernel / kernel.sum()
+
+
+def fft_convolve(image: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """Linear 2-D convolution, cropped to ``image``'s shape (centred kernel)."""
+    k_rows, k_cols = kernel.shape
+    shape = (image.shape[0] + k_rows - 1, image.shape[1] + k_cols - 1)
+    spectrum = np.fft.rfft2(image, shape) * np.fft.rfft2(kernel, shape)
+    full = np.fft.irfft2(spectrum, shape)
+    r0, c0 = k_rows // 2, k_cols // 2
+    cropped = full[r0:r0 + image.shape[0], c0:c0 + image.shape[1]]
+    return np.clip(cropped, 0.0, None)
+
+
+def build_density_surface(
+    events: pd.DataFrame,
+    out_dir: Path,
+    cell_size_m: float = 250.0,
+    bandwidth_m: float = 500.0,
+    max_cells: int = 16_000_000,
+    keep_versions: int = 3,
+) -> "IncidentDensitySurface":
+    """Bin events, smooth them by FFT and publish a new surface version.
+
+    Args:
+        events: Frame from ``incident_events``
+        out_dir: Artifact directory; the ``CURRENT`` file names the live version
+        cell_size_m: Approximate grid cell edge in metres
+        bandwidth_m: Gaussian kernel standard deviation in metres
+        max_cells: Upper bound on grid size; cells are coarsened to fit
+        keep_versions: Number of published versions kept on disk
+
+    Returns:
+        The newly published surface, memory-mapped from ``out_dir``
+    """
+    if not len(events.index):
+        raise ValueError("No located incidents to build a density surface from")
+    lats = events["lat"].to_numpy(dtype=float)
+    lngs = events["lng"].to_numpy(dtype=float)
+    weights = events["weight"].to_numpy(dtype=float)
+
+    padding = int(math.ceil(3 * bandwidth_m / cell_size_m)) + 1
+    grid = GridSpec.covering(lngs.min(), lats.min(), lngs.max(), lats.max(), cell_size_m, padding)
+    while grid.rows * grid.cols > max_cells:
+        cell_size_m *= 1.5
+        padding = int(math.ceil(3 * bandwidth_m / cell_size_m)) + 1
+        grid = GridSpec.covering(lngs.min(), lats.min(), lngs.max(), lats.max(), cell_size_m, padding)
+
+    counts, _, _ = np.histogram2d(lats, lngs, bins=grid.edges(), weights=weights)
+    density = fft_convolve(counts, gaussian_kernel(bandwidth_m / cell_size_m))
+    peak = density.max()
+    if peak > 0:
+        density /= peak
+    density = density.astype(np.float32)
+
+    built_at = datetime.now(timezone.utc)
+    version = f"{built_at:%Y%m%dT%H%M%SZ}-{hashlib.sha1(density.tobytes()).hexdigest()[:8]}"
+    meta = {
+        "version": version,
+        **grid.to_meta(),
+        "cell_size_m": cell_size_m,
+        "bandwidth_m": bandwidth_m,
+        "events": int(len(events.index)),
+        "total_weight": float(weights.sum()),
+        "built_at": built_at.isoformat(),
+    }
+    out_dir.mkdir(parents=True, exist_ok=True)
+    publish_array(out_dir / f"density-{version}.npy", density)
+    publish_json(out_dir / f"density-{version}.json", meta)
+    publish_json(out_dir / CURRENT_FILE, {"version": version})
+    _prune_versions(out_dir, keep_versions)
+    return IncidentDensitySurface.load(out_dir)  # type: ignore[return-value]
+
+
+def _prune_versions(out_dir: Path, keep: int) -> None:
+    versions = sorted(p.stem[len("density-"):] for p in out_dir.glob("density-*.json"))
+    for version in versions[:-keep] if keep > 0 else []:
+        for suffix in (".npy", ".json"):
+            (out_dir / f"density-{version}{suffix}").unlink(missing_ok=True)
+
+
+class IncidentDensitySurface:
+    """Memory-mapped, versioned 0-1 incident density grid."""
+
+    def __init__(self, density: np.ndarray, meta: Dict) -> None:
+        self.density = density
+        self.meta = meta
+        self.version: str = meta["version"]
+        self.grid = GridSpec.from_meta(meta)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["IncidentDensitySurface"]:
+        current = directory / CURRENT_FILE
+        if not current.exists():
+            return None
+        with current.open() as f:
+            version = json.load(f)["version"]
+        try:
+            with (directory / f"density-{version}.json").open() as f:
+                meta = json.load(f)
+            density = np.load(directory / f"density-{version}.npy", mmap_mode="r")
+        except FileNotFoundError:
+            logger.warning("Incident density version %s is missing from %s", version, directory)
+            return None
+        return cls(density, meta)
+
+    def point_density(self, lat: float, lng: float) -> float:
+        rows, cols, inside = self.grid.cells(np.array([lat]), np.array([lng]))
+        return float(self.density[rows[0], cols[0]]) if inside[0] else 0.0
+
+    def segment_density(self, coords: np.ndarray) -> np.ndarray:
+        """Peak density along each segment of a (lng, lat) polyline."""
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        peaks = np.zeros(max(len(coords) - 1, 0))
+        if len(peaks) == 0:
+            return peaks
+        rows, cols, inside, seg = self.grid.sample_path(coords)
+        values = np.where(inside, self.density[rows, cols], 0.0)
+        np.maximum.at(peaks, seg, values)
+        return peaks
@@ -1,14 +1,30 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional
+
 import numpy as np
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
 from .alerts import dispatcher
+from .config import get_settings
 from .detection import engine
 from .schemas import (
     AlertHistoryResponse,
+    GeofenceCheckRequest,
+    GeofenceCheckResponse,
     GeofenceStatus,
+    GeofenceZone,
+    HeatmapTile,
+    NearbyTourist,
+    NearbyTouristsResponse,
+    NearbyZone,
+    NearbyZonesResponse,
     Observation,
     RoutePlan,
     SafeRouteRequest,
@@ -17,6 +33,8 @@ from .schemas import (
     DangerZoneCrossing,
     TrainRequest,
     TrainResponse,
+    TrajectoryResponse,
+    TripCloseResponse,
     # LLM Schemas
     ChatRequest,
     ChatResponse,
@@ -40,6 +58,13 @@ from .blockchain_routes import router as blockchain_router
 from . import route_scoring
 from .llm_service import get_llm_service
 from .behavioral_analyzer import get_behavioral_analyzer
+from .risk_raster import risk_level_for
+from .time_buckets import time_bucket
+from .trips import trips
+from . import export
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="TourGuard ML Engine", version="1.1.0")
 
@@ -55,6 +80,60 @@ app.add_middleware(
 # Include blockchain router
 app.include_router(blockchain_router)
 
+_background_tasks: list[asyncio.Task] = []
+
+
+async def _expire_heartbeats() -> None:
+    """Raise signal-loss/inactivity alerts as trips miss their deadlines."""
+    while True:
+        await asyncio.sleep(settings.heartbeat_tick_seconds)
+        try:
+            for alert in engine.expire_heartbeats(time.time()):
+                dispatcher.dispatch(alert)
+        except Exception:  # keep the loop alive
+            logger.exception("Heartbeat expiry failed")
+
+
+async def _sweep_idle_trips() -> None:
+    """Evict and archive trips that have been idle past their TTL."""
+    while True:
+        await asyncio.sleep(settings.trip_sweep_interval_seconds)
+        try:
+            # Archiving writes files; keep it off the event loop
+            await asyncio.to_thread(trips.sweep, time.time())
+        except Exception:  # keep the loop alive
+            logger.exception("Idle trip sweep failed")
+
+
+async def _flush_observations() -> None:
+    """Write buffered live observations out once they have waited long enough."""
+    while True:
+        await asyncio.sleep(min(settings.observations_flush_seconds, 5.0))
+        try:
+            await asyncio.to_thread(store.observations.flush_stale)
+        except Exception:  # keep the loop alive
+            logger.exception("Observation flush failed")
+
+
+@app.on_event("startup")
+async def start_background_tasks() -> None:
+    _background_tasks.append(asyncio.create_task(_expire_heartbeats()))
+    _background_tasks.append(asyncio.create_task(_sweep_idle_trips()))
+    _background_tasks.append(asyncio.create_task(_flush_observations()))
+    if engine.shadow is not None:
+        engine.shadow.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks() -> None:
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    if engine.shadow is not None:
+        engine.shadow.stop()
+    store.trajectories.seal_all()
+    store.observations.flush()
+
 
 @app.get("/")
 def root() -> dict[str, str]:
@@ -71,12 +150,14 @@ def health() -> dict[str, str]:
 def register_route(plan: RoutePlan) -> dict[str, str]:
     if len(plan.points) < 2:
         raise HTTPException(status_code=400, detail="Route requires at least two points.")
+    trips.touch(plan.tourist_id, plan.trip_id)
     store.add_route(plan)
     return {"message": "Route stored"}
 
 
 @app.post("/observations")
 def ingest_observation(obs: Observation) -> dict[str, str]:
+    trips.touch(obs.tourist_id, obs.trip_id)
     store.add_observation(obs)
     alerts = engine.process_observation(obs)
     for alert in alerts:
@@ -95,11 +176,247 @@ def fetch_alerts(trip_id: str) -> AlertHistoryResponse:
     return AlertHistoryResponse(trip_id=trip_id, alerts=alerts)
 
 
+@app.post("/trips/{trip_id}/close", response_model=TripCloseResponse)
+def close_trip(trip_id: str) -> TripCloseResponse:
+    """End a trip: evict its in-memory state and archive it to disk."""
+    closed = trips.close(trip_id)
+    if not closed:
+        raise HTTPException(status_code=404, detail=f"No active trip '{trip_id}'.")
+    return TripCloseResponse(
+        trip_id=trip_id,
+        tourist_ids=[trip.tourist_id for trip in closed],
+        observations_archived=sum(trip.observation_count for trip in closed),
+        alerts_archived=sum(len(trip.alerts) for trip in closed),
+    )
+
+
+@app.get("/trips/{trip_id}/trajectory", response_model=TrajectoryResponse)
+def trip_trajectory(
+    trip_id: str,
+    zoom: int = Query(default=14, ge=0, le=22),
+    start: Optional[datetime] = Query(default=None, alias="from"),
+    end: Optional[datetime] = Query(default=None, alias="to"),
+    tourist_id: Optional[str] = Query(default=None),
+) -> TrajectoryResponse:
+    """A trip's path simplified for the given map zoom, for replay on the admin map."""
+    if tourist_id is None:
+        tourists = trips.tourists(trip_id)
+        if len(tourists) != 1:
+            raise HTTPException(
+                status_code=400,
+                detail="tourist_id is required unless exactly one tourist is live on the trip.",
+            )
+        tourist_id = tourists[0]
+    level, total, columns = store.trajectories.read_simplified(
+        tourist_id, trip_id, zoom, settings.trajectory_max_points, start, end
+    )
+    if not total and store.trajectories.count(tourist_id, trip_id) == 0:
+        raise HTTPException(status_code=404, detail=f"No trajectory for trip '{trip_id}'.")
+    return TrajectoryResponse(
+        tourist_id=tourist_id,
+        trip_id=trip_id,
+        zoom=zoom,
+        level=level,
+        total_points=total,
+        timestamp=[datetime.fromtimestamp(t, timezone.utc) for t in columns["timestamp"].tolist()],
+        lat=columns["lat"].tolist(),
+        lng=columns["lng"].tolist(),
+    )
+
+
+@app.get("/export/{dataset}")
+def export_dataset(
+    dataset: Literal["observations", "alerts"],
+    fmt: Literal["csv", "geojsonseq", "parquet"] = Query(default="csv", alias="format"),
+    start: Optional[datetime] = Query(default=None, alias="from"),
+    end: Optional[datetime] = Query(default=None, alias="to"),
+    trip_id: Optional[list[str]] = Query(default=None),
+    bbox: Optional[str] = Query(default=None, description="min_lng,min_lat,max_lng,max_lat"),
+) -> StreamingResponse:
+    """Stream observations or alerts in ``[from, to)`` for trips and/or a bounding box."""
+    try:
+        box = export.parse_bbox(bbox) if bbox else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    flt = export.ExportFilter(
+        start=start, end=end, trip_ids=frozenset(trip_id) if trip_id else None, bbox=box
+    )
+    source = store.history_source() if dataset == "observations" else settings.alerts_dataset
+    filename = f"{dataset}.{export.EXTENSIONS[fmt]}"
+    return StreamingResponse(
+        export.export_stream(source, fmt, flt, settings.export_chunk_rows),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @app.get("/geofence-status", response_model=list[GeofenceStatus])
 def geofence_status() -> list[GeofenceStatus]:
     return store.list_geofence_status()
 
 
+@app.get("/tourists/nearby", response_model=NearbyTouristsResponse)
+def nearby_tourists(
+    lat: float = Query(ge=-90, le=90),
+    lng: float = Query(ge=-180, le=180),
+    radius_m: Optional[float] = Query(default=None, gt=0),
+    k: Optional[int] = Query(default=None, ge=1, le=1000),
+) -> NearbyTouristsResponse:
+    """Tourists last seen within ``radius_m`` metres, or the ``k`` nearest."""
+    if radius_m is None and k is None:
+        radius_m = settings.tourists_nearby_radius_m
+    if k is not None:
+        matches = store.positions.nearest(lat, lng, k=k, max_radius_m=radius_m)
+    else:
+        matches = store.positions.within(lat, lng, radius_m)  # type: ignore[arg-type]
+    tourists = [
+        NearbyTourist(
+            tourist_id=status.tourist_id,
+            trip_id=status.trip_id,
+            lat=status.lat,
+            lng=status.lng,
+            distance_m=distance,
+            last_updated=status.last_updated,
+            inside_zone=status.inside_zone,
+            zone_name=status.zone_name,
+        )
+        for _, distance, status in matches
+    ]
+    return NearbyTouristsResponse(lat=lat, lng=lng, radius_m=radius_m, tourists=tourists)
+
+
+@app.get("/heatmap/{layer}/{z}/{x}/{y}", response_model=HeatmapTile)
+def heatmap_tile(
+    layer: Literal["tourists", "alerts"],
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    response: Response,
+) -> HeatmapTile | Response:
+    """Tourist or alert density tile; honours ``If-None-Match``."""
+    tiles = store.heatmaps[layer]
+    if z not in tiles.zooms:
+        raise HTTPException(status_code=404, detail=f"Zoom must be one of {list(tiles.zooms)}.")
+    etag, cells, counts = tiles.tile(z, x, y)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return HeatmapTile(
+        layer=layer, z=z, x=x, y=y, bins=tiles.bins, cells=cells, counts=counts
+    )
+
+
+@app.post("/geofence/check", response_model=GeofenceCheckResponse)
+def geofence_check(request: GeofenceCheckRequest) -> GeofenceCheckResponse:
+    """Stateless bulk zone lookup: no trip state, alerts or status are touched."""
+    if len(request.lat) != len(request.lng):
+        raise HTTPException(status_code=400, detail="lat and lng must have the same length.")
+    if len(request.lat) > settings.geofence_check_max_points:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.geofence_check_max_points} points per request.",
+        )
+    lats = np.asarray(request.lat, dtype=float)
+    lngs = np.asarray(request.lng, dtype=float)
+    if ((np.abs(lats) > 90) | (np.abs(lngs) > 180) | ~np.isfinite(lats + lngs)).any():
+        raise HTTPException(status_code=400, detail="Coordinates out of range.")
+
+    schedules = engine.zone_schedules
+    slot = schedules.slot_for(request.timestamp)
+    inside, nearest, distance = engine.proximity.classify(
+        lats,
+        lngs,
+        schedules.active[slot] if slot is not None else None,
+        request.max_distance_m,
+    )
+    # Compact zone table holding only the zones referenced by the answer
+    referenced = np.unique(np.concatenate([inside, nearest]))
+    referenced = referenced[referenced >= 0]
+    position = np.full(len(engine.proximity) + 1, -1, dtype=np.int64)
+    position[referenced] = np.arange(len(referenced))
+    zones = []
+    for zone_idx in referenced.tolist():
+        _, name, _, advisory = engine._danger_polygons[zone_idx]
+        zones.append(
+            GeofenceZone(
+                name=name,
+                risk_level=schedules.risk_level(zone_idx, slot),  # type: ignore[arg-type]
+                advisory=advisory,
+            )
+        )
+    rounded = np.round(distance, 1)
+    return GeofenceCheckResponse(
+        zones=zones,
+        inside=position[inside].tolist(),
+        nearest=position[nearest].tolist(),
+        distance_m=np.where(np.isnan(rounded), None, rounded).tolist(),
+    )
+
+
+@app.post("/zones/reload")
+def reload_zones() -> dict[str, int]:
+    """Reload danger zones from disk; cached route scores are invalidated."""
+    version = engine.reload_danger_zones()
+    return {"zones_version": version, "zones": len(engine._danger_polygons)}
+
+
+@app.get("/zones/tile-stats")
+def zone_tile_stats() -> dict[str, int]:
+    """Loaded/evicted counts for the region-partitioned zone tiles."""
+    return engine.zone_tiles.stats()
+
+
+@app.get("/zones/nearby", response_model=NearbyZonesResponse)
+def nearby_zones(
+    lat: float = Query(ge=-90, le=90),
+    lng: float = Query(ge=-180, le=180),
+    radius_m: Optional[float] = Query(default=None, gt=0),
+    k: Optional[int] = Query(default=None, ge=1, le=100),
+) -> NearbyZonesResponse:
+    """Zones within ``radius_m`` metres, or the ``k`` nearest (optionally within the radius).
+
+    Only zones active now are reported, at their current risk level.
+    """
+    if radius_m is None and k is None:
+        radius_m = settings.advisory_nearby_radius_m
+    schedules = engine.zone_schedules
+    slot = schedules.slot_for(datetime.now(timezone.utc))
+    active = schedules.active[slot] if slot is not None else None
+    if k is not None:
+        matches = engine.proximity.nearest(lat, lng, k=k, max_radius_m=radius_m, active=active)
+    else:
+        matches = engine.proximity.within(lat, lng, radius_m, active)  # type: ignore[arg-type]
+    zones = []
+    for zone_idx, distance in matches:
+        _, name, _, advisory = engine._danger_polygons[zone_idx]
+        zones.append(
+            NearbyZone(
+                name=name,
+                risk_level=schedules.risk_level(zone_idx, slot),  # type: ignore[arg-type]
+                advisory=advisory,
+                distance_m=distance,
+                inside=distance == 0.0,
+            )
+        )
+    return NearbyZonesResponse(lat=lat, lng=lng, radius_m=radius_m, zones=zones)
+
+
+@app.get("/models/shadow")
+def shadow_model_stats() -> dict[str, object]:
+    """Score distributions and disagreement of the shadow candidate models."""
+    if engine.shadow is None:
+        raise HTTPException(status_code=404, detail="No shadow models configured")
+    return engine.shadow.stats()
+
+
+@app.get("/routes/cache-stats")
+def route_cache_stats() -> dict[str, int | float]:
+    return route_scoring.route_cache.stats()
+
+
 @app.post("/routes/safe-route", response_model=SafeRouteResponse)
 def calculate_safe_route(request: SafeRouteRequest) -> SafeRouteResponse:
     """Calculate safe route options with safety scores.
@@ -126,7 +443,7 @@ time of day, and historical incidents.
     )
     
     # Get danger zone crossings
-    impact = route_scoring.get_route_safety_impact(direct_route_points)
+    impact = route_scoring.get_route_safety_impact(direct_route_points, timestamp=timestamp)
     
     # Convert to DangerZoneCrossing objects
     crossings = [
@@ -253,11 +570,22 @@ def generate_safety_advisory(request: SafetyAdvisoryRequest) -> SafetyAdvisoryRe
     - Nearby danger zones
     """
     llm = get_llm_service()
+    when = request.timestamp or datetime.now(timezone.utc)
+    
+    # Fall back to the precomputed risk raster when the caller has no risk level
+    current_risk_level = request.current_risk_level
+    if current_risk_level is None and engine.risk_raster is not None:
+        cell_risk = engine.risk_raster.point_risk(
+            request.location.lat,
+            request.location.lng,
+            time_bucket(when.hour),
+        )
+        current_risk_level = risk_level_for(cell_risk)  # type: ignore[assignment]
     
     if not llm.is_available():
         return SafetyAdvisoryResponse(
             advisory_text="Safety advisory service is currently unavailable. Please check back later.",
-            risk_assessment=request.current_risk_level or "medium",
+            risk_assessment=current_risk_level or "medium",
             recommendations=["Stay aware of your surroundings", "Keep emergency contacts handy"],
             danger_zones_nearby=[]
         )
@@ -265,20 +593,22 @@ def generate_safety_advisory(request: SafetyAdvisoryRequest) -> SafetyAdvisoryRe
     # Generate advisory
     advisory_text, risk_assessment, recommendations = llm.generate_safety_advisory(
         location_name=request.location.name or f"Location ({request.location.lat}, {request.location.lng})",
-        risk_level=request.current_risk_level,
+        risk_level=current_risk_level,
         time_of_day=request.time_of_day,
         user_profile=request.user_profile
     )
     
-    # Check for nearby danger zones
-    from .detection import engine
-    nearby_zones = []
-    for polygon, name, risk, advisory in engine._danger_polygons:
-        from shapely.geometry import Point
-        point = Point(request.location.lng, request.location.lat)
-        # Check if within 1km buffer (approximate)
-        if polygon.buffer(0.01).contains(point):
-            nearby_zones.append(name)
+    # Check for nearby danger zones active at that time
+    slot = engine.zone_schedules.slot_for(when)
+    nearby_zones = [
+        engine._danger_polygons[zone_idx][1]
+        for zone_idx, _ in engine.proximity.within(
+            request.location.lat,
+            request.location.lng,
+            settings.advisory_nearby_radius_m,
+            engine.zone_schedules.active[slot] if slot is not None else None,
+        )
+    ]
     
     return SafetyAdvisoryResponse(
         advisory_text=advisory_text,
@@ -464,12 +794,32 @@ def generate_investigation_report(request: InvestigationRequest) -> Investigatio
     llm = get_llm_service()
     analyzer = get_behavioral_analyzer()
     
-    # Get observation history
-    history = analyzer.get_observation_history(
-        request.tourist_id,
-        request.trip_id,
-        hours=request.hours_of_history
-    )
+    # Get observation history: the analyzer only holds a day, so longer
+    # windows stream from the trip's on-disk segments
+    if request.hours_of_history <= 24:
+        history = analyzer.get_observation_history(
+            request.tourist_id,
+            request.trip_id,
+            hours=request.hours_of_history
+        )
+    else:
+        history = []
+    if not history:
+        latest = store.trajectories.latest(request.tourist_id, request.trip_id)
+        if latest is not None:
+            end = datetime.fromtimestamp(latest, timezone.utc)
+            history = store.trajectories.read(
+                request.tourist_id,
+                request.trip_id,
+                start=end - timedelta(hours=request.hours_of_history),
+                end=end,
+            )
+    alerts_response = dispatcher.history(request.trip_id)
+    if not alerts_response:
+        # Closed or idle-evicted trips are read back from their archive
+        archived = trips.archived(request.tourist_id, request.trip_id)
+        if archived is not None:
+            alerts_response = archived.alerts
     
     # Convert observations to dicts with all relevant fields
     obs_dicts = []
@@ -488,7 +838,6 @@ def generate_investigation_report(request: InvestigationRequest) -> Investigatio
         obs_dicts.append(obs_dict)
     
     # Get alerts from history with full context
-    alerts_response = dispatcher.history(request.trip_id)
     alert_dicts = []
     for alert in alerts_response:
         alert_dict = {
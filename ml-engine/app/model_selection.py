@@ -0,0 +1,339 @@
+"""Hyperparameter and feature-set sweep for the anomaly model.
+
+Every combination of ``training_sweep_grid`` and ``training_feature_sets``
+is evaluated with time-based cross-validation: the history is sorted by
+timestamp and cut into ``folds + 1`` blocks, and fold ``k`` trains on blocks
+``0..k`` and tests on block ``k + 1``, so a model is never scored on data
+older than what it was fitted on. The model is unsupervised; the
+``label_*`` columns only score it. A row counts as positive when any label
+is set, and its anomaly score is ranked against that (average precision,
+ROC AUC) and thresholded at the live alert threshold (precision, recall,
+F1). Per-label average precision is reported too.
+
+Candidates are spread over a process pool. Each reports its mean fit time,
+its batch scoring cost per row and its single-row latency (the live path
+scores one observation at a time). The best candidate by the configured
+metric, ties going to the earliest in grid order, is refitted on all rows
+and saved with a sidecar holding its parameters, features, cross-validation
+scores, costs and the whole sweep.
+
+The ranking metrics (average precision, ROC AUC) cannot tell contamination
+values apart: contamination only moves the decision threshold, not the
+order of the scores. When selecting by one of them, the winner's
+contamination is then picked by F1 at the alert threshold.
+"""
+from __future__ import annotations
+
+import itertools
+import math
+import os
+import pickle
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import IsolationForest
+from sklearn.metrics import average_precision_score, precision_recall_fscore_support, roc_auc_score
+
+from .config import get_settings
+from .training import (
+    ANOMALY_THRESHOLD,
+    LABEL_COLUMNS,
+    archived_routes,
+    frame_features,
+    save_model,
+    source_columns,
+)
+from .trip_features import TRIP_FEATURES, frame_trip_features, has_trip_features
+
+settings = get_settings()
+
+METRICS = ("average_precision", "roc_auc", "precision", "recall", "f1") + tuple(
+    f"average_precision_{label}" for label in LABEL_COLUMNS
+)
+# Metrics of the score ranking alone, blind to where the threshold sits
+RANKING_METRICS = frozenset(m for m in METRICS if m == "roc_auc" or m.startswith("average_precision"))
+# Picks contamination (the threshold) when selecting by a ranking metric
+THRESHOLD_METRIC = "f1"
+
+
+@dataclass
+class Candidate:
+    feature_set: str
+    features: List[str]
+    params: Dict[str, object]
+
+    @property
+    def name(self) -> str:
+        settings = " ".join(f"{k}={v}" for k, v in sorted(self.params.items()))
+        return f"{self.feature_set} {settings}"
+
+
+@dataclass
+class CandidateResult:
+    candidate: Candidate
+    metrics: Dict[str, Optional[float]]  # mean over folds where defined
+    folds: List[Dict[str, Optional[float]]] = field(default_factory=list)
+    fit_seconds: float = 0.0  # mean per fold
+    batch_us_per_row: float = 0.0
+    single_row_ms: float = 0.0
+    model_bytes: int = 0
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "name": self.candidate.name,
+            "feature_set": self.candidate.feature_set,
+            "features": self.candidate.features,
+            "params": self.candidate.params,
+            "metrics": self.metrics,
+            "fit_seconds": round(self.fit_seconds, 4),
+            "batch_us_per_row": round(self.batch_us_per_row, 3),
+            "single_row_ms": round(self.single_row_ms, 3),
+            "model_bytes": self.model_bytes,
+        }
+
+
+def candidates(
+    grid: Dict[str, List[object]], feature_sets: Dict[str, List[str]]
+) -> List[Candidate]:
+    names = sorted(grid)
+    return [
+        Candidate(feature_set, list(features), dict(zip(names, values)))
+        for feature_set, features in feature_sets.items()
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def time_folds(rows: int, folds: int) -> List[Tuple[slice, slice]]:
+    """Expanding-window (train, test) slices over rows sorted by time."""
+    edges = np.linspace(0, rows, folds + 2).astype(int)
+    return [
+        (slice(0, edges[k]), slice(edges[k], edges[k + 1]))
+        for k in range(1, folds + 1)
+        if edges[k] > 0 and edges[k + 1] > edges[k]
+    ]
+
+
+def _score(labels: pd.DataFrame, scores: np.ndarray) -> Dict[str, Optional[float]]:
+    """Metrics of decision_function ``scores`` (lower = more anomalous)."""
+    risk = -scores
+    target = labels.any(axis=1).to_numpy()
+    metrics: Dict[str, Optional[float]] = {}
+    both = 0 < target.sum() < len(target)
+    metrics["average_precision"] = float(average_precision_score(target, risk)) if both else None
+    metrics["roc_auc"] = float(roc_auc_score(target, risk)) if both else None
+    precision, recall, f1, _ = precision_recall_fscore_support(
+        target, scores < ANOMALY_THRESHOLD, average="binary", zero_division=0
+    )
+    metrics.update(precision=float(precision), recall=float(recall), f1=float(f1))
+    for label in LABEL_COLUMNS:
+        values = labels[label].to_numpy() if label in labels else np.zeros(len(target), bool)
+        defined = 0 < values.sum() < len(values)
+        metrics[f"average_precision_{label}"] = (
+            float(average_precision_score(values, risk)) if defined else None
+        )
+    return metrics
+
+
+def _mean(values: Sequence[Optional[float]]) -> Optional[float]:
+    defined = [v for v in values if v is not None and not math.isnan(v)]
+    return statistics.fmean(defined) if defined else None
+
+
+def evaluate(
+    frame: pd.DataFrame, candidate: Candidate, folds: int, random_state: Optional[int]
+) -> CandidateResult:
+    """Cross-validate one candidate on ``frame`` (sorted by timestamp)."""
+    x = frame_features(frame, candidate.features)
+    labels = frame.reindex(columns=LABEL_COLUMNS).fillna(0).astype(bool)
+    fold_metrics: List[Dict[str, Optional[float]]] = []
+    fit_seconds: List[float] = []
+    score_seconds = 0.0
+    scored_rows = 0
+    model = None
+    for train, test in time_folds(len(x), folds):
+        model = IsolationForest(random_state=random_state, n_jobs=1, **candidate.params)
+        began = time.perf_counter()
+        model.fit(x[train])
+        fit_seconds.append(time.perf_counter() - began)
+        began = time.perf_counter()
+        scores = model.decision_function(x[test])
+        score_seconds += time.perf_counter() - began
+        scored_rows += len(scores)
+        fold_metrics.append(_score(labels.iloc[test], scores))
+    result = CandidateResult(
+        candidate=candidate,
+        metrics={name: _mean([m[name] for m in fold_metrics]) for name in METRICS},
+        folds=fold_metrics,
+    )
+    if model is not None:
+        result.fit_seconds = statistics.fmean(fit_seconds)
+        result.batch_us_per_row = score_seconds / scored_rows * 1e6
+        row = x[-1:]
+        single = []
+        for _ in range(5):
+            began = time.perf_counter()
+            model.decision_function(row)
+            single.append(time.perf_counter() - began)
+        result.single_row_ms = statistics.median(single) * 1e3
+        result.model_bytes = len(pickle.dumps(model))
+    return result
+
+
+def _first_best(results: Sequence[CandidateResult], metric: str) -> CandidateResult:
+    """Highest ``metric``, ties going to the earliest result."""
+    def key(result: CandidateResult) -> float:
+        value = result.metrics.get(metric)
+        return value if value is not None else -math.inf
+
+    return max(results, key=key)
+
+
+def best_result(results: Sequence[CandidateResult], metric: str) -> CandidateResult:
+    """Highest ``metric``, ties going to the earliest candidate in grid order.
+
+    For a ranking metric, contamination is then chosen by ``THRESHOLD_METRIC``
+    among the candidates differing from the winner only in contamination.
+    """
+    best = _first_best(results, metric)
+    if metric not in RANKING_METRICS:
+        return best
+
+    def rest(result: CandidateResult) -> Tuple[str, Dict[str, object]]:
+        params = {k: v for k, v in result.candidate.params.items() if k != "contamination"}
+        return result.candidate.feature_set, params
+
+    siblings = [r for r in results if rest(r) == rest(best)]
+    return _first_best(siblings, THRESHOLD_METRIC)
+
+
+# History shared with the worker processes, set once by _init_worker
+_worker_frame: Optional[pd.DataFrame] = None
+
+
+def _init_worker(frame: pd.DataFrame) -> None:
+    global _worker_frame
+    _worker_frame = frame
+
+
+def _evaluate_in_worker(
+    candidate: Candidate, folds: int, random_state: Optional[int]
+) -> CandidateResult:
+    assert _worker_frame is not None
+    return evaluate(_worker_frame, candidate, folds, random_state)
+
+
+def sweep_frame(
+    frame: pd.DataFrame,
+    grid: Dict[str, List[object]],
+    feature_sets: Dict[str, List[str]],
+    folds: int = 4,
+    workers: Optional[int] = None,
+    random_state: Optional[int] = 42,
+) -> List[CandidateResult]:
+    """Evaluate every candidate on ``frame`` (sorted by timestamp).
+
+    Results keep candidate order. Trip features are computed once here
+    rather than by every candidate.
+    """
+    if any(has_trip_features(f) for f in feature_sets.values()):
+        trip = frame_trip_features(frame, settings.trip_feature_window, archived_routes())
+        frame = frame.assign(**{name: trip[:, i] for i, name in enumerate(TRIP_FEATURES)})
+    todo = candidates(grid, feature_sets)
+    workers = max(1, workers or os.cpu_count() or 1)
+    if workers == 1:
+        return [evaluate(frame, c, folds, random_state) for c in todo]
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(frame,)
+    ) as pool:
+        futures = [pool.submit(_evaluate_in_worker, c, folds, random_state) for c in todo]
+        return [future.result() for future in futures]
+
+
+def sweep_frame_columns(feature_sets: Dict[str, List[str]]) -> List[str]:
+    """Dataset columns a sweep over ``feature_sets`` needs to load."""
+    columns = {"timestamp", *LABEL_COLUMNS}
+    for features in feature_sets.values():
+        columns.update(source_columns(features))
+    return sorted(columns)
+
+
+def load_history(
+    columns: Sequence[str],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    max_rows: Optional[int] = None,
+) -> pd.DataFrame:
+    """Historical rows for a sweep, sorted by time and capped to the newest ``max_rows``."""
+    from .storage import store
+
+    frame = store.load_dataframe(columns=list(columns), start=start, end=end)
+    if frame.empty:
+        return frame
+    frame["timestamp"] = pd.to_datetime(frame["timestamp"], utc=True, format="ISO8601", errors="coerce")
+    frame = frame.dropna(subset=["timestamp"]).sort_values("timestamp", kind="stable")
+    if max_rows is not None:
+        frame = frame.tail(max_rows)
+    return frame.reset_index(drop=True)
+
+
+def fit_and_save(
+    frame: pd.DataFrame,
+    results: Sequence[CandidateResult],
+    metric: str,
+    folds: int,
+    out: Path,
+    random_state: Optional[int] = 42,
+    source: str = "",
+) -> Tuple[CandidateResult, Dict[str, object]]:
+    """Refit the best candidate on all of ``frame`` and save it with metadata."""
+    best = best_result(results, metric)
+    candidate = best.candidate
+    model = IsolationForest(random_state=random_state, **candidate.params)
+    began = time.perf_counter()
+    model.fit(frame_features(frame, candidate.features, archived_routes()))
+    fit_seconds = time.perf_counter() - began
+    timestamps = frame["timestamp"]
+    labels = frame.reindex(columns=LABEL_COLUMNS).fillna(0).astype(bool)
+    metadata: Dict[str, object] = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "model_type": "IsolationForest",
+        "sklearn_version": sklearn.__version__,
+        "params": candidate.params,
+        "random_state": random_state,
+        "feature_set": candidate.feature_set,
+        "features": candidate.features,
+        "trip_feature_window": settings.trip_feature_window,
+        "training": {
+            "source": source,
+            "rows": len(frame.index),
+            "start": timestamps.min().isoformat() if len(frame.index) else None,
+            "end": timestamps.max().isoformat() if len(frame.index) else None,
+            "positive_rate": float(labels.any(axis=1).mean()) if len(frame.index) else None,
+            "fit_seconds": round(fit_seconds, 4),
+        },
+        "selection": {
+            "metric": metric,
+            "value": best.metrics.get(metric),
+            "folds": folds,
+            "alert_threshold": ANOMALY_THRESHOLD,
+            "cv_metrics": best.metrics,
+            "cv_folds": best.folds,
+        },
+        "cost": {
+            "cv_fit_seconds": round(best.fit_seconds, 4),
+            "batch_us_per_row": round(best.batch_us_per_row, 3),
+            "single_row_ms": round(best.single_row_ms, 3),
+            "model_bytes": best.model_bytes,
+        },
+        "sweep": [r.summary() for r in results],
+    }
+    save_model(model, out, metadata)
+    return best, metadata
@@ -0,0 +1,102 @@
+"""Sliding-window movement metrics per trip.
+
+``analyze_movement_pattern`` looks at a trip's last few fixes: the speed of
+each leg between them, how much those speeds vary, the fastest leg, and how
+direct the path was (straight-line distance over distance travelled). A
+``MovementWindow`` keeps those figures up to date as fixes enter and leave
+the window instead of recomputing them: a new fix measures one new leg, the
+fix falling out takes its leg's distance and speed with it (a reverse
+Welford update for the variance, a monotonic deque for the maximum), and one
+more distance gives the straight line. The cost per fix does not depend on
+the window size.
+"""
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .baselines import RunningStats
+from .trip_features import leg
+
+# Fixes older than this, relative to the newest, leave the window
+MAX_WINDOW_SPAN_S = 2 * 3600.0
+
+
+@dataclass(frozen=True)
+class MovementMetrics:
+    legs: int  # legs with a positive time step
+    avg_speed_kmh: float
+    speed_variance: float
+    max_speed_kmh: float
+    total_distance_m: float
+    straight_line_m: float
+
+
+class MovementWindow:
+    """The last ``size`` fixes of a trip and running metrics over their legs."""
+
+    __slots__ = ("size", "points", "legs", "speeds", "maxima", "total_m", "_next")
+
+    def __init__(self, size: int = 5) -> None:
+        self.size = size
+        self.points: "deque[Tuple[float, float, float]]" = deque()  # time, lat, lng
+        # Leg ending at each point after the first: (id, distance_m, speed_kmh or None)
+        self.legs: "deque[Tuple[int, float, Optional[float]]]" = deque()
+        self.speeds = RunningStats()
+        # (id, speed_kmh) with decreasing speeds; the front is the window's maximum
+        self.maxima: "deque[Tuple[int, float]]" = deque()
+        self.total_m = 0.0
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def add(self, time: float, lat: float, lng: float) -> None:
+        while self.points and (
+            len(self.points) >= self.size or time - self.points[0][0] > MAX_WINDOW_SPAN_S
+        ):
+            self._drop_oldest()
+        if self.points:
+            last_time, last_lat, last_lng = self.points[-1]
+            dt = time - last_time
+            distance, _ = leg(last_lat, last_lng, lat, lng)
+            speed = distance / dt * 3.6 if dt > 0 else None
+            leg_id, self._next = self._next, self._next + 1
+            self.legs.append((leg_id, distance, speed))
+            if speed is not None:
+                self.total_m += distance
+                self.speeds.add(speed)
+                while self.maxima and self.maxima[-1][1] <= speed:
+                    self.maxima.pop()
+                self.maxima.append((leg_id, speed))
+        self.points.append((time, lat, lng))
+
+    def _drop_oldest(self) -> None:
+        self.points.popleft()
+        if not self.legs:
+            return
+        leg_id, distance, speed = self.legs.popleft()
+        if speed is not None:
+            self.total_m -= distance
+            self.speeds.remove(speed)
+            if self.maxima and self.maxima[0][0] == leg_id:
+                self.maxima.popleft()
+        if not self.legs:
+            self.total_m = 0.0  # drop accumulated rounding
+
+    def metrics(self) -> Optional[MovementMetrics]:
+        """Metrics of a full window; None until ``size`` fixes are in it."""
+        if len(self.points) < self.size or not self.speeds.count:
+            return None
+        _, first_lat, first_lng = self.points[0]
+        _, last_lat, last_lng = self.points[-1]
+        straight, _ = leg(first_lat, first_lng, last_lat, last_lng)
+        return MovementMetrics(
+            legs=self.speeds.count,
+            avg_speed_kmh=self.speeds.mean,
+            speed_variance=max(self.speeds.variance, 0.0),
+            max_speed_kmh=self.maxima[0][1],
+            total_distance_m=max(self.total_m, 0.0),
+            straight_line_m=straight,
+        )
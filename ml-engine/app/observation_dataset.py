@@ -0,0 +1,335 @@
+"""Historical observations as a Parquet dataset partitioned by date and region.
+
+Rows live under ``date=YYYY-MM-DD/region=<lat>_<lng>/`` directories, where the
+region is the ``region_cell_deg`` cell holding the point. Inside a file, rows
+are sorted by timestamp and written in row groups that carry min/max
+statistics. A read names the columns it needs and, optionally, a time window,
+trip set or bounding box:
+
+* only those columns are decoded;
+* directories outside the window or box are never opened;
+* row groups whose timestamp range misses the window are skipped.
+
+Live observations are buffered and written out every ``flush_rows`` rows or
+``flush_seconds`` seconds (and before every read), so the dataset does not
+fill up with one-row files.
+
+Files may carry different label columns. Their union is kept in
+``_common_metadata`` and updated on every write, so a read does not have to
+open every file footer to learn the dataset's schema.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+BASE_SCHEMA = pa.schema(
+    [
+        ("tourist_id", pa.string()),
+        ("trip_id", pa.string()),
+        ("timestamp", pa.timestamp("ms", tz="UTC")),
+        ("lat", pa.float64()),
+        ("lng", pa.float64()),
+        ("speed_mps", pa.float64()),
+        ("accuracy_m", pa.float64()),
+        ("battery_pct", pa.float64()),
+    ]
+)
+PARTITION_SCHEMA = pa.schema([("date", pa.string()), ("region", pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+
+# Written once a legacy CSV has been copied in; the dataset scan skips "_" files
+MIGRATION_MARKER = "_migrated.json"
+# Union of every file's schema (without the partition columns)
+SCHEMA_FILE = "_common_metadata"
+
+
+def region_of(lats: np.ndarray, lngs: np.ndarray, cell_deg: float) -> np.ndarray:
+    """Region partition labels (``"<row>_<col>"`` of ``cell_deg`` cells)."""
+    rows = np.floor(np.asarray(lats, dtype=float) / cell_deg).astype(np.int64)
+    cols = np.floor(np.asarray(lngs, dtype=float) / cell_deg).astype(np.int64)
+    # Format each distinct cell once rather than every row
+    codes, cells = pd.factorize(rows * (1 << 32) + cols)
+    labels = []
+    for cell in cells.tolist():
+        col = ((cell + (1 << 31)) & 0xFFFFFFFF) - (1 << 31)
+        labels.append(f"{(cell - col) >> 32}_{col}")
+    return np.array(labels, dtype=object)[codes]
+
+
+def _utc(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def normalize(frame: pd.DataFrame) -> pa.Table:
+    """Observation rows (e.g. a CSV chunk) as a table of the dataset's schema.
+
+    Columns beyond the base schema, such as training labels, are kept as
+    float64.
+    """
+    frame = frame.copy()
+    timestamps = pd.to_datetime(frame["timestamp"], utc=True, format="ISO8601")
+    frame["timestamp"] = timestamps.dt.floor("ms")
+    fields = list(BASE_SCHEMA)
+    for name in frame.columns:
+        if name not in BASE_SCHEMA.names:
+            frame[name] = pd.to_numeric(frame[name], errors="coerce").astype(float)
+            fields.append(pa.field(name, pa.float64()))
+    for name in BASE_SCHEMA.names:
+        if name not in frame.columns:
+            frame[name] = None
+    schema = pa.schema(fields)
+    return pa.Table.from_pandas(frame[schema.names], schema=schema, preserve_index=False)
+
+
+class ObservationDataset:
+    """Date/region partitioned Parquet store of historical observations."""
+
+    def __init__(
+        self,
+        root: Path,
+        region_cell_deg: float = 1.0,
+        row_group_rows: int = 128_000,
+        flush_rows: int = 10_000,
+        flush_seconds: float = 30.0,
+    ) -> None:
+        self.root = root
+        self.region_cell_deg = region_cell_deg
+        self.row_group_rows = row_group_rows
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._buffer: List[Dict] = []
+        self._buffered_since = 0.0  # monotonic time of the oldest buffered row
+        self._lock = threading.Lock()
+        self._schema: Optional[Tuple[int, pa.Schema]] = None  # (file mtime, schema)
+        self._schema_lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return self.root.exists() and any(self.root.glob("date=*"))
+
+    def migrated(self) -> bool:
+        """Whether a legacy CSV has been migrated in (see ``migrate_csv``)."""
+        return (self.root / MIGRATION_MARKER).exists()
+
+    def mark_migrated(self, source: Path, rows: int) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        marker = self.root / MIGRATION_MARKER
+        tmp = marker.with_name(marker.name + ".tmp")
+        tmp.write_text(json.dumps({"source": str(source), "rows": rows, "migrated_at": time.time()}))
+        os.replace(tmp, marker)
+
+    def append(self, row: Dict) -> None:
+        """Buffer one live observation row.
+
+        The buffer is written out once it holds ``flush_rows`` rows or its
+        oldest row has waited ``flush_seconds``; ``flush_stale`` covers the
+        latter when no more rows arrive.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not self._buffer:
+                self._buffered_since = now
+            self._buffer.append(row)
+            if (
+                len(self._buffer) < self.flush_rows
+                and now - self._buffered_since < self.flush_seconds
+            ):
+                return
+            rows, self._buffer = self._buffer, []
+        self.write(pd.DataFrame(rows))
+
+    def flush(self) -> None:
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if rows:
+            self.write(pd.DataFrame(rows))
+
+    def flush_stale(self) -> None:
+        """Write the buffer out if its oldest row has waited ``flush_seconds``."""
+        with self._lock:
+            stale = bool(self._buffer) and time.monotonic() - self._buffered_since >= self.flush_seconds
+        if stale:
+            self.flush()
+
+    def write(self, frame: pd.DataFrame) -> int:
+        """Write rows as new files, one per date/region partition they touch."""
+        if not len(frame.index):
+            return 0
+        table = normalize(frame)
+        timestamps = table.column("timestamp")
+        dates = pc.strftime(timestamps, format="%Y-%m-%d").to_numpy(zero_copy_only=False)
+        regions = region_of(
+            table.column("lat").to_numpy(zero_copy_only=False),
+            table.column("lng").to_numpy(zero_copy_only=False),
+            self.region_cell_deg,
+        )
+        keys = pd.DataFrame({"date": dates, "region": regions})
+        batch = uuid.uuid4().hex
+        for (day, region), rows in keys.groupby(["date", "region"], sort=False).indices.items():
+            part = table.take(pa.array(rows)).sort_by("timestamp")
+            directory = self.root / f"date={day}" / f"region={region}"
+            directory.mkdir(parents=True, exist_ok=True)
+            pq.write_table(
+                part,
+                directory / f"part-{batch}.parquet",
+                row_group_size=self.row_group_rows,
+                write_statistics=True,
+            )
+        self._record_schema([table.schema])
+        return table.num_rows
+
+    def _stored_schema(self) -> Optional[pa.Schema]:
+        """The schema in ``SCHEMA_FILE``, re-read only when the file changes."""
+        try:
+            mtime = (self.root / SCHEMA_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if self._schema is None or self._schema[0] != mtime:
+            self._schema = (mtime, pq.read_schema(self.root / SCHEMA_FILE))
+        return self._schema[1]
+
+    def _record_schema(self, schemas: List[pa.Schema]) -> pa.Schema:
+        """Merge ``schemas`` into ``SCHEMA_FILE``, rewriting it if it grew."""
+        with self._schema_lock:
+            stored = self._stored_schema()
+            if stored is None:
+                # Dataset written before the schema was kept: read every footer once
+                files = ds.dataset(self.root, format="parquet", partitioning=PARTITIONING)
+                schemas = [f.physical_schema for f in files.get_fragments()] + schemas
+            merged = pa.unify_schemas([stored or BASE_SCHEMA] + schemas).remove_metadata()
+            if stored is None or not merged.equals(stored):
+                path = self.root / SCHEMA_FILE
+                tmp = path.with_name(path.name + ".tmp")
+                pq.write_metadata(merged, tmp)
+                os.replace(tmp, path)
+            return merged
+
+    def _dataset(self) -> Optional[ds.Dataset]:
+        if not self.exists():
+            return None
+        # Files written at different times may carry different label columns
+        schema = pa.unify_schemas(
+            [self._stored_schema() or self._record_schema([]), PARTITION_SCHEMA]
+        )
+        return ds.dataset(self.root, schema=schema, format="parquet", partitioning=PARTITIONING)
+
+    def _filter(
+        self,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        trip_ids: Optional[Sequence[str]],
+        bbox: Optional[Tuple[float, float, float, float]],
+    ) -> Optional[ds.Expression]:
+        terms = []
+        if start is not None:
+            start = _utc(start)
+            terms.append(ds.field("date") >= start.date().isoformat())
+            terms.append(ds.field("timestamp") >= pa.scalar(start, pa.timestamp("ms", tz="UTC")))
+        if end is not None:
+            end = _utc(end)
+            terms.append(ds.field("date") <= end.date().isoformat())
+            terms.append(ds.field("timestamp") < pa.scalar(end, pa.timestamp("ms", tz="UTC")))
+        if trip_ids is not None:
+            terms.append(ds.field("trip_id").isin(list(trip_ids)))
+        if bbox is not None:
+            min_lng, min_lat, max_lng, max_lat = bbox
+            cell = self.region_cell_deg
+            regions = [
+                f"{row}_{col}"
+                for row in range(math.floor(min_lat / cell), math.floor(max_lat / cell) + 1)
+                for col in range(math.floor(min_lng / cell), math.floor(max_lng / cell) + 1)
+            ]
+            terms.append(ds.field("region").isin(regions))
+            terms.append((ds.field("lng") >= min_lng) & (ds.field("lng") <= max_lng))
+            terms.append((ds.field("lat") >= min_lat) & (ds.field("lat") <= max_lat))
+        expression = None
+        for term in terms:
+            expression = term if expression is None else expression & term
+        return expression
+
+    def scanner(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        trip_ids: Optional[Sequence[str]] = None,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        batch_rows: int = 128_000,
+    ) -> Optional[ds.Scanner]:
+        """Scanner over the matching rows; None when the dataset is empty.
+
+        Requested columns missing from every file are skipped rather than
+        raising. Partition columns are left out unless asked for.
+        """
+        self.flush()
+        dataset = self._dataset()
+        if dataset is None:
+            return None
+        names = [n for n in dataset.schema.names if n not in ("date", "region")]
+        if columns is not None:
+            names = [n for n in columns if n in dataset.schema.names]
+        return dataset.scanner(
+            columns=names,
+            filter=self._filter(start, end, trip_ids, bbox),
+            batch_size=batch_rows,
+        )
+
+    def read(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        trip_ids: Optional[Sequence[str]] = None,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+    ) -> pd.DataFrame:
+        scanner = self.scanner(columns, start, end, trip_ids, bbox)
+        if scanner is None:
+            return pd.DataFrame()
+        return scanner.to_table().to_pandas()
+
+    def iter_batches(self, *args, **kwargs) -> Iterator[pd.DataFrame]:
+        """Like ``read`` but yields DataFrames of at most ``batch_rows`` rows."""
+        scanner = self.scanner(*args, **kwargs)
+        if scanner is None:
+            return
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+    def count_rows(self) -> int:
+        """Row count from file footers alone."""
+        self.flush()
+        dataset = self._dataset()
+        return dataset.count_rows() if dataset is not None else 0
+
+
+def migrate_csv(
+    source: Path, dataset: ObservationDataset, chunk_rows: int = 1_000_000
+) -> Iterator[int]:
+    """Copy a historical CSV into the dataset; yields rows written per chunk.
+
+    Once every chunk is written the dataset is marked as migrated, which is
+    what switches reads over from the CSV.
+    """
+    total = 0
+    for chunk in pd.read_csv(source, chunksize=chunk_rows, dtype={"tourist_id": str, "trip_id": str}):
+        written = dataset.write(chunk)
+        total += written
+        yield written
+    dataset.mark_migrated(source, total)
@@ -0,0 +1,77 @@
+"""Persisted tourist profiles: baseline sketches carried across trips.
+
+Each profile is one fixed-size binary record (see ``TouristProfile``) in its
+own file, named by a hash of the tourist id like the trip archive. A profile
+is read the first time one of the tourist's trips needs it and the most
+recently used ones are cached. When a trip closes its baseline is folded
+into the profile and the file is replaced atomically.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from .baselines import TouristProfile, TripBaseline
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileStore:
+    """Directory of tourist profiles with an LRU cache in front."""
+
+    def __init__(self, directory: Path, cache_size: int = 1024) -> None:
+        self.directory = directory
+        self.cache_size = cache_size
+        # tourist_id -> profile, or None when the tourist has none yet
+        self._cache: "OrderedDict[str, Optional[TouristProfile]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, tourist_id: str) -> Path:
+        digest = hashlib.sha1(tourist_id.encode()).hexdigest()
+        return self.directory / f"{digest}.profile"
+
+    def get(self, tourist_id: str) -> Optional[TouristProfile]:
+        """The tourist's profile, or None before their first closed trip."""
+        with self._lock:
+            if tourist_id in self._cache:
+                self._cache.move_to_end(tourist_id)
+                return self._cache[tourist_id]
+        profile = self._read(tourist_id)
+        with self._lock:
+            self._remember(tourist_id, profile)
+        return profile
+
+    def absorb(self, tourist_id: str, baseline: TripBaseline) -> TouristProfile:
+        """Fold a closed trip's baseline into the tourist's profile and save it."""
+        profile = self.get(tourist_id) or TouristProfile()
+        with self._lock:
+            profile.absorb(baseline)
+            data = profile.to_bytes()
+            self._remember(tourist_id, profile)
+        path = self.path(tourist_id)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        return profile
+
+    def _read(self, tourist_id: str) -> Optional[TouristProfile]:
+        path = self.path(tourist_id)
+        if not path.exists():
+            return None
+        try:
+            return TouristProfile.from_bytes(path.read_bytes())
+        except ValueError as exc:
+            logger.warning("Ignoring unreadable profile %s: %s", path, exc)
+            return None
+
+    def _remember(self, tourist_id: str, profile: Optional[TouristProfile]) -> None:
+        self._cache[tourist_id] = profile
+        self._cache.move_to_end(tourist_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
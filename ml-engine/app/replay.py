@@ -0,0 +1,363 @@
+"""Offline replay of historical observations through the detection rules.
+
+Each worker process builds its own ``DetectionEngine`` with a private
+in-memory store and behavioural analyzer, so a replay never writes alerts,
+datasets or trajectories and never touches the service's state. Settings can
+be overridden (e.g. ``route_deviation_threshold_m``) and another model can be
+swapped in to see how a change would behave before deploying it.
+
+The history is read once, in the parent process, and its trips are sharded
+across a process pool, balanced by row count; each shard is handed its own
+rows rather than re-reading the history. Every trip
+is replayed in timestamp order on a simulated clock: the heartbeat monitor is
+advanced to each observation's time before it is processed, so signal-loss
+and inactivity alerts fire as they would have live, without any waiting.
+The end of a trip's data is treated as the trip closing, so no heartbeat
+alerts are raised after its last observation.
+
+Alerts are scored against the ``label_*`` columns of the data. A labelled
+episode (consecutive rows with the label set) counts as detected when an
+alert of a matching type falls inside it or within ``tolerance_minutes`` of
+either end; an alert that falls in no episode is a false alert.
+"""
+from __future__ import annotations
+
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pydantic import ValidationError
+
+from .behavioral_analyzer import BehavioralAnalyzer
+from .config import Settings
+from .detection import DetectionEngine
+from .export import ExportFilter, iter_dataset_rows, iter_rows
+from .heartbeat import epoch_seconds
+from .schemas import AlertPayload, GeofenceStatus, Observation, RoutePlan
+from .storage import store
+from .training import load_model
+from .trip_archive import TripArchive
+
+# Label column -> alert types that count as detecting it
+LABEL_ALERTS: Dict[str, Tuple[str, ...]] = {
+    "label_route_deviation": ("route_deviation",),
+    "label_inactivity": ("long_inactivity", "signal_loss"),
+    "label_danger": ("danger_zone",),
+}
+
+_EPOCH = pd.Timestamp(0, tz="UTC")
+
+
+class ReplayStore:
+    """In-memory stand-in for the observation store used by a replay engine.
+
+    It rate-limits alerts like the real store but keeps nothing beyond the
+    current trip. Routes are read from the trip archive when one is given.
+    """
+
+    def __init__(self, settings: Settings, archive: Optional[TripArchive] = None) -> None:
+        self.settings = settings
+        self.archive = archive
+        self._routes: Dict[str, Optional[RoutePlan]] = {}
+        self._last_alert_at: Dict[str, Dict[str, datetime]] = {}
+
+    def get_route(self, tourist_id: str, trip_id: str) -> Optional[RoutePlan]:
+        key = f"{tourist_id}::{trip_id}"
+        if key not in self._routes:
+            archived = self.archive.load(tourist_id, trip_id) if self.archive else None
+            self._routes[key] = archived.route if archived else None
+        return self._routes[key]
+
+    def update_geofence_status(self, status: GeofenceStatus) -> None:
+        pass
+
+    def record_alert(self, alert: AlertPayload) -> bool:
+        last_at = self._last_alert_at.setdefault(f"{alert.tourist_id}::{alert.trip_id}", {})
+        last = last_at.get(alert.alert_type)
+        if last is not None and alert.timestamp - last < timedelta(
+            minutes=self.settings.alert_buffer_minutes
+        ):
+            return False
+        last_at[alert.alert_type] = alert.timestamp
+        return True
+
+    def forget(self, tourist_id: str, trip_id: str) -> None:
+        key = f"{tourist_id}::{trip_id}"
+        self._routes.pop(key, None)
+        self._last_alert_at.pop(key, None)
+
+
+@dataclass
+class LabelScore:
+    """Episode-level agreement between one label column and the alerts."""
+
+    episodes: int = 0
+    detected: int = 0
+    alerts: int = 0
+    matched: int = 0
+
+    @property
+    def recall(self) -> Optional[float]:
+        return self.detected / self.episodes if self.episodes else None
+
+    @property
+    def precision(self) -> Optional[float]:
+        return self.matched / self.alerts if self.alerts else None
+
+    def merge(self, other: "LabelScore") -> None:
+        self.episodes += other.episodes
+        self.detected += other.detected
+        self.alerts += other.alerts
+        self.matched += other.matched
+
+
+@dataclass
+class ReplayReport:
+    trips: int = 0
+    observations: int = 0
+    skipped_rows: int = 0  # rows that fail Observation validation
+    alerts: Counter = field(default_factory=Counter)
+    labels: Dict[str, LabelScore] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def merge(self, other: "ReplayReport") -> None:
+        self.trips += other.trips
+        self.observations += other.observations
+        self.skipped_rows += other.skipped_rows
+        self.alerts.update(other.alerts)
+        for name, score in other.labels.items():
+            self.labels.setdefault(name, LabelScore()).merge(score)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "trips": self.trips,
+            "observations": self.observations,
+            "skipped_rows": self.skipped_rows,
+            "seconds": round(self.seconds, 3),
+            "alerts": dict(sorted(self.alerts.items())),
+            "labels": {
+                name: {
+                    "episodes": s.episodes,
+                    "detected": s.detected,
+                    "recall": s.recall,
+                    "alerts": s.alerts,
+                    "matched": s.matched,
+                    "precision": s.precision,
+                }
+                for name, s in sorted(self.labels.items())
+            },
+        }
+
+
+def build_engine(
+    overrides: Optional[Dict[str, str]] = None, model_path: Optional[Path] = None
+) -> DetectionEngine:
+    """A side-effect-free engine using ``overrides`` on top of the settings.
+
+    Raises:
+        pydantic.ValidationError: An override names an unknown setting or
+            has an invalid value
+    """
+    settings = Settings(**(overrides or {}))
+    bundle = load_model(model_path) if model_path is not None else None
+    return DetectionEngine(
+        settings=settings,
+        store=ReplayStore(settings, TripArchive(settings.trip_archive_dir)),  # type: ignore[arg-type]
+        analyzer=BehavioralAnalyzer(settings.movement_window_points),
+        model_bundle=bundle,
+    )
+
+
+def _observations(rows: pd.DataFrame) -> Tuple[List[Observation], np.ndarray]:
+    """Observations of a trip's rows, plus a mask of the rows that were valid."""
+    battery = rows["battery_pct"] if "battery_pct" in rows else pd.Series(np.nan, index=rows.index)
+    columns = zip(
+        rows["tourist_id"].tolist(),
+        rows["trip_id"].tolist(),
+        [t.to_pydatetime() for t in rows["timestamp"]],
+        rows["lat"].tolist(),
+        rows["lng"].tolist(),
+        rows["speed_mps"].tolist(),
+        rows["accuracy_m"].tolist(),
+        [None if np.isnan(b) else b for b in battery.tolist()],
+    )
+    observations: List[Observation] = []
+    valid = np.ones(len(rows.index), dtype=bool)
+    names = ("tourist_id", "trip_id", "timestamp", "lat", "lng", "speed_mps", "accuracy_m", "battery_pct")
+    for i, values in enumerate(columns):
+        try:
+            observations.append(Observation(**dict(zip(names, values))))
+        except ValidationError:
+            valid[i] = False
+    return observations, valid
+
+
+def _score_labels(
+    report: ReplayReport, rows: pd.DataFrame, alerts: List[AlertPayload], tolerance_s: float
+) -> None:
+    times = (rows["timestamp"] - _EPOCH).dt.total_seconds().to_numpy()
+    for column, alert_types in LABEL_ALERTS.items():
+        if column not in rows:
+            continue
+        score = report.labels.setdefault(column, LabelScore())
+        flags = rows[column].fillna(0).to_numpy() > 0
+        edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        fired = np.array(
+            [epoch_seconds(a.timestamp) for a in alerts if a.alert_type in alert_types]
+        )
+        inside = (fired[:, None] >= times[starts][None, :] - tolerance_s) & (
+            fired[:, None] <= times[ends][None, :] + tolerance_s
+        )
+        score.episodes += len(starts)
+        score.detected += int(inside.any(axis=0).sum())
+        score.alerts += len(fired)
+        score.matched += int(inside.any(axis=1).sum())
+
+
+def replay_trip(
+    engine: DetectionEngine, rows: pd.DataFrame, tolerance_minutes: float = 5.0
+) -> ReplayReport:
+    """Replay one trip's rows through ``engine`` and score its alerts."""
+    report = ReplayReport()
+    rows = rows.sort_values("timestamp", kind="stable")
+    observations, valid = _observations(rows)
+    report.skipped_rows = int((~valid).sum())
+    if not observations:
+        return report
+    rows = rows[valid]
+    first = observations[0]
+    engine.heartbeats = engine.new_heartbeat_monitor(epoch_seconds(first.timestamp))
+    # Scoring the whole trip at once is far cheaper than one call per row
+    scores = engine.anomaly_scores(observations)
+    alerts: List[AlertPayload] = []
+    for obs, score in zip(observations, scores.tolist()):
+        alerts.extend(engine.expire_heartbeats(epoch_seconds(obs.timestamp)))
+        alerts.extend(engine.process_observation(obs, score))
+    engine.analyzer.forget(first.tourist_id, first.trip_id)
+    engine.trip_features.forget(first.tourist_id, first.trip_id)
+    engine.store.forget(first.tourist_id, first.trip_id)  # type: ignore[attr-defined]
+
+    report.trips = 1
+    report.observations = len(observations)
+    report.alerts.update(a.alert_type for a in alerts)
+    _score_labels(report, rows, alerts, tolerance_minutes * 60.0)
+    return report
+
+
+def load_trips(
+    trip_ids: Optional[Sequence[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_rows: int = 500_000,
+) -> pd.DataFrame:
+    """Historical rows of some trips (None: all), from the dataset (or the legacy CSV)."""
+    source = store.history_source()
+    flt = ExportFilter(
+        start=start, end=end, trip_ids=frozenset(trip_ids) if trip_ids is not None else None
+    )
+    chunks = (
+        iter_rows(source, flt, chunk_rows)
+        if isinstance(source, Path)
+        else iter_dataset_rows(source, flt, chunk_rows)
+    )
+    frames = list(chunks)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def replay_shard(
+    engine: DetectionEngine, rows: pd.DataFrame, tolerance_minutes: float = 5.0
+) -> ReplayReport:
+    """Replay every trip in ``rows``."""
+    report = ReplayReport()
+    if rows.empty:
+        return report
+    for _, trip_rows in rows.groupby(["tourist_id", "trip_id"], sort=False):
+        report.merge(replay_trip(engine, trip_rows, tolerance_minutes))
+    return report
+
+
+def plan_shards(trip_rows: pd.Series, shards: int) -> List[List[str]]:
+    """Split trips (trip_id -> row count) into shards of similar row counts."""
+    loads = [0] * shards
+    planned: List[List[str]] = [[] for _ in range(shards)]
+    for trip_id, count in trip_rows.sort_values(ascending=False).items():
+        target = loads.index(min(loads))
+        planned[target].append(str(trip_id))
+        loads[target] += int(count)
+    return [shard for shard in planned if shard]
+
+
+# Engine of the current worker process, built once by _init_worker
+_worker_engine: Optional[DetectionEngine] = None
+
+
+def _init_worker(overrides: Dict[str, str], model_path: Optional[Path]) -> None:
+    global _worker_engine
+    _worker_engine = build_engine(overrides, model_path)
+
+
+def _run_shard(rows: pd.DataFrame, tolerance_minutes: float) -> ReplayReport:
+    assert _worker_engine is not None
+    return replay_shard(_worker_engine, rows, tolerance_minutes)
+
+
+def run_replay(
+    overrides: Optional[Dict[str, str]] = None,
+    model_path: Optional[Path] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    trip_ids: Optional[Sequence[str]] = None,
+    workers: Optional[int] = None,
+    tolerance_minutes: float = 5.0,
+) -> ReplayReport:
+    """Replay historical observations and report alerts against the labels.
+
+    Args:
+        overrides: Setting name -> value, applied on top of the environment
+        model_path: Joblib anomaly model to use instead of the current one
+        start: Replay rows at or after this time only
+        end: Replay rows before this time only
+        trip_ids: Replay only these trips
+        workers: Worker processes (default: CPU count); 1 replays in-process
+        tolerance_minutes: How far outside a labelled episode an alert may
+            fire and still match it
+    """
+    began = time.perf_counter()
+    overrides = dict(overrides or {})
+    report = ReplayReport()
+    rows = load_trips(trip_ids, start, end)
+    if rows.empty:
+        return report
+    rows["trip_id"] = rows["trip_id"].astype(str)
+    positions = rows.groupby("trip_id", sort=False).indices
+    counts = pd.Series({trip_id: len(index) for trip_id, index in positions.items()})
+    workers = max(1, workers or os.cpu_count() or 1)
+    # A few shards per worker keeps the pool busy when trip sizes vary
+    shards = [
+        rows.take(np.concatenate([positions[trip_id] for trip_id in shard]))
+        for shard in plan_shards(counts, workers * 4 if workers > 1 else 1)
+    ]
+    del rows
+
+    if workers == 1:
+        engine = build_engine(overrides, model_path)
+        for shard in shards:
+            report.merge(replay_shard(engine, shard, tolerance_minutes))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(overrides, model_path)
+        ) as pool:
+            futures = [pool.submit(_run_shard, shard, tolerance_minutes) for shard in shards]
+            for future in futures:
+                report.merge(future.result())
+    report.seconds = time.perf_counter() - began
+    return report
@@ -0,0 +1,261 @@
+"""Precomputed multi-band risk raster for TourGuard ML Engine.
+
+An offline job rasterizes the danger zones plus alert density into a grid
+over the operating region, one band per time-of-day bucket. The arrays are
+stored as ``.npy`` files and memory-mapped at startup so point and segment
+risk become array lookups. A parallel zone-index grid records which zone
+fully covers each cell; only cells on a zone boundary (or where zones
+overlap) still need an exact polygon check.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import geometry
+
+from .grid import GridSpec, publish_array, publish_json
+from .time_buckets import TIME_BUCKETS, time_bucket
+from .zone_schedule import ZoneScheduleTable, schedule_key
+
+logger = logging.getLogger(__name__)
+
+RISK_WEIGHTS = {"high": 1.0, "medium": 0.66, "low": 0.33}
+
+# zone_index cell values besides a zone's position in the registry
+NO_ZONE = -1
+BOUNDARY = -2
+
+RISK_FILE = "risk.npy"
+ZONE_INDEX_FILE = "zone_index.npy"
+META_FILE = "meta.json"
+
+ZoneRecord = Tuple[geometry.base.BaseGeometry, str, str, str]
+
+
+def zones_fingerprint(
+    zones: Sequence[ZoneRecord], properties: Optional[Sequence[Dict]] = None
+) -> str:
+    """Content hash of a zone registry, used to detect a stale raster.
+
+    Zone schedules in ``properties`` are hashed too; unscheduled registries
+    hash the same with or without them.
+    """
+    digest = hashlib.sha1()
+    for i, (polygon, name, risk, _) in enumerate(zones):
+        digest.update(shapely.to_wkb(polygon))
+        digest.update(f"{name}|{risk}".encode())
+        schedule = schedule_key(properties[i]) if properties is not None else None
+        if schedule is not None:
+            digest.update(schedule.encode())
+    return digest.hexdigest()
+
+
+def risk_level_for(value: float) -> str:
+    """Map a coarse 0-1 cell risk to a RiskLevel."""
+    if value >= RISK_WEIGHTS["high"] - 1e-6:
+        return "high"
+    if value >= RISK_WEIGHTS["medium"] - 1e-6:
+        return "medium"
+    return "low"
+
+
+class RiskRaster:
+    """Memory-mapped risk bands plus a zone-coverage grid."""
+
+    def __init__(self, risk: np.ndarray, zone_index: np.ndarray, meta: Dict) -> None:
+        self.risk = risk
+        self.zone_index = zone_index
+        self.meta = meta
+        self.bands: Tuple[str, ...] = tuple(meta["bands"])
+        self.grid = GridSpec.from_meta(meta)
+        self.zones_fingerprint: str = meta["zones_fingerprint"]
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["RiskRaster"]:
+        meta_path = directory / META_FILE
+        if not meta_path.exists():
+            return None
+        with meta_path.open() as f:
+            meta = json.load(f)
+        risk = np.load(directory / RISK_FILE, mmap_mode="r")
+        zone_index = np.load(directory / ZONE_INDEX_FILE, mmap_mode="r")
+        return cls(risk, zone_index, meta)
+
+    def zone_at(self, lat: float, lng: float) -> int:
+        """Zone index fully covering the cell, ``NO_ZONE`` or ``BOUNDARY``.
+
+        The grid covers every zone, so points outside it are ``NO_ZONE``.
+        """
+        rows, cols, inside = self.grid.cells(np.array([lat]), np.array([lng]))
+        if not inside[0]:
+            return NO_ZONE
+        return int(self.zone_index[rows[0], cols[0]])
+
+    def point_risk(self, lat: float, lng: float, bucket: Optional[str] = None) -> float:
+        rows, cols, inside = self.grid.cells(np.array([lat]), np.array([lng]))
+        if not inside[0]:
+            return 0.0
+        return float(self._band_values(bucket, rows, cols)[0])
+
+    def path_risk(self, coords: np.ndarray, bucket: Optional[str] = None) -> float:
+        """Maximum cell risk along a (lng, lat) polyline."""
+        rows, cols, inside, _ = self.grid.sample_path(coords)
+        if not inside.any():
+            return 0.0
+        return float(self._band_values(bucket, rows[inside], cols[inside]).max())
+
+    def path_touches_zones(self, coords: np.ndarray) -> bool:
+        """Whether any cell along a (lng, lat) polyline overlaps a zone."""
+        rows, cols, inside, _ = self.grid.sample_path(coords)
+        if not inside.any():
+            return False
+        return bool((self.zone_index[rows[inside], cols[inside]] != NO_ZONE).any())
+
+    def _band_values(self, bucket: Optional[str], rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        # Unknown or missing bucket -> most conservative band
+        if bucket in self.bands:
+            return self.risk[self.bands.index(bucket), rows, cols]
+        return self.risk[:, rows, cols].max(axis=0)
+
+
+def load_risk_raster(directory: Path, fingerprint: str) -> Optional[RiskRaster]:
+    """Load the raster if present and built from the registry with ``fingerprint``."""
+    raster = RiskRaster.load(directory)
+    if raster is None:
+        return None
+    if raster.zones_fingerprint != fingerprint:
+        logger.warning("Risk raster at %s is stale for the loaded zones; ignoring it", directory)
+        return None
+    return raster
+
+
+def build_risk_raster(
+    zones: Sequence[ZoneRecord],
+    alerts: pd.DataFrame,
+    out_dir: Path,
+    cell_size_m: float = 100.0,
+    incident_weight: float = 0.5,
+    padding_cells: int = 2,
+    schedules: Optional[ZoneScheduleTable] = None,
+    fingerprint: Optional[str] = None,
+) -> RiskRaster:
+    """Rasterize zones and alert density and publish the arrays to ``out_dir``.
+
+    Args:
+        zones: Danger-zone registry as (polygon, name, risk_level, advisory)
+        alerts: Alert rows with ``lat``, ``lng`` and ``timestamp`` columns
+        out_dir: Directory the ``.npy`` files and metadata are written to
+        cell_size_m: Approximate cell edge length in metres
+        incident_weight: Risk contributed by the densest incident cell
+        padding_cells: Empty cells added around the covered region
+        schedules: Zone schedules; each band then carries the zone's risk in
+            that bucket, and nothing where the zone is never active
+        fingerprint: Registry fingerprint to record; computed from ``zones``
+            (without schedules) when omitted
+
+    Returns:
+        The freshly built raster, memory-mapped from ``out_dir``
+    """
+    if len(alerts.index):
+        alerts = alerts.dropna(subset=["lat", "lng", "timestamp"])
+    bounds = [polygon.bounds for polygon, _, _, _ in zones]
+    if len(alerts.index):
+        bounds.append(
+            (alerts["lng"].min(), alerts["lat"].min(), alerts["lng"].max(), alerts["lat"].max())
+        )
+    if not bounds:
+        raise ValueError("Nothing to rasterize: no danger zones or located alerts")
+    bbox = np.array(bounds, dtype=float)
+    grid = GridSpec.covering(
+        bbox[:, 0].min(),
+        bbox[:, 1].min(),
+        bbox[:, 2].max(),
+        bbox[:, 3].max(),
+        cell_size_m,
+        padding_cells,
+    )
+    min_lng, min_lat = grid.min_lng, grid.min_lat
+    cell_lng, cell_lat = grid.cell_lng, grid.cell_lat
+    rows, cols = grid.rows, grid.cols
+
+    zone_index = np.full((rows, cols), NO_ZONE, dtype=np.int32)
+    zone_risk = np.zeros((len(TIME_BUCKETS), rows, cols), dtype=np.float32)
+    for i, (polygon, _, risk_level, _) in enumerate(zones):
+        x0, y0, x1, y1 = polygon.bounds
+        c0 = max(int((x0 - min_lng) // cell_lng), 0)
+        r0 = max(int((y0 - min_lat) // cell_lat), 0)
+        c1 = min(int((x1 - min_lng) // cell_lng), cols - 1)
+        r1 = min(int((y1 - min_lat) // cell_lat), rows - 1)
+        rr, cc = np.meshgrid(np.arange(r0, r1 + 1), np.arange(c0, c1 + 1), indexing="ij")
+        cell_boxes = shapely.box(
+            min_lng + cc * cell_lng,
+            min_lat + rr * cell_lat,
+            min_lng + (cc + 1) * cell_lng,
+            min_lat + (rr + 1) * cell_lat,
+        )
+        shapely.prepare(polygon)
+        touched = shapely.intersects(polygon, cell_boxes)
+        interior = shapely.contains_properly(polygon, cell_boxes)
+
+        window = zone_index[r0:r1 + 1, c0:c1 + 1]
+        claim = interior & (window == NO_ZONE)
+        window[touched & ~claim] = BOUNDARY
+        window[claim] = i
+        if schedules is not None and schedules.scheduled[i]:
+            levels = [schedules.bucket_risks(i)[bucket] for bucket in TIME_BUCKETS]
+        else:
+            levels = [risk_level] * len(TIME_BUCKETS)
+        for b, level in enumerate(levels):
+            if level is None:
+                continue
+            weight = RISK_WEIGHTS.get(level, RISK_WEIGHTS["low"])
+            risk_window = zone_risk[b, r0:r1 + 1, c0:c1 + 1]
+            risk_window[touched] = np.maximum(risk_window[touched], weight)
+
+    incidents = np.zeros((len(TIME_BUCKETS), rows, cols), dtype=np.float32)
+    if len(alerts.index):
+        hours = pd.to_datetime(alerts["timestamp"], utc=True, format="ISO8601").dt.hour
+        buckets = hours.map(time_bucket).to_numpy()
+        lat_edges, lng_edges = grid.edges()
+        for b, name in enumerate(TIME_BUCKETS):
+            subset = alerts[buckets == name]
+            counts, _, _ = np.histogram2d(
+                subset["lat"].to_numpy(), subset["lng"].to_numpy(), bins=[lat_edges, lng_edges]
+            )
+            incidents[b] = _box_blur(counts)
+        peak = incidents.max()
+        if peak > 0:
+            incidents *= incident_weight / peak
+
+    risk = np.clip(zone_risk + incidents, 0.0, 1.0).astype(np.float32)
+    meta = {
+        "bands": list(TIME_BUCKETS),
+        **grid.to_meta(),
+        "cell_size_m": cell_size_m,
+        "zones": len(zones),
+        "alerts": int(len(alerts.index)),
+        "zones_fingerprint": fingerprint or zones_fingerprint(zones),
+        "built_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    publish_array(out_dir / RISK_FILE, risk)
+    publish_array(out_dir / ZONE_INDEX_FILE, zone_index)
+    publish_json(out_dir / META_FILE, meta)
+    return RiskRaster.load(out_dir)  # type: ignore[return-value]
+
+
+def _box_blur(counts: np.ndarray) -> np.ndarray:
+    padded = np.pad(counts, 1)
+    rows, cols = counts.shape
+    return sum(
+        padded[dr:dr + rows, dc:dc + cols] for dr in range(3) for dc in range(3)
+    ) / 9.0
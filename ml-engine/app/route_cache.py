@@ -0,0 +1,89 @@
+"""Bounded LRU/TTL cache for route safety scores.
+
+Route scores only depend on the (quantized) route geometry, the danger-zone
+registry version and the time-of-day bucket, so repeated requests between the
+same attractions can be answered without re-running the geometry checks.
+"""
+from __future__ import annotations
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class RouteScoreCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters.
+
+    Entries are tagged with the danger-zone registry version they were
+    computed against; the whole cache is dropped as soon as a lookup sees a
+    newer version, so stale scores never outlive a zone update.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 900.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._zones_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, zones_version: int) -> Optional[Any]:
+        """Return a copy of the cached value, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            self._sync_version(zones_version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if now - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: Hashable, value: Any, zones_version: int) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._sync_version(zones_version)
+            self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "zones_version": self._zones_version if self._zones_version is not None else -1,
+            }
+
+    def _sync_version(self, zones_version: int) -> None:
+        # Caller holds the lock.
+        if self._zones_version != zones_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._zones_version = zones_version
@@ -1,20 +1,50 @@
 """Route safety scoring module for TourGuard ML Engine.
 
 Calculates safety scores for route segments based on:
-- Danger zone intersections
-- Historical incident data
+- Metres travelled inside danger zones (exposure-weighted)
+- Historical incident density (see ``incident_density``)
 - Time-of-day factors
 """
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Tuple
+from typing import Dict, Hashable, List, Optional, Tuple
 
+import numpy as np
 from shapely.geometry import LineString, Point
 from shapely import geometry
 
+from .config import get_settings
 from .schemas import RoutePoint, DangerZone
 from .detection import engine
+from .exposure import exposure_calculator, risk_model_from_settings
+from .route_cache import RouteScoreCache
+from .time_buckets import TIME_BUCKET_FACTORS, time_bucket
+
+
+settings = get_settings()
+
+risk_model = risk_model_from_settings()
+
+route_cache = RouteScoreCache(
+    max_entries=settings.route_cache_max_entries,
+    ttl_seconds=settings.route_cache_ttl_seconds,
+)
+
+
+def _route_cache_key(
+    kind: str,
+    route_points: List[RoutePoint],
+    timestamp: datetime | None,
+) -> Hashable:
+    scale = 10 ** settings.route_cache_precision
+    coords = tuple(
+        (int(round(p.lat * scale)), int(round(p.lng * scale))) for p in route_points
+    )
+    # The schedule slot fixes both the time bucket and the active zone set
+    slot = engine.zone_schedules.slot_for(timestamp)
+    surface = engine.incident_surface
+    return (kind, slot, surface.version if surface else None, coords)
 
 
 def score_route_segment(
@@ -26,6 +56,11 @@ def score_route_segment(
 ) -> float:
     """Score a single route segment for safety.
     
+    Each danger zone deducts points in proportion to the metres of the
+    segment lying inside it (see ``exposure.RiskPerMetreModel``), and the
+    peak historical incident density along the segment deducts up to
+    ``incident_max_penalty`` more.
+    
     Args:
         lat1, lng1: Start point coordinates
         lat2, lng2: End point coordinates
@@ -34,28 +69,49 @@ def score_route_segment(
     Returns:
         Safety score from 0 (very unsafe) to 100 (very safe)
     """
+    coords = np.array([(lng1, lat1), (lng2, lat2)])
+    slot = engine.zone_schedules.slot_for(timestamp)
+    exposure = _segment_exposure(coords, engine.zones_version, slot)[0]
+    return _score_from_exposure(exposure, timestamp, _incident_density(coords)[0])
+
+
+def _segment_exposure(
+    coords: np.ndarray, zones_version: int, slot: Optional[int]
+) -> List[Dict[int, float]]:
+    """Exposure against zones active in ``slot``, from the tiles the route crosses."""
+    seg_idx, zone_ids, zone_geoms = engine.zone_tiles.path_pairs(coords, slot)
+    return exposure_calculator.pair_exposure(coords, seg_idx, zone_ids, zone_geoms, zones_version)
+
+
+def _incident_density(coords: np.ndarray) -> np.ndarray:
+    surface = engine.incident_surface
+    if surface is None:
+        return np.zeros(max(len(coords) - 1, 0))
+    return surface.segment_density(coords)
+
+
+def _score_from_exposure(
+    exposure: Dict[int, float],
+    timestamp: datetime | None,
+    incident_density: float = 0.0,
+) -> float:
     base_score = 100.0
     
-    # Create line segment
-    segment = LineString([(lng1, lat1), (lng2, lat2)])
+    # Historical incidents near the segment
+    base_score -= settings.incident_max_penalty * incident_density
     
-    # Check intersection with danger zones
-    for polygon, name, risk_level, advisory in engine._danger_polygons:
-        if segment.intersects(polygon):
-            # Calculate penalty based on risk level
-            if risk_level == "high":
-                base_score -= 45
-            elif risk_level == "medium":
-                base_score -= 30
-            else:  # low
-                base_score -= 15
+    # Deduct per-metre penalties for every zone the segment runs through, at
+    # the zone's risk level for the time of travel
+    slot = engine.zone_schedules.slot_for(timestamp)
+    for zone_idx, metres in exposure.items():
+        risk_level = engine.zone_schedules.risk_level(zone_idx, slot)
+        base_score -= risk_model.penalty(risk_level, metres)
     
     # Apply time-of-day adjustment
     if timestamp:
-        hour = timestamp.hour
         # Nighttime penalty (8 PM to 6 AM)
-        if hour >= 20 or hour < 6:
-            base_score *= 0.85  # 15% penalty for nighttime
+        if time_bucket(timestamp.hour) == "night":
+            base_score *= TIME_BUCKET_FACTORS["night"]  # 15% penalty for nighttime
     
     return max(0.0, min(100.0, base_score))
 
@@ -63,18 +119,25 @@ def score_route_segment(
 def get_route_safety_impact(
     route_points: List[RoutePoint],
     danger_zones: List[Tuple[geometry.Polygon, str, str, str]] | None = None,
+    timestamp: datetime | None = None,
 ) -> dict[str, any]:
     """Calculate overall safety impact of a route.
     
     Args:
         route_points: List of coordinates forming the route
         danger_zones: Optional list of danger zone polygons
+        timestamp: Time of travel; registry zones are counted only if active
+            then, at their risk level for that time
         
     Returns:
         Dictionary with safety metrics including zones crossed
     """
+    cache_key = None
     if danger_zones is None:
-        danger_zones = engine._danger_polygons
+        cache_key = _route_cache_key("impact", route_points, timestamp)
+        cached = route_cache.get(cache_key, engine.zones_version)
+        if cached is not None:
+            return cached
     
     zones_crossed = []
     total_high_risk = 0
@@ -93,6 +156,17 @@ def get_route_safety_impact(
     
     coords = [(p.lng, p.lat) for p in route_points]
     route_line = LineString(coords)
+    if danger_zones is None:
+        # Registry zones active at the time of travel, from the tiles the
+        # route crosses, at their risk level for that time
+        slot = engine.zone_schedules.slot_for(timestamp)
+        _, zone_ids, _ = engine.zone_tiles.path_pairs(np.asarray(coords), slot)
+        danger_zones = []
+        for i in np.unique(zone_ids).tolist():
+            polygon, name, _, advisory = engine._danger_polygons[i]
+            danger_zones.append(
+                (polygon, name, engine.zone_schedules.risk_level(i, slot), advisory)
+            )
     
     # Check each danger zone
     seen_zones = set()
@@ -112,13 +186,16 @@ def get_route_safety_impact(
             else:
                 total_low_risk += 1
     
-    return {
+    impact = {
         "zones_crossed": zones_crossed,
         "high_risk_count": total_high_risk,
         "medium_risk_count": total_medium_risk,
         "low_risk_count": total_low_risk,
         "total_zones": len(zones_crossed),
     }
+    if cache_key is not None:
+        route_cache.put(cache_key, impact, engine.zones_version)
+    return impact
 
 
 def calculate_time_adjusted_safety(
@@ -134,20 +211,9 @@ def calculate_time_adjusted_safety(
     Returns:
         Adjusted safety score
     """
-    # Nighttime hours (8 PM to 6 AM) get penalty
-    if hour_of_day >= 20 or hour_of_day < 6:
-        return base_score * 0.85
-    
-    # Early morning (6 AM to 8 AM) slight penalty
-    if 6 <= hour_of_day < 8:
-        return base_score * 0.95
-    
-    # Late evening (6 PM to 8 PM) slight penalty
-    if 18 <= hour_of_day < 20:
-        return base_score * 0.95
-    
-    # Daytime hours - no adjustment
-    return base_score
+    # Nighttime gets the largest penalty, early morning and late evening a
+    # slight one, daytime hours no adjustment
+    return base_score * TIME_BUCKET_FACTORS[time_bucket(hour_of_day)]
 
 
 def calculate_overall_route_score(
@@ -166,13 +232,34 @@ def calculate_overall_route_score(
     if len(route_points) < 2:
         return 100.0, {"zones_crossed": [], "segments_analyzed": 0}
     
-    # Score each segment
-    segment_scores = []
-    for i in range(len(route_points) - 1):
-        p1 = route_points[i]
-        p2 = route_points[i + 1]
-        score = score_route_segment(p1.lat, p1.lng, p2.lat, p2.lng, timestamp)
-        segment_scores.append(score)
+    zones_version = engine.zones_version
+    cache_key = _route_cache_key("score", route_points, timestamp)
+    cached = route_cache.get(cache_key, zones_version)
+    if cached is not None:
+        return cached
+    
+    # Score each segment from metres travelled inside each zone, with all
+    # segment/zone intersections computed in one bulk pass
+    coords = np.array([(p.lng, p.lat) for p in route_points])
+    bucket = time_bucket(timestamp.hour) if timestamp else None
+    raster = engine.risk_raster
+    if raster is not None and not raster.path_touches_zones(coords):
+        # Coarse raster lookup proves no zone is anywhere near the route
+        exposures: List[Dict[int, float]] = [{} for _ in range(len(coords) - 1)]
+    else:
+        exposures = _segment_exposure(
+            coords, zones_version, engine.zone_schedules.slot_for(timestamp)
+        )
+    densities = _incident_density(coords)
+    segment_scores = [
+        _score_from_exposure(e, timestamp, d) for e, d in zip(exposures, densities.tolist())
+    ]
+    
+    zone_exposure_m: Dict[str, float] = {}
+    for exposure in exposures:
+        for zone_idx, metres in exposure.items():
+            name = engine._danger_polygons[zone_idx][1]
+            zone_exposure_m[name] = zone_exposure_m.get(name, 0.0) + metres
     
     # Calculate weighted average (favor worst segments)
     if segment_scores:
@@ -184,7 +271,7 @@ def calculate_overall_route_score(
         overall_score = 100.0
     
     # Get danger zone impact
-    impact = get_route_safety_impact(route_points)
+    impact = get_route_safety_impact(route_points, timestamp=timestamp)
     
     # Apply time adjustment if provided
     if timestamp:
@@ -198,6 +285,13 @@ def calculate_overall_route_score(
         "high_risk_zones": impact["high_risk_count"],
         "medium_risk_zones": impact["medium_risk_count"],
         "low_risk_zones": impact["low_risk_count"],
+        "zone_exposure_m": zone_exposure_m,
+        "max_incident_density": float(densities.max()) if len(densities) else 0.0,
     }
+    if engine.incident_surface is not None:
+        metadata["incident_density_version"] = engine.incident_surface.version
+    if raster is not None:
+        metadata["coarse_risk"] = raster.path_risk(coords, bucket)
     
+    route_cache.put(cache_key, (overall_score, metadata), zones_version)
     return overall_score, metadata
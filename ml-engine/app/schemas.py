@@ -50,10 +50,25 @@ class AlertPayload(BaseModel):
     tourist_id: str
     trip_id: str
     timestamp: datetime
-    alert_type: Literal["route_deviation", "long_inactivity", "danger_zone", "anomaly"]
+    alert_type: Literal[
+        "route_deviation",
+        "long_inactivity",
+        "signal_loss",
+        "danger_zone",
+        "zone_approach",
+        "anomaly",
+        # Raised by the behavioral analyzer
+        "accuracy_degradation",
+        "location_jump",
+        "erratic_movement",
+        "high_speed",
+        "backtracking",
+    ]
     severity: RiskLevel
     message: str
     metadata: Dict[str, str] = Field(default_factory=dict)
+    lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    lng: Optional[float] = Field(default=None, ge=-180, le=180)
 
     @computed_field
     def recipients(self) -> List[str]:
@@ -77,6 +92,25 @@ class AlertHistoryResponse(BaseModel):
     alerts: List[AlertPayload]
 
 
+class TrajectoryResponse(BaseModel):
+    """Trip points simplified for drawing at one map zoom, as parallel arrays."""
+    tourist_id: str
+    trip_id: str
+    zoom: int
+    level: int  # zoom the points were simplified for; lower than zoom if capped
+    total_points: int  # full-resolution points in the window
+    timestamp: List[datetime]
+    lat: List[float]
+    lng: List[float]
+
+
+class TripCloseResponse(BaseModel):
+    trip_id: str
+    tourist_ids: List[str]
+    observations_archived: int
+    alerts_archived: int
+
+
 class GeofenceStatus(BaseModel):
     tourist_id: str
     trip_id: str
@@ -89,6 +123,78 @@ class GeofenceStatus(BaseModel):
     last_updated: datetime
 
 
+class NearbyZone(BaseModel):
+    """A danger zone near a queried location."""
+    name: str
+    risk_level: RiskLevel
+    advisory: Optional[str] = None
+    distance_m: float = Field(ge=0)
+    inside: bool
+
+
+class NearbyZonesResponse(BaseModel):
+    lat: float
+    lng: float
+    radius_m: Optional[float] = None
+    zones: List[NearbyZone]
+
+
+class NearbyTourist(BaseModel):
+    """A tourist's latest known position near a queried location."""
+    tourist_id: str
+    trip_id: str
+    lat: float
+    lng: float
+    distance_m: float = Field(ge=0)
+    last_updated: datetime
+    inside_zone: bool
+    zone_name: Optional[str] = None
+
+
+class NearbyTouristsResponse(BaseModel):
+    lat: float
+    lng: float
+    radius_m: Optional[float] = None
+    tourists: List[NearbyTourist]
+
+
+class HeatmapTile(BaseModel):
+    """Sparse cell counts of one heatmap tile.
+
+    Cell ``i`` is row ``i // bins`` (from the tile's north edge) and column
+    ``i % bins``.
+    """
+    layer: str
+    z: int
+    x: int
+    y: int
+    bins: int
+    cells: List[int]
+    counts: List[int]
+
+
+class GeofenceCheckRequest(BaseModel):
+    """Points to check against the zones, as parallel coordinate arrays."""
+    lat: List[float]
+    lng: List[float]
+    timestamp: Optional[datetime] = None  # check against zones active then
+    max_distance_m: Optional[float] = Field(default=None, gt=0)
+
+
+class GeofenceZone(BaseModel):
+    name: str
+    risk_level: RiskLevel
+    advisory: Optional[str] = None
+
+
+class GeofenceCheckResponse(BaseModel):
+    """Per-point results as parallel arrays; zone references index ``zones``."""
+    zones: List[GeofenceZone]
+    inside: List[int]  # -1 when outside every zone
+    nearest: List[int]  # -1 when no zone is within max_distance_m
+    distance_m: List[Optional[float]]
+
+
 # Safe Route Planning Models
 
 class RoutePreferences(BaseModel):
@@ -165,6 +271,7 @@ class SafetyAdvisoryRequest(BaseModel):
     time_of_day: Optional[str] = None
     user_profile: Dict[str, bool] = Field(default_factory=dict)
     current_risk_level: Optional[RiskLevel] = None
+    timestamp: Optional[datetime] = None  # assess risk and zones for then; default now (UTC)
 
 
 class SafetyAdvisoryResponse(BaseModel):
@@ -0,0 +1,217 @@
+"""Shadow scoring of candidate anomaly models on live traffic.
+
+A sampled fraction of observations is handed, together with the live
+model's score and the observation's trip features, to a bounded queue. On
+the request path that is one random draw, a deque append and a few plain
+counter updates, with no locks or thread wake-ups; when the queue is full
+the sample is dropped and counted rather than blocking. A background
+thread wakes every ``flush_seconds``, drains the queue in batches, scores
+each batch with every candidate in one call (a model call costs about the
+same for one row as for hundreds) and folds the results into per-candidate
+statistics: a score histogram, mean and spread, the anomaly rate, and how
+often the candidate's verdict disagrees with the live model's.
+"""
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .schemas import Observation
+from .training import ModelBundle, load_model
+
+logger = logging.getLogger(__name__)
+
+# An observation's TRIP_FEATURES values, if known
+TripRow = Optional[Tuple[float, ...]]
+
+# Histogram of decision_function scores; values outside are clipped into the end bins
+HISTOGRAM_EDGES = np.linspace(-0.5, 0.5, 41)
+
+
+class _ScoreStats:
+    """Running distribution of one model's scores."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.anomalies = 0
+        self.disagreements = 0
+        self.abs_diff = 0.0
+        self.histogram = np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=np.int64)
+
+    def add(self, scores: np.ndarray, threshold: float, live: Optional[np.ndarray] = None) -> None:
+        flagged = scores < threshold
+        self.count += len(scores)
+        self.total += float(scores.sum())
+        self.total_sq += float(np.square(scores).sum())
+        self.anomalies += int(flagged.sum())
+        clipped = np.clip(scores, HISTOGRAM_EDGES[0], HISTOGRAM_EDGES[-1])
+        self.histogram += np.histogram(clipped, HISTOGRAM_EDGES)[0]
+        if live is not None:
+            self.disagreements += int((flagged != (live < threshold)).sum())
+            self.abs_diff += float(np.abs(scores - live).sum())
+
+    def summary(self, compared: bool) -> Dict[str, object]:
+        n = self.count
+        mean = self.total / n if n else None
+        summary: Dict[str, object] = {
+            "scored": n,
+            "mean_score": mean,
+            "std_score": (
+                float(np.sqrt(max(self.total_sq / n - mean * mean, 0.0))) if n else None
+            ),
+            "anomaly_rate": self.anomalies / n if n else None,
+            "histogram": self.histogram.tolist(),
+        }
+        if compared:
+            summary["disagreement_rate"] = self.disagreements / n if n else None
+            summary["mean_abs_score_diff"] = self.abs_diff / n if n else None
+        return summary
+
+
+class ShadowScorer:
+    """Scores sampled observations with candidate models off the request path."""
+
+    def __init__(
+        self,
+        candidates: Dict[str, ModelBundle],
+        sample_rate: float = 0.1,
+        queue_size: int = 10_000,
+        batch_size: int = 256,
+        threshold: float = -0.1,
+        flush_seconds: float = 1.0,
+    ) -> None:
+        self.candidates = candidates
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.threshold = threshold
+        self.flush_seconds = flush_seconds
+        # Appends and pops on a deque are atomic, so no lock is needed here
+        self._queue: "deque[Tuple[Observation, float, TripRow]]" = deque()
+        self._random = random.Random()
+        self._live = _ScoreStats()
+        self._stats = {name: _ScoreStats() for name in candidates}
+        # Request-path counters, updated without a lock so submit never waits
+        # on the scorer thread; concurrent submits may rarely lose an update
+        self._sampled = 0
+        self._dropped = 0
+        self._submit_ns = 0
+        self._submit_max_ns = 0
+        self._submits = 0
+        # Guards the score statistics, shared by the scorer thread and stats()
+        self._score_seconds = 0.0
+        self._batches = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_paths(cls, paths: Sequence[Path], **kwargs) -> "ShadowScorer":
+        """Load candidates (with their sidecars); each is named after its file's stem."""
+        return cls({Path(p).stem: load_model(Path(p)) for p in paths}, **kwargs)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(
+        self, obs: Observation, live_score: float, trip_features: TripRow = None
+    ) -> None:
+        """Maybe queue ``obs`` for shadow scoring; never blocks.
+
+        ``trip_features`` are the observation's rolling trip features, for
+        candidates that use them.
+        """
+        began = time.perf_counter_ns()
+        if self._thread is not None and self._random.random() < self.sample_rate:
+            if len(self._queue) < self.queue_size:
+                self._queue.append((obs, live_score, trip_features))
+                self._sampled += 1
+            else:
+                self._dropped += 1
+        self._submits += 1
+        elapsed = time.perf_counter_ns() - began
+        self._submit_ns += elapsed
+        if elapsed > self._submit_max_ns:
+            self._submit_max_ns = elapsed
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            self.drain()
+
+    def drain(self) -> None:
+        """Score everything queued so far."""
+        while self._queue:
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            try:
+                self._score(batch)
+            except Exception:  # a broken candidate must not kill the thread
+                logger.exception("Shadow scoring failed")
+
+    def _score(self, batch: List[Tuple[Observation, float, TripRow]]) -> None:
+        observations = [obs for obs, _, _ in batch]
+        live = np.array([score for _, score, _ in batch], dtype=float)
+        trip_features = None
+        if all(row is not None for _, _, row in batch):
+            trip_features = [row for _, _, row in batch]
+        began = time.perf_counter()
+        # Candidates may use different feature sets, so each builds its own input
+        scores = {
+            name: bundle.scores(observations, trip_features)
+            for name, bundle in self.candidates.items()
+        }
+        elapsed = time.perf_counter() - began
+        with self._lock:
+            self._live.add(live, self.threshold)
+            for name, values in scores.items():
+                self._stats[name].add(values, self.threshold, live)
+            self._score_seconds += elapsed
+            self._batches += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            scored = self._live.count
+            return {
+                "running": self.running,
+                "sample_rate": self.sample_rate,
+                "threshold": self.threshold,
+                "observations": self._submits,
+                "sampled": self._sampled,
+                "dropped": self._dropped,
+                "queued": len(self._queue),
+                "submit_us_mean": self._submit_ns / self._submits / 1e3 if self._submits else None,
+                "submit_us_max": self._submit_max_ns / 1e3,
+                "batches": self._batches,
+                "score_us_per_observation": (
+                    self._score_seconds / scored * 1e6 if scored else None
+                ),
+                "histogram_edges": HISTOGRAM_EDGES.tolist(),
+                "live": self._live.summary(compared=False),
+                "candidates": {
+                    name: stats.summary(compared=True) for name, stats in self._stats.items()
+                },
+            }
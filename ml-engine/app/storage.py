@@ -1,32 +1,76 @@
 from __future__ import annotations
 
-from collections import defaultdict, deque
+import logging
+from collections import defaultdict
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Deque, Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Union
 
 import pandas as pd
 
 from .config import get_settings
+from .heatmap import DensityTiles
+from .observation_dataset import ObservationDataset
 from .schemas import AlertPayload, GeofenceStatus, Observation, RoutePlan
+from .tourist_index import TouristGridIndex
+from .trajectory_store import TrajectoryStore
+
+logger = logging.getLogger(__name__)
 
 
 class ObservationStore:
-    """Persists observations and route plans in-memory plus CSV snapshots."""
+    """Persists observations and route plans in-memory plus on-disk datasets."""
 
     def __init__(self) -> None:
-        self._obs: Dict[str, Deque[Observation]] = defaultdict(lambda: deque(maxlen=5000))
         self._routes: Dict[str, RoutePlan] = {}
         self._alerts: Dict[str, List[AlertPayload]] = defaultdict(list)
-        self._last_alert_at: Dict[Tuple[str, str], datetime] = {}
+        # Trip -> alert type -> when it last fired; each type is rate-limited
+        # on its own, so a low-severity warning never holds back another alert
+        self._last_alert_at: Dict[str, Dict[str, datetime]] = defaultdict(dict)
         self._geofence_status: Dict[str, GeofenceStatus] = {}
         self.settings = get_settings()
         self.settings.data_dir.mkdir(parents=True, exist_ok=True)
+        # Latest position per trip, for nearby-tourist queries
+        self.positions: TouristGridIndex[GeofenceStatus] = TouristGridIndex(
+            self.settings.tourist_index_cell_m
+        )
+        # Per-trip observation history: recent points in memory, the rest
+        # in compressed on-disk segments
+        self.trajectories = TrajectoryStore(
+            self.settings.trajectory_dir,
+            self.settings.trajectory_segment_points,
+            self.settings.trajectory_segment_minutes,
+            self.settings.trajectory_lod_pixel_tolerance,
+        )
+        # Historical observations for training and analytics
+        self.observations = ObservationDataset(
+            self.settings.observations_dataset_dir,
+            self.settings.observations_region_cell_deg,
+            self.settings.observations_row_group_rows,
+            self.settings.observations_flush_rows,
+            self.settings.observations_flush_seconds,
+        )
+        if self.settings.historical_dataset.exists() and not self.observations.migrated():
+            logger.warning(
+                "Historical observations are still read from %s; run `python -m app.cli "
+                "dataset migrate` to move them into %s",
+                self.settings.historical_dataset,
+                self.settings.observations_dataset_dir,
+            )
+        # Admin-panel density tiles, updated as positions and alerts arrive
+        self.heatmaps: Dict[str, DensityTiles] = {
+            layer: DensityTiles(layer, self.settings.heatmap_zooms, self.settings.heatmap_tile_bins)
+            for layer in ("tourists", "alerts")
+        }
 
     def add_observation(self, obs: Observation) -> None:
-        key = self._trip_key(obs.tourist_id, obs.trip_id)
-        self._obs[key].append(obs)
-        self._append_to_csv(obs)
+        self.trajectories.append(obs)
+        # Live rows go wherever history is read from, so they are never hidden
+        source = self.history_source()
+        if isinstance(source, Path):
+            self._append_to_csv(source, self._history_row(obs))
+        else:
+            self.observations.append(self._history_row(obs))
 
     def add_route(self, plan: RoutePlan) -> None:
         key = self._trip_key(plan.tourist_id, plan.trip_id)
@@ -36,15 +80,18 @@ class ObservationStore:
         return self._routes.get(self._trip_key(tourist_id, trip_id))
 
     def get_observations(self, tourist_id: str, trip_id: str) -> List[Observation]:
-        return list(self._obs.get(self._trip_key(tourist_id, trip_id), []))
+        return list(self.trajectories.read(tourist_id, trip_id))
 
     def record_alert(self, alert: AlertPayload) -> bool:
         key = self._trip_key(alert.tourist_id, alert.trip_id)
         now = alert.timestamp
-        if not self._can_alert(key, now):
+        if not self._can_alert(key, alert.alert_type, now):
             return False
         self._alerts[key].append(alert)
-        self._last_alert_at[key] = now
+        self._last_alert_at[key][alert.alert_type] = now
+        self._append_alert_to_csv(alert)
+        if alert.lat is not None and alert.lng is not None:
+            self.heatmaps["alerts"].add(alert.lat, alert.lng)
         return True
 
     def get_alerts(self, trip_id: str) -> List[AlertPayload]:
@@ -52,20 +99,76 @@ class ObservationStore:
 
     def update_geofence_status(self, status: GeofenceStatus) -> None:
         key = self._trip_key(status.tourist_id, status.trip_id)
+        previous = self._geofence_status.get(key)
         self._geofence_status[key] = status
+        self.positions.update(key, status.lat, status.lng, status)
+        self.heatmaps["tourists"].move(
+            (previous.lat, previous.lng) if previous is not None else None,
+            (status.lat, status.lng),
+        )
 
     def list_geofence_status(self) -> List[GeofenceStatus]:
         return list(self._geofence_status.values())
 
-    def load_dataframe(self) -> pd.DataFrame:
-        dataset = self.settings.historical_dataset
+    def evict_trip(self, tourist_id: str, trip_id: str) -> Dict[str, object]:
+        """Drop all in-memory state of a trip and return what was held."""
+        key = self._trip_key(tourist_id, trip_id)
+        status = self._geofence_status.pop(key, None)
+        if status is not None:
+            self.positions.remove(key)
+            self.heatmaps["tourists"].move((status.lat, status.lng), None)
+        self._last_alert_at.pop(key, None)
+        self.trajectories.seal(tourist_id, trip_id, release=True)
+        return {
+            "observation_count": self.trajectories.count(tourist_id, trip_id),
+            "route": self._routes.pop(key, None),
+            "alerts": self._alerts.pop(key, []),
+            "geofence_status": status,
+        }
+
+    def load_dataframe(
+        self,
+        columns: Optional[List[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> pd.DataFrame:
+        """Historical observations, optionally only some columns and ``[start, end)``.
+
+        Columns missing from the data are skipped rather than raising.
+        """
+        source = self.history_source()
+        if isinstance(source, ObservationDataset):
+            return source.read(columns, start, end)
+        # Not migrated yet: fall back to the legacy CSV (no time filtering)
+        dataset: Path = source
+        if dataset.exists():
+            if columns is None:
+                return pd.read_csv(dataset, parse_dates=["timestamp"])
+            # Columns missing from the file are skipped rather than raising
+            wanted = set(columns)
+            parse_dates = ["timestamp"] if "timestamp" in wanted else None
+            return pd.read_csv(dataset, usecols=lambda c: c in wanted, parse_dates=parse_dates)
+        return pd.DataFrame()
+
+    def history_source(self) -> Union[ObservationDataset, Path]:
+        """The observation dataset, or the legacy CSV until it is migrated.
+
+        Only an explicit ``dataset migrate`` switches sources; until then
+        live rows are appended to the CSV as well.
+        """
+        if self.settings.historical_dataset.exists() and not self.observations.migrated():
+            return self.settings.historical_dataset
+        return self.observations
+
+    def load_alerts_dataframe(self) -> pd.DataFrame:
+        dataset = self.settings.alerts_dataset
         if dataset.exists():
             return pd.read_csv(dataset, parse_dates=["timestamp"])
         return pd.DataFrame()
 
-    def _append_to_csv(self, obs: Observation) -> None:
-        dataset = self.settings.historical_dataset
-        row = {
+    @staticmethod
+    def _history_row(obs: Observation) -> Dict[str, object]:
+        return {
             "tourist_id": obs.tourist_id,
             "trip_id": obs.trip_id,
             "timestamp": obs.timestamp.isoformat(),
@@ -75,12 +178,28 @@ class ObservationStore:
             "accuracy_m": obs.accuracy_m,
             "battery_pct": obs.battery_pct,
         }
+
+    @staticmethod
+    def _append_to_csv(dataset: Path, row: Dict[str, object]) -> None:
         header = not dataset.exists()
-        df = pd.DataFrame([row])
-        df.to_csv(dataset, mode="a", header=header, index=False)
+        pd.DataFrame([row]).to_csv(dataset, mode="a", header=header, index=False)
+
+    def _append_alert_to_csv(self, alert: AlertPayload) -> None:
+        dataset = self.settings.alerts_dataset
+        row = {
+            "tourist_id": alert.tourist_id,
+            "trip_id": alert.trip_id,
+            "timestamp": alert.timestamp.isoformat(),
+            "alert_type": alert.alert_type,
+            "severity": alert.severity,
+            "lat": alert.lat,
+            "lng": alert.lng,
+            "message": alert.message,
+        }
+        self._append_to_csv(dataset, row)
 
-    def _can_alert(self, key: Tuple[str, str], now: datetime) -> bool:
-        last = self._last_alert_at.get(key)
+    def _can_alert(self, key: str, alert_type: str, now: datetime) -> bool:
+        last = self._last_alert_at.get(key, {}).get(alert_type)
         if last is None:
             return True
         buffer_minutes = self.settings.alert_buffer_minutes
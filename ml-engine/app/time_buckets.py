@@ -0,0 +1,32 @@
+"""Time-of-day buckets shared by route scoring and the risk raster."""
+from __future__ import annotations
+
+from typing import Optional
+
+
+TIME_BUCKETS = ("night", "early_morning", "day", "evening")
+
+# Multipliers applied by route_scoring.calculate_time_adjusted_safety
+TIME_BUCKET_FACTORS = {
+    "night": 0.85,  # 8 PM to 6 AM
+    "early_morning": 0.95,  # 6 AM to 8 AM
+    "evening": 0.95,  # 6 PM to 8 PM
+    "day": 1.0,
+}
+
+
+def time_bucket(hour_of_day: Optional[int]) -> str:
+    """Map an hour (0-23) to the time-of-day bucket used for scoring.
+
+    Scores only vary between buckets, never within one, which makes the
+    bucket a safe component of cache keys and raster band indexes.
+    """
+    if hour_of_day is None:
+        return "none"
+    if hour_of_day >= 20 or hour_of_day < 6:
+        return "night"
+    if 6 <= hour_of_day < 8:
+        return "early_morning"
+    if 18 <= hour_of_day < 20:
+        return "evening"
+    return "day"
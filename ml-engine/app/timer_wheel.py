@@ -0,0 +1,114 @@
+"""Hierarchical timer wheel (Varghese & Lauck).
+
+Timers live in slot buckets on a stack of wheels: the innermost wheel holds
+timers due within its span at tick resolution, each outer wheel covers a
+span ``2**bits`` times wider at a coarser resolution. Scheduling, moving and
+cancelling a timer are O(1) dict operations. Advancing the clock visits one
+inner slot per tick and, when an inner wheel wraps, re-files the next outer
+slot's timers one level down, so expiry never scans timers that are not due.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from typing import Dict, Generic, Hashable, List, Sequence, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+class TimerWheel(Generic[K]):
+    """Keyed one-shot timers; rescheduling a key replaces its timer."""
+
+    def __init__(
+        self,
+        start: float,
+        tick_seconds: float = 1.0,
+        wheel_bits: Sequence[int] = (8, 6, 6, 6),
+    ) -> None:
+        self.tick_seconds = tick_seconds
+        self._bits = tuple(wheel_bits)
+        self._shifts = [sum(self._bits[:level]) for level in range(len(self._bits))]
+        self._wheels: List[List[Dict[K, Tuple[int, float]]]] = [
+            [{} for _ in range(1 << bits)] for bits in self._bits
+        ]
+        self._due: Dict[K, Tuple[int, float]] = {}
+        self._where: Dict[K, Dict[K, Tuple[int, float]]] = {}
+        self._now = self._ticks(start)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._where
+
+    def _ticks(self, t: float) -> int:
+        return math.ceil(t / self.tick_seconds)
+
+    def schedule(self, key: K, deadline: float) -> None:
+        """Fire ``key`` once the clock reaches ``deadline`` (seconds)."""
+        with self._lock:
+            self._remove(key)
+            self._file(key, (self._ticks(deadline), deadline))
+
+    def cancel(self, key: K) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def _remove(self, key: K) -> bool:
+        bucket = self._where.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        return True
+
+    def _file(self, key: K, entry: Tuple[int, float]) -> None:
+        ticks = entry[0]
+        delta = ticks - self._now
+        if delta <= 0:
+            bucket = self._due
+        else:
+            level = 0
+            top = len(self._bits) - 1
+            while level < top and delta >= 1 << (self._shifts[level] + self._bits[level]):
+                level += 1
+            mask = (1 << self._bits[level]) - 1
+            bucket = self._wheels[level][(ticks >> self._shifts[level]) & mask]
+        bucket[key] = entry
+        self._where[key] = bucket
+
+    def advance(self, now: float) -> List[Tuple[K, float]]:
+        """Move the clock to ``now``; returns expired (key, deadline) pairs."""
+        expired: List[Tuple[K, float]] = []
+        with self._lock:
+            self._collect(self._due, expired)
+            target = self._ticks(now)
+            while self._now < target:
+                if not self._where:
+                    self._now = target
+                    break
+                self._now += 1
+                self._cascade()
+                slot = self._now & ((1 << self._bits[0]) - 1)
+                self._collect(self._wheels[0][slot], expired)
+                # Cascaded timers falling due exactly now
+                self._collect(self._due, expired)
+        return expired
+
+    def _cascade(self) -> None:
+        # Outermost first, so re-filed timers can drop several levels at once
+        for level in range(len(self._bits) - 1, 0, -1):
+            if self._now & ((1 << self._shifts[level]) - 1):
+                continue
+            mask = (1 << self._bits[level]) - 1
+            bucket = self._wheels[level][(self._now >> self._shifts[level]) & mask]
+            entries = list(bucket.items())
+            bucket.clear()
+            for key, entry in entries:
+                self._file(key, entry)
+
+    def _collect(self, bucket: Dict[K, Tuple[int, float]], expired: List[Tuple[K, float]]) -> None:
+        for key, (_, deadline) in bucket.items():
+            del self._where[key]
+            expired.append((key, deadline))
+        bucket.clear()
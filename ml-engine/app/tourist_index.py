@@ -0,0 +1,118 @@
+"""Live spatial index of current tourist positions.
+
+Positions are bucketed into a uniform lat/lng grid keyed by integer cell
+coordinates. Each position update is an O(1) move between cell buckets, and
+radius or k-nearest queries only visit the cells around the query point, so
+they stay fast however many tourists are active.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from typing import Dict, Generic, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from .exposure import EARTH_RADIUS_M, METRES_PER_DEGREE
+
+T = TypeVar("T")
+Cell = Tuple[int, int]
+
+
+def haversine_m(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Great-circle distances in metres from one point to arrays of points."""
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = (
+        np.sin((lat2 - lat1) / 2.0) ** 2
+        + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2.0) ** 2
+    )
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class TouristGridIndex(Generic[T]):
+    """Grid-bucketed moving-object index holding one value per key."""
+
+    def __init__(self, cell_size_m: float = 250.0) -> None:
+        self.cell_size_m = cell_size_m
+        self._cell_deg = cell_size_m / METRES_PER_DEGREE
+        self._cells: Dict[Cell, Dict[str, None]] = {}
+        self._entries: Dict[str, Tuple[Cell, float, float, T]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _cell(self, lat: float, lng: float) -> Cell:
+        return (math.floor(lat / self._cell_deg), math.floor(lng / self._cell_deg))
+
+    def update(self, key: str, lat: float, lng: float, value: T) -> None:
+        """Insert or move ``key`` to a new position."""
+        cell = self._cell(lat, lng)
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None and previous[0] != cell:
+                self._discard(key, previous[0])
+            if previous is None or previous[0] != cell:
+                self._cells.setdefault(cell, {})[key] = None
+            self._entries[key] = (cell, lat, lng, value)
+
+    def remove(self, key: str) -> Optional[T]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._discard(key, entry[0])
+            return entry[3]
+
+    def _discard(self, key: str, cell: Cell) -> None:
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def within(self, lat: float, lng: float, radius_m: float) -> List[Tuple[str, float, T]]:
+        """Entries within ``radius_m`` as (key, distance_m, value), nearest first."""
+        d_lat = radius_m / METRES_PER_DEGREE
+        d_lng = d_lat / max(math.cos(math.radians(lat)), 1e-6)
+        row0, col0 = self._cell(lat - d_lat, lng - d_lng)
+        row1, col1 = self._cell(lat + d_lat, lng + d_lng)
+        with self._lock:
+            if (row1 - row0 + 1) * (col1 - col0 + 1) > len(self._cells):
+                # Window covers more cells than are occupied: walk occupied ones
+                keys = [
+                    k for (r, c), bucket in self._cells.items()
+                    if row0 <= r <= row1 and col0 <= c <= col1 for k in bucket
+                ]
+            else:
+                keys = [
+                    k
+                    for r in range(row0, row1 + 1)
+                    for c in range(col0, col1 + 1)
+                    for k in self._cells.get((r, c), ())
+                ]
+            entries = [self._entries[k] for k in keys]
+        if not entries:
+            return []
+        lats = np.fromiter((e[1] for e in entries), dtype=float, count=len(entries))
+        lngs = np.fromiter((e[2] for e in entries), dtype=float, count=len(entries))
+        distances = haversine_m(lat, lng, lats, lngs)
+        close = np.flatnonzero(distances <= radius_m)
+        order = close[np.argsort(distances[close], kind="stable")]
+        return [(keys[i], float(distances[i]), entries[i][3]) for i in order.tolist()]
+
+    def nearest(
+        self, lat: float, lng: float, k: int = 1, max_radius_m: Optional[float] = None
+    ) -> List[Tuple[str, float, T]]:
+        """The ``k`` nearest entries as (key, distance_m, value), nearest first."""
+        if k <= 0 or not len(self):
+            return []
+        limit = max_radius_m if max_radius_m is not None else 2.0e7  # half the globe
+        radius = min(self.cell_size_m, limit)
+        while True:
+            found = self.within(lat, lng, radius)
+            # Anything outside the searched radius is further than everything found
+            if len(found) >= k or radius >= limit or len(found) == len(self):
+                return found[:k]
+            radius = min(radius * 4, limit)
@@ -1,44 +1,233 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import json
+import math
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Sequence
 
 import joblib
 import numpy as np
 import pandas as pd
+import sklearn
 from sklearn.ensemble import IsolationForest
 
 from .config import get_settings
-from .schemas import TrainResponse
+from .schemas import Observation, RoutePlan, TrainResponse
 from .storage import store
+from .trip_archive import TripArchive
+from .trip_features import (
+    TRIP_FEATURE_INDEX,
+    TRIP_FEATURES,
+    TRIP_SOURCE_COLUMNS,
+    RouteLookup,
+    frame_trip_features,
+    has_trip_features,
+)
 
 
 settings = get_settings()
 
+# Features of models saved without a sidecar
+FEATURE_COLUMNS = ["speed_mps", "accuracy_m", "battery_pct"]
+# Features of a model trained from scratch
+DEFAULT_FEATURES = FEATURE_COLUMNS + list(TRIP_FEATURES)
+LABEL_COLUMNS = ["label_route_deviation", "label_inactivity", "label_danger"]
+DEFAULT_MODEL_PARAMS: Dict[str, object] = {"n_estimators": 200, "contamination": 0.05}
+# decision_function scores below this raise an anomaly alert
+ANOMALY_THRESHOLD = -0.1
+# Stand-in for missing values, e.g. an unknown battery level
+MISSING_VALUE = 50.0
+
+
+def _hour_angle(timestamp: datetime) -> float:
+    # UTC hour, as in frame_features: the dataset keeps timestamps in UTC only,
+    # and naive timestamps are taken as UTC as in epoch_seconds
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return 2 * math.pi * (timestamp.hour + timestamp.minute / 60) / 24
+
+
+# Model inputs computed from a live observation
+OBSERVATION_FEATURES: Dict[str, Callable[[Observation], float]] = {
+    "speed_mps": lambda o: o.speed_mps,
+    "accuracy_m": lambda o: o.accuracy_m,
+    "battery_pct": lambda o: o.battery_pct or MISSING_VALUE,
+    "hour_sin": lambda o: math.sin(_hour_angle(o.timestamp)),
+    "hour_cos": lambda o: math.cos(_hour_angle(o.timestamp)),
+}
+# Features derived from the timestamp rather than read from a column
+TIME_FEATURES = ("hour_sin", "hour_cos")
+
+
+def source_columns(features: Sequence[str]) -> List[str]:
+    """Dataset columns needed to compute ``features``."""
+    columns = [f for f in features if f not in TIME_FEATURES and f not in TRIP_FEATURE_INDEX]
+    if has_trip_features(features):
+        columns += [c for c in TRIP_SOURCE_COLUMNS if c not in columns]
+    elif any(f in TIME_FEATURES for f in features):
+        columns.append("timestamp")
+    return columns
+
+
+def archived_routes(archive_dir: Optional[Path] = None) -> RouteLookup:
+    """Route lookup for training: live trips from the store, closed ones from their archive."""
+    archive = TripArchive(archive_dir or settings.trip_archive_dir)
+
+    def lookup(tourist_id: str, trip_id: str) -> Optional[RoutePlan]:
+        route = store.get_route(tourist_id, trip_id)
+        if route is None:
+            archived = archive.load(tourist_id, trip_id)
+            route = archived.route if archived else None
+        return route
+
+    return lookup
+
+
+def frame_features(
+    frame: pd.DataFrame, features: Sequence[str], routes: Optional[RouteLookup] = None
+) -> np.ndarray:
+    """Model input for historical rows, matching ``observation_features``.
+
+    Trip features are computed by replaying each trip's rows in time order
+    (see ``app/trip_features.py``); ``routes`` supplies planned routes. When
+    ``frame`` already has every trip-feature column, those are used instead.
+    """
+    trip = None
+    if has_trip_features(features):
+        if all(name in frame for name in TRIP_FEATURES):
+            trip = frame[list(TRIP_FEATURES)].to_numpy(dtype=float)
+        else:
+            trip = frame_trip_features(frame, settings.trip_feature_window, routes)
+    columns = []
+    for name in features:
+        if trip is not None and name in TRIP_FEATURE_INDEX:
+            columns.append(trip[:, TRIP_FEATURE_INDEX[name]])
+        elif name in TIME_FEATURES:
+            timestamps = pd.to_datetime(frame["timestamp"], utc=True, format="ISO8601")
+            angle = 2 * np.pi * (timestamps.dt.hour + timestamps.dt.minute / 60).to_numpy() / 24
+            columns.append(np.sin(angle) if name == "hour_sin" else np.cos(angle))
+        else:
+            values = frame[name] if name in frame else pd.Series(np.nan, index=frame.index)
+            values = pd.to_numeric(values, errors="coerce").fillna(MISSING_VALUE)
+            if name == "battery_pct":
+                values = values.replace(0.0, MISSING_VALUE)
+            columns.append(values.to_numpy(dtype=float))
+    return np.column_stack(columns) if columns else np.zeros((len(frame.index), 0))
+
+
+def observation_features(
+    observations: Sequence[Observation],
+    features: Sequence[str],
+    trip_features: Optional[Sequence[Sequence[float]]] = None,
+) -> np.ndarray:
+    """Model input for live observations.
+
+    ``trip_features`` holds each observation's ``TRIP_FEATURES`` values, from
+    a ``TripFeatureTracker``; it is required when ``features`` uses any.
+    """
+    if has_trip_features(features) and trip_features is None:
+        raise ValueError("Model uses trip features but none were given")
+    rows = []
+    for i, obs in enumerate(observations):
+        trip = trip_features[i] if trip_features is not None else ()
+        rows.append(
+            [
+                trip[TRIP_FEATURE_INDEX[name]] if name in TRIP_FEATURE_INDEX
+                else OBSERVATION_FEATURES[name](obs)
+                for name in features
+            ]
+        )
+    return np.array(rows, dtype=float).reshape(len(rows), len(features))
+
+
+def _training_frame(columns: Sequence[str] = FEATURE_COLUMNS) -> pd.DataFrame:
+    start = None
+    if settings.training_window_days is not None:
+        start = datetime.now(timezone.utc) - timedelta(days=settings.training_window_days)
+    return store.load_dataframe(columns=list(columns), start=start)
+
 
 @dataclass
 class ModelBundle:
     model: IsolationForest
     path: Optional[Path]
+    features: List[str] = field(default_factory=lambda: list(FEATURE_COLUMNS))
+    metadata: Dict[str, object] = field(default_factory=dict)
+
+    def scores(
+        self,
+        observations: Sequence[Observation],
+        trip_features: Optional[Sequence[Sequence[float]]] = None,
+    ) -> np.ndarray:
+        """decision_function scores of observations; lower is more anomalous."""
+        return self.model.decision_function(
+            observation_features(observations, self.features, trip_features)
+        )
+
+
+def metadata_path(model_path: Path) -> Path:
+    """The JSON sidecar describing a saved model."""
+    return model_path.with_suffix(".json")
+
+
+def read_metadata(model_path: Path) -> Dict[str, object]:
+    sidecar = metadata_path(model_path)
+    if not sidecar.exists():
+        return {}
+    return json.loads(sidecar.read_text())
+
+
+def load_model(model_path: Path) -> ModelBundle:
+    """Load a model and its sidecar; models without one use FEATURE_COLUMNS."""
+    metadata = read_metadata(model_path)
+    return ModelBundle(
+        model=joblib.load(model_path),
+        path=model_path,
+        features=list(metadata.get("features", FEATURE_COLUMNS)),  # type: ignore[arg-type]
+        metadata=metadata,
+    )
+
+
+def save_model(model: IsolationForest, model_path: Path, metadata: Dict[str, object]) -> None:
+    """Write a model and its JSON sidecar, each replaced atomically."""
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = model_path.with_name(model_path.name + ".tmp")
+    joblib.dump(model, tmp)
+    os.replace(tmp, model_path)
+    sidecar = metadata_path(model_path)
+    tmp = sidecar.with_name(sidecar.name + ".tmp")
+    tmp.write_text(json.dumps(metadata, indent=2, default=str))
+    os.replace(tmp, sidecar)
 
 
 def load_or_train_model(force_retrain: bool = False) -> ModelBundle:
     model_path = settings.model_dir / settings.model_filename
     if model_path.exists() and not force_retrain:
-        model = joblib.load(model_path)
-        return ModelBundle(model=model, path=model_path)
+        return load_model(model_path)
 
     return train_model(persist=True)
 
 
 def train_model(persist: bool) -> ModelBundle:
-    df = store.load_dataframe()
+    """Fit the anomaly model on stored history.
+
+    Hyperparameters and features are kept from the current model's sidecar
+    (e.g. chosen by ``python -m app.cli model sweep``), else the defaults.
+    """
+    model_path = settings.model_dir / settings.model_filename
+    current = read_metadata(model_path)
+    params = dict(current.get("params", DEFAULT_MODEL_PARAMS))  # type: ignore[arg-type]
+    feature_names = list(current.get("features", DEFAULT_FEATURES))  # type: ignore[arg-type]
+    df = _training_frame(source_columns(feature_names))
     if df.empty:
         # fabricate minimal frame with neutral rows to keep model shape valid
         df = pd.DataFrame(
             [
                 {
+                    "timestamp": "2024-01-01T12:00:00Z",
                     "speed_mps": 1.5,
                     "accuracy_m": 5.0,
                     "battery_pct": 80.0,
@@ -46,26 +235,33 @@ def train_model(persist: bool) -> ModelBundle:
             ]
         )
 
-    features = df[["speed_mps", "accuracy_m", "battery_pct"]].fillna(50.0).to_numpy()
-    model = IsolationForest(
-        n_estimators=200,
-        contamination=0.05,
-        random_state=settings.random_state,
-    )
+    features = frame_features(df, feature_names, archived_routes())
+    model = IsolationForest(random_state=settings.random_state, **params)
     model.fit(features)
 
-    model_path = settings.model_dir / settings.model_filename if persist else None
+    metadata: Dict[str, object] = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "model_type": "IsolationForest",
+        "sklearn_version": sklearn.__version__,
+        "params": params,
+        "features": feature_names,
+        "trip_feature_window": settings.trip_feature_window,
+        "training": {"rows": len(df.index)},
+    }
     if persist:
-        settings.model_dir.mkdir(parents=True, exist_ok=True)
-        joblib.dump(model, model_path)
+        save_model(model, model_path, metadata)
 
-    return ModelBundle(model=model, path=model_path)
+    return ModelBundle(
+        model=model,
+        path=model_path if persist else None,
+        features=feature_names,
+        metadata=metadata,
+    )
 
 
 def handle_training_request(retrain_with_new_data: bool, persist_model: bool) -> TrainResponse:
     bundle = train_model(persist=persist_model) if retrain_with_new_data else load_or_train_model()
-    df = store.load_dataframe()
-    trained_rows = len(df.index)
+    trained_rows = len(_training_frame(source_columns(bundle.features)).index)
 
     response = TrainResponse(
         trained_on_rows=trained_rows,
@@ -0,0 +1,121 @@
+"""Level-of-detail pyramid for trip trajectories.
+
+Each point gets the lowest Web Mercator zoom at which it must be drawn.
+Douglas-Peucker splitting gives every point a significance: its distance
+from the simplified line at the moment it was kept, capped by its parent's
+so the levels nest. A point is needed at zoom ``z`` once that distance
+exceeds ``pixel_tolerance`` pixels at ``z``, so level ``z`` of the pyramid
+is simply the points with ``min_zoom <= z``.
+
+Levels are computed once per segment as it is sealed and stored next to it
+as one byte per point, so the pyramid grows incrementally with the trip.
+Each segment's endpoints come out at zoom 0, two points per segment however
+straight the trip runs, so when even level 0 of a long trip is too large
+``select`` simplifies those points again as one line across the segment
+boundaries.
+"""
+from __future__ import annotations
+
+import math
+from typing import Tuple
+
+import numpy as np
+
+from .exposure import METRES_PER_DEGREE
+
+MAX_ZOOM = 22
+# Ground resolution at zoom 0 on the equator (metres per 256 px tile pixel)
+EQUATOR_METRES_PER_PIXEL = 156_543.03392
+
+
+def dp_significance(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Douglas-Peucker significance of every point of a polyline (metres).
+
+    Endpoints are infinitely significant; a point's value never exceeds
+    that of the point whose split exposed it.
+    """
+    n = len(x)
+    significance = np.zeros(n)
+    if n == 0:
+        return significance
+    significance[0] = significance[-1] = np.inf
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        i, j, cap = stack.pop()
+        if j - i < 2:
+            continue
+        dx, dy = x[j] - x[i], y[j] - y[i]
+        px, py = x[i + 1 : j] - x[i], y[i + 1 : j] - y[i]
+        length2 = dx * dx + dy * dy
+        if length2 > 0:
+            # Distance to the chord segment, not its infinite line
+            t = np.clip((px * dx + py * dy) / length2, 0.0, 1.0)
+            px, py = px - t * dx, py - t * dy
+        distances = np.hypot(px, py)
+        k = int(np.argmax(distances))
+        value = min(float(distances[k]), cap)
+        k += i + 1
+        significance[k] = value
+        stack.append((i, k, value))
+        stack.append((k, j, value))
+    return significance
+
+
+def min_zooms(lats: np.ndarray, lngs: np.ndarray, pixel_tolerance: float = 1.0) -> np.ndarray:
+    """Lowest zoom (uint8, 0..MAX_ZOOM) at which each point must be drawn."""
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    if not len(lats):
+        return np.zeros(0, dtype=np.uint8)
+    cos_lat = max(math.cos(math.radians(float(lats.mean()))), 1e-6)
+    x = (lngs - lngs[0]) * METRES_PER_DEGREE * cos_lat
+    y = (lats - lats[0]) * METRES_PER_DEGREE
+    significance = dp_significance(x, y)
+    # tolerance(z) = pixel_tolerance * EQUATOR_METRES_PER_PIXEL * cos_lat / 2**z
+    base = pixel_tolerance * EQUATOR_METRES_PER_PIXEL * cos_lat
+    with np.errstate(divide="ignore"):
+        zooms = np.ceil(np.log2(base / significance))
+    return np.clip(np.nan_to_num(zooms, nan=MAX_ZOOM, posinf=MAX_ZOOM), 0, MAX_ZOOM).astype(np.uint8)
+
+
+def level(min_zoom: np.ndarray, zoom: int, max_points: int) -> int:
+    """Highest zoom <= ``zoom`` whose level has at most ``max_points`` points.
+
+    Falls back to 0 when even the coarsest level is larger.
+    """
+    counts = np.cumsum(np.bincount(min_zoom, minlength=MAX_ZOOM + 1))
+    zoom = min(max(zoom, 0), MAX_ZOOM)
+    while zoom > 0 and counts[zoom] > max_points:
+        zoom -= 1
+    return zoom
+
+
+def select(
+    lats: np.ndarray,
+    lngs: np.ndarray,
+    min_zoom: np.ndarray,
+    zoom: int,
+    max_points: int,
+    pixel_tolerance: float = 1.0,
+) -> Tuple[int, np.ndarray]:
+    """Level used and indices of at most ``max_points`` points to draw at ``zoom``.
+
+    The highest level <= ``zoom`` that fits is used. If even level 0 does not
+    fit, its points are simplified again as one polyline, so segment
+    endpoints are no longer pinned, and stride-decimated if the result is
+    still too large. The first and last points are always kept.
+    """
+    n = len(min_zoom)
+    if n == 0:
+        return 0, np.zeros(0, dtype=np.int64)
+    min_zoom = min_zoom.copy()
+    min_zoom[0] = min_zoom[-1] = 0
+    used = level(min_zoom, zoom, max_points)
+    index = np.flatnonzero(min_zoom <= used)
+    if len(index) <= max_points:
+        return used, index
+    index = index[min_zooms(lats[index], lngs[index], pixel_tolerance) == 0]
+    if len(index) > max_points:
+        stride = np.linspace(0, len(index) - 1, max(max_points, 1)).round().astype(np.int64)
+        index = index[np.unique(stride)]
+    return 0, index
@@ -0,0 +1,296 @@
+"""Tiered per-trip trajectory storage.
+
+Observations first land in a trip's open segment in memory (the hot tier).
+A segment is sealed once it reaches ``segment_points`` observations or the
+next observation falls in a later ``segment_minutes`` partition. Sealing
+writes it to disk as an immutable compressed block (see
+``trajectory_codec``), which makes up the warm tier. Each
+trip directory keeps an index of its segments' min/max timestamps, so
+reading a time window opens only the segments that overlap it instead of
+scanning the trip's whole history. Sealing also stores the segment's
+level-of-detail zooms (see ``trajectory_lod``) for simplified reads.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import math
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Type, TypeVar
+
+import numpy as np
+from pydantic import BaseModel
+
+from .heartbeat import epoch_seconds
+from .schemas import Observation
+from .trajectory_codec import decode_block, decode_observations, encode_block
+from .trajectory_lod import min_zooms, select
+
+M = TypeVar("M", bound=BaseModel)
+
+INDEX_FILE = "index.json"
+# Gzipped JSON segments written before the binary codec; still readable
+LEGACY_SEGMENT_SUFFIX = ".json.gz"
+
+ARRAY_COLUMNS = ("lat", "lng", "speed_mps", "accuracy_m", "battery_pct", "heading_deg")
+
+# Repeated on every row; stored once per file instead
+_SHARED_FIELDS = {"tourist_id", "trip_id", "recipients"}
+
+
+def to_columns(models: Sequence[BaseModel]) -> Dict[str, list]:
+    """Column-wise JSON-ready dump of models, without their trip keys."""
+    rows = [m.model_dump(mode="json", exclude=_SHARED_FIELDS) for m in models]
+    names = list(rows[0]) if rows else []
+    return {name: [row[name] for row in rows] for name in names}
+
+
+def from_columns(model: Type[M], columns: Dict[str, list], **shared: str) -> List[M]:
+    names = list(columns)
+    return [
+        model.model_validate({**dict(zip(names, values)), **shared})
+        for values in zip(*columns.values())
+    ]
+
+
+def _segment_block(path: Path) -> bytes:
+    """A sealed segment as a codec block, converting a legacy JSON segment."""
+    if not path.name.endswith(LEGACY_SEGMENT_SUFFIX):
+        return path.read_bytes()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        payload = json.load(f)
+    shared = {"tourist_id": payload["tourist_id"], "trip_id": payload["trip_id"]}
+    return encode_block(from_columns(Observation, payload["observations"], **shared))
+
+
+class _Trip:
+    __slots__ = ("directory", "index", "open", "partition")
+
+    def __init__(self, directory: Path, index: List[Dict]) -> None:
+        self.directory = directory
+        self.index = index
+        self.open: List[Observation] = []
+        self.partition: Optional[int] = None
+
+
+class TrajectoryStore:
+    """Per-trip observation segments with a min/max timestamp index."""
+
+    def __init__(
+        self,
+        directory: Path,
+        segment_points: int = 512,
+        segment_minutes: float = 60.0,
+        lod_pixel_tolerance: float = 1.0,
+    ) -> None:
+        self.directory = directory
+        self.segment_points = segment_points
+        self.segment_seconds = segment_minutes * 60.0
+        self.lod_pixel_tolerance = lod_pixel_tolerance
+        self._trips: Dict[str, _Trip] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(tourist_id: str, trip_id: str) -> str:
+        return f"{tourist_id}::{trip_id}"
+
+    def _load(self, key: str) -> _Trip:
+        directory = self.directory / hashlib.sha1(key.encode()).hexdigest()
+        index_path = directory / INDEX_FILE
+        index = json.loads(index_path.read_text()) if index_path.exists() else []
+        return _Trip(directory, index)
+
+    def _trip(self, key: str) -> _Trip:
+        trip = self._trips.get(key)
+        if trip is None:
+            trip = self._trips[key] = self._load(key)
+        return trip
+
+    def _view(self, key: str) -> _Trip:
+        # Reads of trips not being written (e.g. closed ones) are not cached
+        return self._trips.get(key) or self._load(key)
+
+    def append(self, obs: Observation) -> None:
+        key = self._key(obs.tourist_id, obs.trip_id)
+        partition = math.floor(epoch_seconds(obs.timestamp) / self.segment_seconds)
+        with self._lock:
+            trip = self._trip(key)
+            if trip.open and (
+                len(trip.open) >= self.segment_points or partition > trip.partition
+            ):
+                self._seal(trip)
+            trip.open.append(obs)
+            if trip.partition is None or partition > trip.partition:
+                trip.partition = partition
+
+    def _seal(self, trip: _Trip) -> None:
+        if not trip.open:
+            return
+        observations, trip.open, trip.partition = trip.open, [], None
+        times = [epoch_seconds(o.timestamp) for o in observations]
+        name = f"{len(trip.index):06d}"
+        trip.directory.mkdir(parents=True, exist_ok=True)
+        (trip.directory / f"{name}.tgb").write_bytes(encode_block(observations))
+        zooms = min_zooms(
+            np.array([o.lat for o in observations]),
+            np.array([o.lng for o in observations]),
+            self.lod_pixel_tolerance,
+        )
+        (trip.directory / f"{name}.lod").write_bytes(zooms.tobytes())
+        trip.index.append(
+            {
+                "file": f"{name}.tgb",
+                "lod": f"{name}.lod",
+                "min_ts": min(times),
+                "max_ts": max(times),
+                "count": len(times),
+            }
+        )
+        tmp = trip.directory / (INDEX_FILE + ".tmp")
+        tmp.write_text(json.dumps(trip.index))
+        os.replace(tmp, trip.directory / INDEX_FILE)
+
+    def seal(self, tourist_id: str, trip_id: str, release: bool = False) -> None:
+        """Write a trip's open segment to disk; ``release`` also unloads its index."""
+        key = self._key(tourist_id, trip_id)
+        with self._lock:
+            trip = self._trips.get(key)
+            if trip is None:
+                return
+            self._seal(trip)
+            if release:
+                del self._trips[key]
+
+    def seal_all(self) -> None:
+        with self._lock:
+            for trip in self._trips.values():
+                self._seal(trip)
+
+    def count(self, tourist_id: str, trip_id: str) -> int:
+        """Observations stored for a trip, on disk and in memory."""
+        with self._lock:
+            trip = self._view(self._key(tourist_id, trip_id))
+            return sum(entry["count"] for entry in trip.index) + len(trip.open)
+
+    def latest(self, tourist_id: str, trip_id: str) -> Optional[float]:
+        """POSIX time of a trip's newest observation, or None if it has none."""
+        with self._lock:
+            trip = self._view(self._key(tourist_id, trip_id))
+            times = [entry["max_ts"] for entry in trip.index]
+            times.extend(epoch_seconds(o.timestamp) for o in trip.open)
+        return max(times) if times else None
+
+    def _window(
+        self, tourist_id: str, trip_id: str, start: Optional[datetime], end: Optional[datetime]
+    ) -> Tuple[float, float, List[Path], List[Observation]]:
+        lo = epoch_seconds(start) if start is not None else -math.inf
+        hi = epoch_seconds(end) if end is not None else math.inf
+        with self._lock:
+            trip = self._view(self._key(tourist_id, trip_id))
+            files = [
+                trip.directory / entry["file"]
+                for entry in trip.index
+                if entry["max_ts"] >= lo and entry["min_ts"] <= hi
+            ]
+            hot = list(trip.open)
+        return lo, hi, files, hot
+
+    def _blocks(
+        self, files: List[Path], hot: List[Observation], with_lod: bool = False
+    ) -> List[Dict[str, np.ndarray]]:
+        blocks = []
+        for path in files:
+            block = decode_block(_segment_block(path))
+            if with_lod:
+                lod = path.with_suffix(".lod")
+                if lod.exists():
+                    block["min_zoom"] = np.frombuffer(lod.read_bytes(), dtype=np.uint8)
+                else:
+                    # Sealed before level-of-detail zooms were stored
+                    block["min_zoom"] = min_zooms(block["lat"], block["lng"], self.lod_pixel_tolerance)
+            blocks.append(block)
+        if hot:
+            block = decode_block(encode_block(hot))
+            if with_lod:
+                block["min_zoom"] = min_zooms(block["lat"], block["lng"], self.lod_pixel_tolerance)
+            blocks.append(block)
+        return blocks
+
+    def read(
+        self,
+        tourist_id: str,
+        trip_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Iterator[Observation]:
+        """Stream a trip's observations in ``[start, end]``, segment by segment.
+
+        Only segments whose timestamp range overlaps the window are read.
+        Observations come in arrival order.
+        """
+        lo, hi, files, hot = self._window(tourist_id, trip_id, start, end)
+        for path in files:
+            for obs in decode_observations(_segment_block(path), tourist_id, trip_id):
+                if lo <= epoch_seconds(obs.timestamp) <= hi:
+                    yield obs
+        for obs in hot:
+            if lo <= epoch_seconds(obs.timestamp) <= hi:
+                yield obs
+
+    def read_arrays(
+        self,
+        tourist_id: str,
+        trip_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Dict[str, np.ndarray]:
+        """A trip's observations in ``[start, end]`` as column arrays.
+
+        Segments are decoded block-wise straight to arrays (see
+        ``trajectory_codec.decode_block``); ``timestamp`` is POSIX seconds.
+        """
+        lo, hi, files, hot = self._window(tourist_id, trip_id, start, end)
+        return self._concat(self._blocks(files, hot), lo, hi, ("timestamp",) + ARRAY_COLUMNS)
+
+    @staticmethod
+    def _concat(
+        blocks: List[Dict[str, np.ndarray]], lo: float, hi: float, names: Tuple[str, ...]
+    ) -> Dict[str, np.ndarray]:
+        if not blocks:
+            return {name: np.zeros(0) for name in names}
+        columns = {name: np.concatenate([block[name] for block in blocks]) for name in names}
+        columns["timestamp"] = columns["timestamp"] / 1000.0
+        keep = (columns["timestamp"] >= lo) & (columns["timestamp"] <= hi)
+        return {name: column[keep] for name, column in columns.items()}
+
+    def read_simplified(
+        self,
+        tourist_id: str,
+        trip_id: str,
+        zoom: int,
+        max_points: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Tuple[int, int, Dict[str, np.ndarray]]:
+        """The points of ``[start, end]`` needed to draw the trip at ``zoom``.
+
+        If that level holds more than ``max_points`` points, the next coarser
+        level that fits is used, and no more than ``max_points`` points are
+        ever returned (see ``trajectory_lod.select``). The window's first and
+        last points are always included. Returns (level used, points in
+        window, columns).
+        """
+        lo, hi, files, hot = self._window(tourist_id, trip_id, start, end)
+        columns = self._concat(
+            self._blocks(files, hot, with_lod=True), lo, hi, ("timestamp", "lat", "lng", "min_zoom")
+        )
+        total = len(columns["timestamp"])
+        min_zoom = columns.pop("min_zoom").astype(np.uint8)
+        used, keep = select(
+            columns["lat"], columns["lng"], min_zoom, zoom, max_points, self.lod_pixel_tolerance
+        )
+        return used, total, {name: column[keep] for name, column in columns.items()}
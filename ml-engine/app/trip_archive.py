@@ -0,0 +1,114 @@
+"""On-disk archives of closed trips, one gzipped JSON file per trip.
+
+Alerts are stored column-wise. Archives are read back lazily and the most
+recently read ones are cached. Kept apart from ``app/trips.py`` so offline
+jobs (replay, training) can read archived routes without the live engine.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .schemas import AlertPayload, GeofenceStatus, RoutePlan
+from .trajectory_store import from_columns, to_columns
+
+# 1: observations stored in the archive; 2: only their count (they stay in
+# the trajectory segments)
+ARCHIVE_VERSION = 2
+
+
+@dataclass
+class ArchivedTrip:
+    tourist_id: str
+    trip_id: str
+    closed_at: datetime
+    observation_count: int = 0
+    alerts: List[AlertPayload] = field(default_factory=list)
+    route: Optional[RoutePlan] = None
+    geofence_status: Optional[GeofenceStatus] = None
+
+
+class TripArchive:
+    """Directory of closed-trip archives, one gzipped JSON file per trip."""
+
+    def __init__(self, directory: Path, cache_size: int = 32) -> None:
+        self.directory = directory
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, ArchivedTrip]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, tourist_id: str, trip_id: str) -> Path:
+        digest = hashlib.sha1(f"{tourist_id}::{trip_id}".encode()).hexdigest()
+        return self.directory / f"{digest}.json.gz"
+
+    def save(self, trip: ArchivedTrip) -> Path:
+        """Write a trip, appending to its archive if it was closed before."""
+        previous = self.load(trip.tourist_id, trip.trip_id)
+        if previous is not None:
+            trip.alerts = previous.alerts + trip.alerts
+            trip.route = trip.route or previous.route
+            trip.geofence_status = trip.geofence_status or previous.geofence_status
+        payload = {
+            "version": ARCHIVE_VERSION,
+            "tourist_id": trip.tourist_id,
+            "trip_id": trip.trip_id,
+            "closed_at": trip.closed_at.isoformat(),
+            "observation_count": trip.observation_count,
+            "alerts": to_columns(trip.alerts),
+            "route": trip.route.model_dump(mode="json") if trip.route else None,
+            "geofence_status": (
+                trip.geofence_status.model_dump(mode="json") if trip.geofence_status else None
+            ),
+        }
+        path = self.path(trip.tourist_id, trip.trip_id)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp, path)
+        with self._lock:
+            self._cache.pop(path.name, None)
+        return path
+
+    def load(self, tourist_id: str, trip_id: str) -> Optional[ArchivedTrip]:
+        """Rehydrate an archived trip, or None if it was never archived."""
+        path = self.path(tourist_id, trip_id)
+        with self._lock:
+            cached = self._cache.get(path.name)
+            if cached is not None:
+                self._cache.move_to_end(path.name)
+                return cached
+        if not path.exists():
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+        shared = {"tourist_id": payload["tourist_id"], "trip_id": payload["trip_id"]}
+        route, status = payload["route"], payload["geofence_status"]
+        trip = ArchivedTrip(
+            closed_at=datetime.fromisoformat(payload["closed_at"]),
+            observation_count=_observation_count(payload),
+            alerts=from_columns(AlertPayload, payload["alerts"], **shared),
+            route=RoutePlan.model_validate(route) if route else None,
+            geofence_status=GeofenceStatus.model_validate(status) if status else None,
+            **shared,
+        )
+        with self._lock:
+            self._cache[path.name] = trip
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return trip
+
+
+def _observation_count(payload: Dict) -> int:
+    if payload.get("version", 1) < 2:
+        columns = payload.get("observations") or {}
+        return len(next(iter(columns.values()), []))
+    return payload["observation_count"]
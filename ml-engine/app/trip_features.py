@@ -0,0 +1,283 @@
+"""Streaming per-trip features for the anomaly model.
+
+Each trip keeps a small state: its previous fix, the bearing it was heading
+on, and a fixed-size window of recent fixes with Welford accumulators over
+it. A new fix updates that state in constant time, whatever the window size,
+and yields the trip features below; no history is re-read. Live scoring
+feeds observations through ``TripFeatureTracker`` as they arrive and
+training replays historical rows through the very same code
+(``frame_trip_features``), so the model sees identical inputs in both.
+
+``gap_s``
+    Seconds since the trip's previous fix (0 for the first).
+``speed_delta_mps``
+    Change in reported speed since the previous fix.
+``heading_change_deg``
+    Turn between the last two legs, 0-180. Legs shorter than
+    ``MIN_LEG_M`` are GPS jitter and keep the previous heading.
+``turn_mean_deg``
+    Mean heading change over the window.
+``speed_std_mps``
+    Standard deviation of speed over the window.
+``battery_drain_pct_h``
+    Battery drop per hour between the oldest and newest fix in the window
+    that reported a level (negative while charging).
+``route_distance_m``
+    Distance to the nearest point of the planned route (0 without a route).
+"""
+from __future__ import annotations
+
+import math
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from haversine import Unit, haversine
+
+from .heartbeat import epoch_seconds
+from .schemas import Observation, RoutePlan
+
+TRIP_FEATURES = (
+    "gap_s",
+    "speed_delta_mps",
+    "heading_change_deg",
+    "turn_mean_deg",
+    "speed_std_mps",
+    "battery_drain_pct_h",
+    "route_distance_m",
+)
+TRIP_FEATURE_INDEX = {name: i for i, name in enumerate(TRIP_FEATURES)}
+
+# Dataset columns frame_trip_features reads
+TRIP_SOURCE_COLUMNS = ("tourist_id", "trip_id", "timestamp", "lat", "lng", "speed_mps", "battery_pct")
+
+# Legs shorter than this don't change the heading
+MIN_LEG_M = 5.0
+# Battery readings closer together than this give no drain rate
+MIN_DRAIN_SPAN_S = 60.0
+
+_EARTH_RADIUS_M = 6_371_008.8
+
+
+def distance_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    return haversine(a, b, unit=Unit.METERS)
+
+
+def min_distance_to_route(obs: Observation, plan: RoutePlan) -> float:
+    observed = (obs.lat, obs.lng)
+    coords = [(p.lat, p.lng) for p in plan.points]
+    if len(coords) < 2:
+        return distance_m(observed, coords[0])
+    return min(distance_m(observed, pt) for pt in coords)
+
+
+def leg(lat1: float, lng1: float, lat2: float, lng2: float) -> Tuple[float, float]:
+    """Length in metres and initial bearing in degrees of a leg."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dlat, dlng = p2 - p1, math.radians(lng2 - lng1)
+    h = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlng / 2) ** 2
+    length = 2 * _EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(h)))
+    bearing = math.degrees(
+        math.atan2(
+            math.sin(dlng) * math.cos(p2),
+            math.cos(p1) * math.sin(p2) - math.sin(p1) * math.cos(p2) * math.cos(dlng),
+        )
+    )
+    return length, bearing
+
+
+class WindowedStats:
+    """Mean and variance of the last ``size`` values, O(1) per update.
+
+    Welford's update adds the new value and, once the window is full, the
+    reverse update removes the value that falls out.
+    """
+
+    __slots__ = ("values", "mean", "m2")
+
+    def __init__(self, size: int) -> None:
+        self.values: "deque[float]" = deque(maxlen=size)
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, value: float) -> None:
+        if len(self.values) == self.values.maxlen:
+            self._remove(self.values[0])
+        self.values.append(value)
+        n = len(self.values)
+        delta = value - self.mean
+        self.mean += delta / n
+        self.m2 += delta * (value - self.mean)
+
+    def _remove(self, value: float) -> None:
+        n = len(self.values)
+        if n == 1:
+            self.mean = self.m2 = 0.0
+            return
+        mean = (self.mean * n - value) / (n - 1)
+        self.m2 -= (value - self.mean) * (value - mean)
+        self.mean = mean
+
+    @property
+    def variance(self) -> float:
+        n = len(self.values)
+        return max(self.m2 / n, 0.0) if n else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class TripFeatureState:
+    """What one trip needs to compute its next features."""
+
+    __slots__ = ("time", "lat", "lng", "speed", "bearing", "speeds", "turns", "battery", "features")
+
+    def __init__(self, window: int) -> None:
+        self.time: Optional[float] = None
+        self.lat = self.lng = self.speed = 0.0
+        self.bearing: Optional[float] = None
+        self.speeds = WindowedStats(window)
+        self.turns = WindowedStats(window)
+        self.battery: "deque[Tuple[float, float]]" = deque(maxlen=window)
+        self.features: Tuple[float, ...] = ()
+
+    def update(
+        self,
+        time: float,
+        lat: float,
+        lng: float,
+        speed: float,
+        battery: Optional[float],
+        route_distance: Optional[float],
+    ) -> Tuple[float, ...]:
+        gap = speed_delta = turn = 0.0
+        if self.time is not None:
+            gap = time - self.time
+            speed_delta = speed - self.speed
+            length, bearing = leg(self.lat, self.lng, lat, lng)
+            if length >= MIN_LEG_M:
+                if self.bearing is not None:
+                    turn = abs((bearing - self.bearing + 180.0) % 360.0 - 180.0)
+                self.bearing = bearing
+        self.time, self.lat, self.lng, self.speed = time, lat, lng, speed
+        self.speeds.add(speed)
+        self.turns.add(turn)
+
+        # Missing and zero levels are both "unknown", as for the battery_pct feature
+        if battery:
+            self.battery.append((time, battery))
+        drain = 0.0
+        if len(self.battery) > 1:
+            (t0, b0), (t1, b1) = self.battery[0], self.battery[-1]
+            if t1 - t0 >= MIN_DRAIN_SPAN_S:
+                drain = (b0 - b1) * 3600.0 / (t1 - t0)
+
+        self.features = (
+            gap,
+            speed_delta,
+            turn,
+            self.turns.mean,
+            self.speeds.std,
+            drain,
+            route_distance or 0.0,
+        )
+        return self.features
+
+
+class TripFeatureTracker:
+    """Streaming trip features of every active trip, keyed like the analyzer."""
+
+    def __init__(self, window: int = 10) -> None:
+        self.window = window
+        self._trips: Dict[str, TripFeatureState] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._trips)
+
+    def observe(self, obs: Observation, route_distance: Optional[float] = None) -> Tuple[float, ...]:
+        """Fold ``obs`` into its trip's state and return its trip features."""
+        key = f"{obs.tourist_id}::{obs.trip_id}"
+        with self._lock:
+            state = self._trips.get(key)
+            if state is None:
+                state = self._trips[key] = TripFeatureState(self.window)
+            return state.update(
+                epoch_seconds(obs.timestamp),
+                obs.lat,
+                obs.lng,
+                obs.speed_mps,
+                obs.battery_pct,
+                route_distance,
+            )
+
+    def latest(self, tourist_id: str, trip_id: str) -> Optional[Tuple[float, ...]]:
+        """Features of the trip's most recent observation."""
+        state = self._trips.get(f"{tourist_id}::{trip_id}")
+        return state.features if state is not None else None
+
+    def forget(self, tourist_id: str, trip_id: str) -> None:
+        with self._lock:
+            self._trips.pop(f"{tourist_id}::{trip_id}", None)
+
+
+RouteLookup = Callable[[str, str], Optional[RoutePlan]]
+
+
+def frame_trip_features(
+    frame: pd.DataFrame, window: int = 10, routes: Optional[RouteLookup] = None
+) -> np.ndarray:
+    """Trip features of historical rows, one row per frame row, in frame order.
+
+    Rows are replayed per trip in timestamp order through the same state as
+    live scoring. ``routes`` looks up a trip's planned route (e.g. from the
+    trip archive); without one ``route_distance_m`` is 0.
+    """
+    n = len(frame.index)
+    out = np.zeros((n, len(TRIP_FEATURES)))
+    if n == 0:
+        return out
+
+    def column(name: str, fill: object) -> pd.Series:
+        return frame[name] if name in frame else pd.Series(fill, index=frame.index)
+
+    timestamps = pd.to_datetime(column("timestamp", pd.NaT), utc=True, format="ISO8601")
+    seconds = (timestamps - pd.Timestamp(0, tz="UTC")).dt.total_seconds().to_numpy()
+    lat = pd.to_numeric(column("lat", 0.0), errors="coerce").fillna(0.0).to_numpy(float)
+    lng = pd.to_numeric(column("lng", 0.0), errors="coerce").fillna(0.0).to_numpy(float)
+    speed = pd.to_numeric(column("speed_mps", 0.0), errors="coerce").fillna(0.0).to_numpy(float)
+    battery = pd.to_numeric(column("battery_pct", np.nan), errors="coerce").fillna(0.0).to_numpy(float)
+    tourists = column("tourist_id", "").astype(str).to_numpy()
+    trips = column("trip_id", "").astype(str).to_numpy()
+
+    order = np.lexsort((seconds, trips, tourists))
+    states: Dict[Tuple[str, str], TripFeatureState] = {}
+    plans: Dict[Tuple[str, str], Optional[List[Tuple[float, float]]]] = {}
+    for i in order.tolist():
+        if math.isnan(seconds[i]):
+            continue
+        key = (tourists[i], trips[i])
+        state = states.get(key)
+        if state is None:
+            # Trips come in one run each, so the previous one is done
+            states.clear()
+            plans.clear()
+            state = states[key] = TripFeatureState(window)
+            plan = routes(*key) if routes is not None else None
+            plans[key] = [(p.lat, p.lng) for p in plan.points] if plan else None
+        coords = plans[key]
+        route_distance = (
+            min(distance_m((lat[i], lng[i]), pt) for pt in coords) if coords else None
+        )
+        out[i] = state.update(seconds[i], lat[i], lng[i], speed[i], battery[i], route_distance)
+    return out
+
+
+def has_trip_features(features: Sequence[str]) -> bool:
+    return any(name in TRIP_FEATURE_INDEX for name in features)
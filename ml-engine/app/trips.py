@@ -0,0 +1,115 @@
+"""Trip lifecycle: explicit close, idle eviction and on-disk archives.
+
+A trip's state is spread over the observation store, the engine's heartbeat
+deadlines, the behavioural analyzer and the alert dispatcher. Closing a trip,
+either explicitly or once it has been idle for ``trip_idle_ttl_minutes``,
+evicts its state from all of them together and writes it to one gzipped JSON
+archive, with alerts stored column-wise; the trip's observations stay in the
+store's trajectory segments. Idle deadlines live
+on a timer wheel, so a sweep only visits trips that actually expired.
+Archives are read back lazily, when a query asks for a trip that is no
+longer in memory, and the most recently read ones are cached.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from .alerts import dispatcher
+from .behavioral_analyzer import get_behavioral_analyzer
+from .config import get_settings
+from .detection import engine
+from .storage import store
+from .timer_wheel import TimerWheel
+from .trip_archive import ArchivedTrip, TripArchive
+
+settings = get_settings()
+
+
+class TripManager:
+    """Tracks live trips and evicts them on close or after an idle TTL."""
+
+    def __init__(
+        self,
+        archive: TripArchive,
+        idle_ttl_seconds: float,
+        start: float,
+        tick_seconds: float = 60.0,
+    ) -> None:
+        self.archive = archive
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._idle: TimerWheel[tuple] = TimerWheel(start, tick_seconds)
+        # trip_id -> tourists with live state on that trip
+        self._live: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._idle)
+
+    def touch(self, tourist_id: str, trip_id: str, now: Optional[float] = None) -> None:
+        """Mark a trip active, pushing back its idle deadline."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._live.setdefault(trip_id, set()).add(tourist_id)
+            self._idle.schedule((tourist_id, trip_id), now + self.idle_ttl_seconds)
+
+    def tourists(self, trip_id: str) -> List[str]:
+        """Tourists with live state on a trip."""
+        with self._lock:
+            return sorted(self._live.get(trip_id, ()))
+
+    def close(self, trip_id: str) -> List[ArchivedTrip]:
+        """Evict and archive every tourist's state on a trip."""
+        with self._lock:
+            tourists = sorted(self._live.pop(trip_id, ()))
+            for tourist_id in tourists:
+                self._idle.cancel((tourist_id, trip_id))
+        # Archiving writes files; do it outside the lock so touch() never waits on disk
+        return [self._evict(tourist_id, trip_id, True) for tourist_id in tourists]
+
+    def sweep(self, now: float) -> List[ArchivedTrip]:
+        """Evict and archive trips idle since before ``now - idle_ttl``."""
+        evicted = []
+        with self._lock:
+            for (tourist_id, trip_id), _ in self._idle.advance(now):
+                tourists = self._live.get(trip_id)
+                if tourists is not None:
+                    tourists.discard(tourist_id)
+                    if not tourists:
+                        del self._live[trip_id]
+                evicted.append((tourist_id, trip_id, trip_id not in self._live))
+        return [self._evict(*key) for key in evicted]
+
+    def _evict(self, tourist_id: str, trip_id: str, trip_ended: bool) -> ArchivedTrip:
+        """Drop a tourist's state on a trip and archive it."""
+        state = store.evict_trip(tourist_id, trip_id)
+        engine.heartbeats.forget(f"{tourist_id}::{trip_id}")
+        engine.trip_features.forget(tourist_id, trip_id)
+        get_behavioral_analyzer().forget(tourist_id, trip_id)
+        # Alert history is kept per trip, so only once no tourist is left on it
+        if trip_ended:
+            dispatcher.forget(trip_id)
+        trip = ArchivedTrip(
+            tourist_id=tourist_id,
+            trip_id=trip_id,
+            closed_at=datetime.now(timezone.utc),
+            observation_count=state["observation_count"],
+            alerts=state["alerts"],
+            route=state["route"],
+            geofence_status=state["geofence_status"],
+        )
+        self.archive.save(trip)
+        return trip
+
+    def archived(self, tourist_id: str, trip_id: str) -> Optional[ArchivedTrip]:
+        return self.archive.load(tourist_id, trip_id)
+
+
+trips = TripManager(
+    TripArchive(settings.trip_archive_dir, settings.trip_archive_cache_size),
+    idle_ttl_seconds=settings.trip_idle_ttl_minutes * 60.0,
+    start=time.time(),
+    tick_seconds=settings.trip_sweep_interval_seconds,
+)
@@ -0,0 +1,311 @@
+"""Danger-zone sources: GeoJSON and the compiled binary zone-pack.
+
+A zone-pack holds, in one file, the zones' WKB geometries, a properties table
+and a packed Hilbert R-tree over their bounding boxes. ``ZonePack`` memory-maps
+the file read-only, so worker processes share its pages through the OS cache.
+Geometries are decoded lazily the first time a zone is accessed; point and
+bbox queries walk the serialized tree directly without building anything.
+
+File layout (little-endian)::
+
+    b"TGZPACK\\x01" | uint32 header length | JSON header | padding to 8 bytes
+    bboxes float64[n, 4] | wkb offsets uint64[n + 1] | tree nodes float64[m, 4]
+    properties JSON | WKB blob
+
+Section offsets in the header are relative to the end of the padding.
+
+The header records a digest of the GeoJSON the pack was compiled from; a
+pack whose source has changed since is stale and the GeoJSON is read instead.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Sequence as SequenceABC
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from .risk_raster import ZoneRecord, zones_fingerprint
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TGZPACK\x01"
+NODE_SIZE = 16
+_HILBERT_ORDER = 16
+
+
+def load_geojson_zones(path: Path) -> Tuple[List[ZoneRecord], List[Dict]]:
+    """Parse a GeoJSON FeatureCollection into zone records and raw properties."""
+    records: List[ZoneRecord] = []
+    properties: List[Dict] = []
+    if not path.exists():
+        return records, properties
+    with path.open() as f:
+        data = json.load(f)
+    for feature in data.get("features", []):
+        props = feature.get("properties", {}) or {}
+        records.append(_record(shape(feature["geometry"]), props))
+        properties.append(props)
+    return records, properties
+
+
+def _record(geom: shapely.Geometry, props: Dict) -> ZoneRecord:
+    return (
+        geom,
+        props.get("name", "Danger Zone"),
+        props.get("risk_level", "medium"),
+        props.get("advisory", ""),
+    )
+
+
+def _hilbert_index(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Hilbert curve distance for integer grid coordinates (vectorized)."""
+    x = x.astype(np.int64).copy()
+    y = y.astype(np.int64).copy()
+    d = np.zeros_like(x)
+    s = 1 << (_HILBERT_ORDER - 1)
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the curve stays continuous
+        flip = ~ry
+        swap_x = np.where(flip & rx, s - 1 - x, x)
+        swap_y = np.where(flip & rx, s - 1 - y, y)
+        x = np.where(flip, swap_y, swap_x)
+        y = np.where(flip, swap_x, swap_y)
+        s >>= 1
+    return d
+
+
+def _build_tree_levels(bboxes: np.ndarray) -> List[np.ndarray]:
+    """Parent levels of a packed R-tree, bottom-up (leaves excluded)."""
+    levels: List[np.ndarray] = []
+    current = bboxes
+    while len(current) > 1:
+        n_nodes = -(-len(current) // NODE_SIZE)
+        padded = np.empty((n_nodes * NODE_SIZE, 4))
+        padded[:, :2] = np.inf
+        padded[:, 2:] = -np.inf
+        padded[: len(current)] = current
+        grouped = padded.reshape(n_nodes, NODE_SIZE, 4)
+        parent = np.hstack([grouped[:, :, :2].min(axis=1), grouped[:, :, 2:].max(axis=1)])
+        levels.append(parent)
+        current = parent
+    return levels
+
+
+def source_digest(path: Path) -> str:
+    """SHA-1 of a zone source file, as recorded in a zone-pack header."""
+    digest = hashlib.sha1()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compile_zone_pack(source: Path, out: Path) -> Dict:
+    """Compile a GeoJSON zone file into a zone-pack; returns the header."""
+    records, properties = load_geojson_zones(source)
+    count = len(records)
+    geoms = np.array([r[0] for r in records], dtype=object)
+    bboxes = shapely.bounds(geoms).reshape(-1, 4) if count else np.zeros((0, 4))
+
+    # Hilbert order keeps spatially close zones close in the file and tree
+    if count:
+        lo, hi = bboxes[:, :2].min(axis=0), bboxes[:, 2:].max(axis=0)
+        span = np.where(hi - lo > 0, hi - lo, 1.0)
+        centres = ((bboxes[:, :2] + bboxes[:, 2:]) / 2.0 - lo) / span
+        cells = np.clip(centres * ((1 << _HILBERT_ORDER) - 1), 0, None)
+        order = np.argsort(_hilbert_index(cells[:, 0], cells[:, 1]), kind="stable")
+    else:
+        order = np.arange(0)
+    records = [records[i] for i in order]
+    properties = [properties[i] for i in order]
+    bboxes = np.ascontiguousarray(bboxes[order], dtype="<f8")
+
+    wkbs = [shapely.to_wkb(r[0]) for r in records]
+    offsets = np.zeros(count + 1, dtype="<u8")
+    offsets[1:] = np.cumsum([len(w) for w in wkbs])
+    levels = _build_tree_levels(bboxes)
+    nodes = np.ascontiguousarray(np.vstack(levels) if levels else np.zeros((0, 4)), dtype="<f8")
+    props_blob = json.dumps(properties, separators=(",", ":")).encode()
+
+    sections: Dict[str, List[int]] = {}
+    blobs = [
+        ("bboxes", bboxes.tobytes()),
+        ("wkb_offsets", offsets.tobytes()),
+        ("nodes", nodes.tobytes()),
+        ("properties", props_blob),
+        ("wkb", b"".join(wkbs)),
+    ]
+    cursor = 0
+    for name, blob in blobs:
+        sections[name] = [cursor, len(blob)]
+        cursor += len(blob) + (-len(blob) % 8)
+    header = {
+        "format": 1,
+        "count": count,
+        "node_size": NODE_SIZE,
+        "level_sizes": [len(level) for level in levels],
+        "fingerprint": zones_fingerprint(records, properties),
+        "source": str(source),
+        "source_sha1": source_digest(source),
+        "compiled_at": datetime.now(timezone.utc).isoformat(),
+        "sections": sections,
+    }
+    header_blob = json.dumps(header).encode()
+    prefix = MAGIC + struct.pack("<I", len(header_blob)) + header_blob
+    prefix += b"\0" * (-len(prefix) % 8)
+
+    tmp = out.with_name(out.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(prefix)
+        for _, blob in blobs:
+            f.write(blob)
+            f.write(b"\0" * (-len(blob) % 8))
+    os.replace(tmp, out)
+    return header
+
+
+class ZonePack(SequenceABC):
+    """Read-only, memory-mapped zone-pack usable as a sequence of zone records."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = self._mmap
+        if buf[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a zone-pack")
+        (header_len,) = struct.unpack_from("<I", buf, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header: Dict = json.loads(bytes(buf[start:start + header_len]))
+        base = start + header_len
+        base += -base % 8
+        self._base = base
+        self.count: int = self.header["count"]
+        self.fingerprint: str = self.header["fingerprint"]
+
+        def section(name: str, dtype: str, width: Optional[int] = None) -> np.ndarray:
+            offset, length = self.header["sections"][name]
+            array = np.frombuffer(buf, dtype=dtype, count=length // np.dtype(dtype).itemsize,
+                                  offset=base + offset)
+            return array.reshape(-1, width) if width else array
+
+        self.bboxes = section("bboxes", "<f8", 4)
+        self._wkb_offsets = section("wkb_offsets", "<u8")
+        nodes = section("nodes", "<f8", 4)
+        self._levels: List[np.ndarray] = [self.bboxes]
+        cursor = 0
+        for size in self.header["level_sizes"]:
+            self._levels.append(nodes[cursor:cursor + size])
+            cursor += size
+        props_offset, props_len = self.header["sections"]["properties"]
+        self.properties: List[Dict] = json.loads(
+            bytes(buf[base + props_offset:base + props_offset + props_len])
+        )
+        self._wkb_base = base + self.header["sections"]["wkb"][0]
+        self._geoms: Dict[int, shapely.Geometry] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> ZoneRecord:  # type: ignore[override]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return _record(self.geometry(index), self.properties[index])
+
+    def __iter__(self) -> Iterator[ZoneRecord]:
+        for i in range(self.count):
+            yield self[i]
+
+    def geometry(self, index: int) -> shapely.Geometry:
+        """Decode (once) and return the geometry of zone ``index``."""
+        geom = self._geoms.get(index)
+        if geom is None:
+            start = self._wkb_base + int(self._wkb_offsets[index])
+            end = self._wkb_base + int(self._wkb_offsets[index + 1])
+            geom = shapely.from_wkb(self._mmap[start:end])
+            self._geoms[index] = geom
+        return geom
+
+    def release(self, indexes: Sequence[int]) -> None:
+        """Drop decoded geometries; they are decoded again on next access."""
+        for index in np.asarray(indexes).tolist():
+            self._geoms.pop(index, None)
+
+    def query_bbox(self, min_x: float, min_y: float, max_x: float, max_y: float) -> np.ndarray:
+        """Sorted indexes of zones whose bounding box intersects the query box."""
+        if self.count == 0:
+            return np.zeros(0, dtype=np.int64)
+        top = len(self._levels) - 1
+        candidates = np.arange(len(self._levels[top]))
+        for depth in range(top, -1, -1):
+            boxes = self._levels[depth][candidates]
+            hit = (
+                (boxes[:, 0] <= max_x) & (boxes[:, 2] >= min_x)
+                & (boxes[:, 1] <= max_y) & (boxes[:, 3] >= min_y)
+            )
+            candidates = candidates[hit]
+            if depth == 0 or len(candidates) == 0:
+                break
+            children = (candidates[:, None] * NODE_SIZE + np.arange(NODE_SIZE)).ravel()
+            candidates = children[children < len(self._levels[depth - 1])]
+        return np.sort(candidates)
+
+    def query_point(self, lng: float, lat: float) -> np.ndarray:
+        return self.query_bbox(lng, lat, lng, lat)
+
+    def close(self) -> None:
+        """Release the mapping; the pack is unusable afterwards."""
+        # numpy views export the buffer, so drop them before closing it
+        self.bboxes = self._wkb_offsets = np.zeros(0)
+        self._levels = []
+        self._mmap.close()
+
+
+def open_zone_registry(
+    geojson_path: Path, pack_path: Optional[Path]
+) -> Tuple[Sequence[ZoneRecord], List[Dict], Optional[ZonePack], str]:
+    """Open the zone-pack if one exists and is current, else parse GeoJSON.
+
+    A pack compiled from a GeoJSON that has changed since (by digest, or by
+    mtime for packs without one) is ignored with a warning.
+
+    Returns the zone records, their raw properties, the pack (or None) and
+    the registry fingerprint.
+    """
+    if pack_path is not None and pack_path.exists():
+        pack = ZonePack(pack_path)
+        if not _is_stale(pack, geojson_path):
+            return pack, pack.properties, pack, pack.fingerprint
+        pack.close()
+        logger.warning(
+            "%s has changed since %s was compiled; reading the GeoJSON instead. "
+            "Run `python -m app.cli zones compile`",
+            geojson_path,
+            pack_path,
+        )
+    records, properties = load_geojson_zones(geojson_path)
+    return records, properties, None, zones_fingerprint(records, properties)
+
+
+def _is_stale(pack: ZonePack, source: Path) -> bool:
+    if not source.exists():
+        return False
+    recorded = pack.header.get("source_sha1")
+    if recorded is not None:
+        return recorded != source_digest(source)
+    return source.stat().st_mtime > pack.path.stat().st_mtime
@@ -0,0 +1,142 @@
+"""Time-dependent danger-zone schedules.
+
+A zone's GeoJSON properties may carry a ``schedule``::
+
+    "schedule": {
+        "hours": [[19, 5]],
+        "days": ["fri", "sat"],
+        "risk_levels": {"day": "low"}
+    }
+
+``hours`` lists active ``[start, end)`` windows in whole hours (a window may
+wrap past midnight), ``days`` restricts them to weekdays, and ``risk_levels``
+overrides the zone's ``risk_level`` per time-of-day bucket. Zones without a
+schedule are always active at their base risk.
+
+Schedules are resolved once, at registry load, into a table over *slots*
+(weekday x time-of-day bucket): which zones are active in each slot and at
+what risk. A zone counts as active in a slot if it is active for any hour of
+that bucket, so alerts err on the side of caution. Lookups then only index
+the table instead of evaluating schedules per call.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .time_buckets import TIME_BUCKETS, time_bucket
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+N_SLOTS = len(WEEKDAYS) * len(TIME_BUCKETS)
+
+_BUCKET_HOURS: Dict[str, List[int]] = {
+    bucket: [h for h in range(24) if time_bucket(h) == bucket] for bucket in TIME_BUCKETS
+}
+
+
+def slot_index(weekday: int, bucket: str) -> int:
+    return weekday * len(TIME_BUCKETS) + TIME_BUCKETS.index(bucket)
+
+
+def active_hours(schedule: Dict) -> np.ndarray:
+    """(7, 24) boolean mask of the weekday/hours a schedule is active."""
+    hours = np.zeros(24, dtype=bool)
+    windows = schedule.get("hours")
+    if windows is None:
+        hours[:] = True
+    for start, end in windows or []:
+        start, end = int(start) % 24, int(end) % 24
+        if start < end:
+            hours[start:end] = True
+        else:  # wraps midnight; [h, h) means all day
+            hours[start:] = True
+            hours[:end] = True
+    days = np.zeros(7, dtype=bool)
+    names = schedule.get("days")
+    if names is None:
+        days[:] = True
+    for name in names or []:
+        days[WEEKDAYS.index(str(name).lower()[:3])] = True
+    return days[:, None] & hours[None, :]
+
+
+def schedule_key(properties: Dict) -> Optional[str]:
+    """Canonical text of a zone's schedule, for registry fingerprints."""
+    schedule = properties.get("schedule")
+    if not schedule:
+        return None
+    return json.dumps(schedule, sort_keys=True, separators=(",", ":"))
+
+
+class ZoneScheduleTable:
+    """Per-slot zone activity and risk levels for a zone registry."""
+
+    def __init__(self, properties: Sequence[Dict]) -> None:
+        n = len(properties)
+        base = [p.get("risk_level", "medium") for p in properties]
+        self.base_risk = np.array(base, dtype=object)
+        self.active = np.ones((N_SLOTS, n), dtype=bool)
+        self.risk = np.tile(self.base_risk, (N_SLOTS, 1)) if n else np.empty((N_SLOTS, 0), dtype=object)
+        self.scheduled = np.zeros(n, dtype=bool)
+        for i, props in enumerate(properties):
+            schedule = props.get("schedule")
+            if not schedule:
+                continue
+            self.scheduled[i] = True
+            mask = active_hours(schedule)
+            overrides = schedule.get("risk_levels", {})
+            for weekday in range(len(WEEKDAYS)):
+                for bucket, hours in _BUCKET_HOURS.items():
+                    slot = slot_index(weekday, bucket)
+                    self.active[slot, i] = bool(mask[weekday, hours].any())
+                    self.risk[slot, i] = overrides.get(bucket, base[i])
+        self._canonical = self._canonical_slots()
+
+    def __len__(self) -> int:
+        return len(self.base_risk)
+
+    def _canonical_slots(self) -> np.ndarray:
+        # Slots of the same bucket whose activity and risk match on every zone
+        # answer identically; mapping them together lets caches share entries
+        canonical = np.arange(N_SLOTS)
+        seen: Dict[tuple, int] = {}
+        columns = self.scheduled.nonzero()[0]
+        for slot in range(N_SLOTS):
+            signature = (
+                slot % len(TIME_BUCKETS),
+                self.active[slot, columns].tobytes(),
+                tuple(self.risk[slot, columns]),
+            )
+            canonical[slot] = seen.setdefault(signature, slot)
+        return canonical
+
+    def slot_for(self, timestamp: Optional[datetime]) -> Optional[int]:
+        """Canonical slot of a timestamp; None (no time) means every zone."""
+        if timestamp is None:
+            return None
+        slot = slot_index(timestamp.weekday(), time_bucket(timestamp.hour))
+        return int(self._canonical[slot])
+
+    def is_active(self, zone_idx: int, slot: Optional[int]) -> bool:
+        return slot is None or bool(self.active[slot, zone_idx])
+
+    def risk_level(self, zone_idx: int, slot: Optional[int]) -> str:
+        if slot is None:
+            return str(self.base_risk[zone_idx])
+        return str(self.risk[slot, zone_idx])
+
+    def bucket_risks(self, zone_idx: int) -> Dict[str, Optional[str]]:
+        """Highest risk per bucket over the week; None where never active."""
+        order = {"low": 0, "medium": 1, "high": 2}
+        risks: Dict[str, Optional[str]] = {}
+        for bucket in TIME_BUCKETS:
+            levels = [
+                str(self.risk[slot, zone_idx])
+                for slot in (slot_index(d, bucket) for d in range(len(WEEKDAYS)))
+                if self.active[slot, zone_idx]
+            ]
+            risks[bucket] = max(levels, key=lambda r: order.get(r, 0)) if levels else None
+        return risks
@@ -0,0 +1,306 @@
+"""Region-partitioned, lazily loaded danger-zone tiles.
+
+Zones are bucketed by bounding box into slippy-map (Web Mercator) tiles at a
+fixed zoom; a zone straddling tiles is listed in each. Only the bucket
+membership is built up front. A tile's geometries are materialized, with a
+spatial index over them, the first time a lookup touches the tile, and the
+least recently used tiles are evicted once ``max_tiles`` are loaded. Lookup
+cost and resident memory therefore follow the zone density around active
+trips rather than the size of the whole catalogue.
+
+Tiles holding scheduled zones also get one index per distinct set of zones
+active in a schedule slot (see ``zone_schedule``), so a lookup at a given
+time only ever sees the zones active then.
+
+Route queries (``path_pairs``) load only the tiles a polyline actually passes
+through and query each tile's own index.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+from .exposure import METRES_PER_DEGREE
+from .risk_raster import ZoneRecord
+from .zone_schedule import N_SLOTS, ZoneScheduleTable
+
+TileKey = Tuple[int, int]
+
+_MAX_MERCATOR_LAT = 85.05112878
+
+
+def tile_xy(lngs: np.ndarray, lats: np.ndarray, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Slippy-map tile column/row for coordinate arrays."""
+    n = 1 << zoom
+    lats = np.radians(np.clip(np.asarray(lats, dtype=float), -_MAX_MERCATOR_LAT, _MAX_MERCATOR_LAT))
+    x = np.floor((np.asarray(lngs, dtype=float) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.log(np.tan(lats) + 1.0 / np.cos(lats)) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def tile_bounds(
+    xs: np.ndarray, ys: np.ndarray, zoom: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(min_lng, min_lat, max_lng, max_lat) of slippy-map tiles."""
+    n = 1 << zoom
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+
+    def lat(y: np.ndarray) -> np.ndarray:
+        return np.degrees(np.arctan(np.sinh(math.pi * (1.0 - 2.0 * y / n))))
+
+    return xs / n * 360.0 - 180.0, lat(ys + 1), (xs + 1) / n * 360.0 - 180.0, lat(ys)
+
+
+def _spans(
+    x0: np.ndarray, y0: np.ndarray, x1: np.ndarray, y1: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Every tile of each ``[x0, x1] x [y0, y1]`` range as (owner, x, y)."""
+    width, height = x1 - x0 + 1, y1 - y0 + 1
+    spans = width * height
+    owner = np.repeat(np.arange(len(spans)), spans)
+    offset = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+    return owner, x0[owner] + offset % width[owner], y0[owner] + offset // width[owner]
+
+
+class _Tile:
+    __slots__ = ("zone_ids", "tree", "slots")
+
+    def __init__(
+        self,
+        zone_ids: np.ndarray,
+        tree: STRtree,
+        slots: Optional[List[Tuple[STRtree, np.ndarray]]] = None,
+    ) -> None:
+        self.zone_ids = zone_ids
+        self.tree = tree
+        self.slots = slots
+
+    def view(self, slot: Optional[int]) -> Tuple[STRtree, np.ndarray]:
+        """Index and registry ids of the zones active in ``slot`` (None: all)."""
+        if slot is None or self.slots is None:
+            return self.tree, self.zone_ids
+        return self.slots[slot]
+
+
+class ZoneTileIndex:
+    """Tile-partitioned zone lookups with LRU eviction of cold tiles."""
+
+    def __init__(
+        self,
+        zones: Sequence[ZoneRecord],
+        zoom: int = 12,
+        max_tiles: int = 256,
+        schedules: Optional[ZoneScheduleTable] = None,
+    ) -> None:
+        self.zones = zones
+        self.schedules = schedules
+        self.zoom = zoom
+        if max_tiles < 1:
+            raise ValueError("max_tiles must be at least 1")
+        self.max_tiles = max_tiles
+        bboxes = getattr(zones, "bboxes", None)
+        if bboxes is None:
+            # Plain records are already materialized; a zone-pack stores bboxes
+            bboxes = shapely.bounds(np.array([z[0] for z in zones], dtype=object)).reshape(-1, 4)
+        self._members = self._bucket(np.asarray(bboxes, dtype=float))
+        self._refs = np.zeros(len(zones), dtype=np.int32)
+        self._loaded: "OrderedDict[TileKey, _Tile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def _bucket(self, bboxes: np.ndarray) -> Dict[TileKey, np.ndarray]:
+        if len(bboxes) == 0:
+            return {}
+        # Tile rows grow southwards, so the bbox's max latitude gives the first row
+        x0, y0 = tile_xy(bboxes[:, 0], bboxes[:, 3], self.zoom)
+        x1, y1 = tile_xy(bboxes[:, 2], bboxes[:, 1], self.zoom)
+        zone, xs, ys = _spans(x0, y0, x1, y1)
+        order = np.lexsort((zone, ys, xs))
+        xs, ys, zone = xs[order], ys[order], zone[order]
+        breaks = np.flatnonzero((np.diff(xs) != 0) | (np.diff(ys) != 0)) + 1
+        starts = np.concatenate([[0], breaks])
+        return {
+            (int(xs[s]), int(ys[s])): ids
+            for s, ids in zip(starts.tolist(), np.split(zone, breaks))
+        }
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+    def _geometry(self, zone_idx: int) -> shapely.Geometry:
+        geometry = getattr(self.zones, "geometry", None)
+        return geometry(zone_idx) if geometry is not None else self.zones[zone_idx][0]
+
+    def _tile(self, key: TileKey) -> Optional[_Tile]:
+        """Loaded tile for ``key`` (loading it on a miss); None if empty."""
+        ids = self._members.get(key)
+        if ids is None:
+            return None
+        with self._lock:
+            tile = self._loaded.get(key)
+            if tile is not None:
+                self._loaded.move_to_end(key)
+                return tile
+        tile = self._build_tile(ids)
+        with self._lock:
+            loaded = self._loaded.get(key)
+            if loaded is not None:
+                # Another thread loaded it meanwhile; keep a single copy
+                self._loaded.move_to_end(key)
+                return loaded
+            self._loaded[key] = tile
+            self._refs[ids] += 1
+            self.loads += 1
+            while len(self._loaded) > self.max_tiles:
+                self._evict()
+        return tile
+
+    def _build_tile(self, ids: np.ndarray) -> _Tile:
+        geoms = [self._geometry(i) for i in ids.tolist()]
+        tree = STRtree(geoms)
+        if self.schedules is None or not self.schedules.scheduled[ids].any():
+            return _Tile(ids, tree)
+        # One index per distinct active subset; most slots share a handful
+        views: Dict[bytes, Tuple[STRtree, np.ndarray]] = {}
+        slots = []
+        for slot in range(N_SLOTS):
+            mask = self.schedules.active[slot, ids]
+            view = views.get(mask.tobytes())
+            if view is None:
+                if mask.all():
+                    view = (tree, ids)
+                else:
+                    view = (STRtree([g for g, keep in zip(geoms, mask) if keep]), ids[mask])
+                views[mask.tobytes()] = view
+            slots.append(view)
+        return _Tile(ids, tree, slots)
+
+    def _evict(self) -> None:
+        _, tile = self._loaded.popitem(last=False)
+        self._refs[tile.zone_ids] -= 1
+        self.evictions += 1
+        release = getattr(self.zones, "release", None)
+        if release is not None:
+            release(tile.zone_ids[self._refs[tile.zone_ids] == 0])
+
+    def _tiles_in(self, min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> List[_Tile]:
+        x0, y0 = tile_xy(np.array([min_lng]), np.array([max_lat]), self.zoom)
+        x1, y1 = tile_xy(np.array([max_lng]), np.array([min_lat]), self.zoom)
+        tiles = []
+        for x in range(int(x0[0]), int(x1[0]) + 1):
+            for y in range(int(y0[0]), int(y1[0]) + 1):
+                tile = self._tile((x, y))
+                if tile is not None:
+                    tiles.append(tile)
+        return tiles
+
+    def containing(self, lat: float, lng: float, slot: Optional[int] = None) -> List[int]:
+        """Registry indexes of zones containing the point, in registry order.
+
+        With a schedule ``slot``, only zones active in it are considered.
+        """
+        x, y = tile_xy(np.array([lng]), np.array([lat]), self.zoom)
+        tile = self._tile((int(x[0]), int(y[0])))
+        if tile is None:
+            return []
+        tree, zone_ids = tile.view(slot)
+        hits = tree.query(shapely.Point(lng, lat), predicate="within")
+        return sorted(zone_ids[hits].tolist())
+
+    def within(
+        self, lat: float, lng: float, radius_m: float, slot: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """Zones within ``radius_m`` as (zone_index, distance_m), nearest first."""
+        d_lat = radius_m / METRES_PER_DEGREE
+        d_lng = d_lat / max(math.cos(math.radians(lat)), 1e-6)
+        window = shapely.box(lng - d_lng, lat - d_lat, lng + d_lng, lat + d_lat)
+        ids: List[int] = []
+        for tile in self._tiles_in(*window.bounds):
+            tree, zone_ids = tile.view(slot)
+            ids.extend(zone_ids[tree.query(window)].tolist())
+        if not ids:
+            return []
+        candidates = np.unique(ids)
+        # Distances in a local equirectangular frame centred on the point
+        scale = np.array([METRES_PER_DEGREE * math.cos(math.radians(lat)), METRES_PER_DEGREE])
+        origin = np.array([lng, lat])
+        geoms = np.array([self._geometry(i) for i in candidates.tolist()], dtype=object)
+        local = shapely.transform(geoms, lambda xy: (xy - origin) * scale)
+        distances = shapely.distance(local, shapely.Point(0.0, 0.0))
+        keep = distances <= radius_m
+        order = np.argsort(distances[keep], kind="stable")
+        return [
+            (int(i), float(d))
+            for i, d in zip(candidates[keep][order], distances[keep][order])
+        ]
+
+    def _path_tiles(self, coords: np.ndarray, segments: np.ndarray) -> Dict[TileKey, np.ndarray]:
+        """Non-empty tiles each segment passes through, as tile -> segment indexes."""
+        x, y = tile_xy(coords[:, 0], coords[:, 1], self.zoom)
+        x0, x1 = np.minimum(x[:-1], x[1:]), np.maximum(x[:-1], x[1:])
+        y0, y1 = np.minimum(y[:-1], y[1:]), np.maximum(y[:-1], y[1:])
+        seg, xs, ys = _spans(x0, y0, x1, y1)
+        keep = np.array(
+            [key in self._members for key in zip(xs.tolist(), ys.tolist())], dtype=bool
+        )
+        seg, xs, ys = seg[keep], xs[keep], ys[keep]
+        # A segment one tile wide or tall crosses every tile of its bbox; a
+        # diagonal one only some, so test those against the tile outlines
+        diagonal = (x1 - x0 > 0)[seg] & (y1 - y0 > 0)[seg]
+        if diagonal.any():
+            boxes = shapely.box(*tile_bounds(xs[diagonal], ys[diagonal], self.zoom))
+            crossed = np.ones(len(seg), dtype=bool)
+            crossed[diagonal] = shapely.intersects(segments[seg[diagonal]], boxes)
+            seg, xs, ys = seg[crossed], xs[crossed], ys[crossed]
+        tiles: Dict[TileKey, List[int]] = {}
+        for s, key in zip(seg.tolist(), zip(xs.tolist(), ys.tolist())):
+            tiles.setdefault(key, []).append(s)
+        return {key: np.array(segs, dtype=np.int64) for key, segs in tiles.items()}
+
+    def path_pairs(
+        self, coords: np.ndarray, slot: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Zones intersecting each segment of a (lng, lat) polyline.
+
+        Only the tiles the polyline passes through are loaded, and each is
+        queried through its own index. Returns the segment index, registry
+        zone index and zone geometry of every intersecting pair, ordered by
+        segment then zone.
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        seg_parts: List[np.ndarray] = [np.zeros(0, dtype=np.int64)]
+        zone_parts: List[np.ndarray] = [np.zeros(0, dtype=np.int64)]
+        geom_parts: List[np.ndarray] = [np.zeros(0, dtype=object)]
+        if len(coords) >= 2 and self._members:
+            segments = shapely.linestrings(np.stack([coords[:-1], coords[1:]], axis=1))
+            for key, segs in self._path_tiles(coords, segments).items():
+                tree, zone_ids = self._tile(key).view(slot)
+                seg_idx, tree_idx = tree.query(segments[segs], predicate="intersects")
+                seg_parts.append(segs[seg_idx])
+                zone_parts.append(zone_ids[tree_idx])
+                geom_parts.append(tree.geometries[tree_idx])
+        seg_idx = np.concatenate(seg_parts)
+        zone_ids = np.concatenate(zone_parts)
+        # A zone listed in several crossed tiles is found once per tile
+        _, first = np.unique(seg_idx * max(len(self.zones), 1) + zone_ids, return_index=True)
+        return seg_idx[first], zone_ids[first], np.concatenate(geom_parts)[first]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "zoom": self.zoom,
+                "tiles": len(self._members),
+                "loaded_tiles": len(self._loaded),
+                "max_tiles": self.max_tiles,
+                "resident_zones": int((self._refs > 0).sum()),
+                "zones": len(self.zones),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,4 @@
+"""Micro-benchmarks for ML Engine hot paths.
+
+Run from the ``ml-engine`` directory, e.g. ``python -m benchmarks.route_scoring_bench``.
+"""
@@ -0,0 +1,127 @@
+"""Benchmark loading historical observations from CSV and the Parquet dataset.
+
+Generates ``--rows`` synthetic observations spread over ``--days`` days and
+a handful of regions, writes them both as the legacy CSV and as the
+date/region partitioned dataset, then times:
+
+* the whole CSV (what training used to load),
+* the CSV restricted to the three feature columns,
+* the dataset restricted to the three feature columns,
+* the dataset restricted to the feature columns and the last day.
+
+Rows are generated and written a million at a time, so only the loads
+themselves need the data in memory; ``--skip-full-csv`` leaves out the
+first case where that does not fit.
+
+    python -m benchmarks.dataset_load_bench --rows 10000000 --repeat 1
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.observation_dataset import ObservationDataset
+
+FEATURES = ["speed_mps", "accuracy_m", "battery_pct"]
+
+
+CHUNK_ROWS = 1_000_000
+
+
+def synthetic_history(
+    n: int, days: int, rng: np.random.Generator, chunk_rows: int = CHUNK_ROWS
+) -> Iterator[pd.DataFrame]:
+    """``n`` rows in time order, as frames of at most ``chunk_rows``."""
+    span = days * 86_400.0
+    for first in range(0, n, chunk_rows):
+        count = min(chunk_rows, n - first)
+        yield _synthetic_chunk(count, span * first / n, span * count / n, max(n // 2_000, 1), rng)
+
+
+def _synthetic_chunk(
+    n: int, offset_s: float, span_s: float, trip_count: int, rng: np.random.Generator
+) -> pd.DataFrame:
+    start = pd.Timestamp("2025-11-01", tz="UTC")
+    offsets = offset_s + np.sort(rng.uniform(0.0, span_s, n))
+    trips = rng.integers(0, trip_count, n)
+    return pd.DataFrame(
+        {
+            "tourist_id": np.char.add("tg-", (trips % 5_000).astype(str)),
+            "trip_id": np.char.add("trip-", trips.astype(str)),
+            "timestamp": (start + pd.to_timedelta(offsets, unit="s")).strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "lat": rng.uniform(25.0, 26.9, n).round(6),
+            "lng": rng.uniform(89.8, 92.8, n).round(6),
+            "speed_mps": np.clip(rng.normal(1.3, 0.8, n), 0.0, None).round(2),
+            "accuracy_m": rng.uniform(3.0, 40.0, n).round(1),
+            "battery_pct": rng.uniform(5.0, 100.0, n).round(0),
+            "label_danger": (rng.random(n) < 0.01).astype(float),
+        }
+    )
+
+
+def timed(fn, repeat: int) -> Tuple[float, int]:
+    """Best time of ``repeat`` loads, and the rows loaded."""
+    best, rows = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = len(fn().index)
+        best = min(best, time.perf_counter() - start)
+    return best, rows
+
+
+def size_mb(path: Path) -> float:
+    if path.is_file():
+        return path.stat().st_size / 1e6
+    return sum(p.stat().st_size for p in path.rglob("*.parquet")) / 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-full-csv", action="store_true", help="Don't load the whole CSV")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv = Path(tmp) / "historical_observations.csv"
+        dataset = ObservationDataset(Path(tmp) / "observations")
+        write_s = 0.0
+        for i, chunk in enumerate(synthetic_history(args.rows, args.days, np.random.default_rng(7))):
+            chunk.to_csv(csv, mode="a", header=i == 0, index=False)
+            start = time.perf_counter()
+            dataset.write(chunk)
+            write_s += time.perf_counter() - start
+        last_day = pd.Timestamp("2025-11-01", tz="UTC") + pd.Timedelta(days=args.days - 1)
+
+        cases = []
+        if not args.skip_full_csv:
+            cases.append(("csv, all columns", lambda: pd.read_csv(csv, parse_dates=["timestamp"])))
+        cases += [
+            ("csv, features", lambda: pd.read_csv(csv, usecols=FEATURES)),
+            ("parquet, features", lambda: dataset.read(FEATURES)),
+            (
+                "parquet, features, 1 day",
+                lambda: dataset.read(FEATURES, start=last_day.to_pydatetime()),
+            ),
+        ]
+        print(
+            f"rows: {args.rows:,}  days: {args.days}  csv: {size_mb(csv):.0f} MB  "
+            f"dataset: {size_mb(dataset.root):.0f} MB (written in {write_s:.1f} s)"
+        )
+        print(f"{'':28}{'rows':>12}{'seconds':>10}{'speedup':>9}")
+        baseline = None
+        for name, load in cases:
+            seconds, rows = timed(load, args.repeat)
+            baseline = baseline or seconds
+            print(f"{name:28}{rows:12,}{seconds:10.2f}{baseline / seconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark movement-pattern metrics: recomputed per fix vs a sliding window.
+
+For each window size, feeds ``--points`` synthetic fixes of one trip and
+times the per-fix cost of:
+
+* recomputing leg distances, speed mean/variance/max and path efficiency
+  from the last N fixes (what ``analyze_movement_pattern`` used to do),
+* updating a ``MovementWindow`` and reading its metrics.
+
+    python -m benchmarks.movement_window_bench --points 50000
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import List, Tuple
+
+import numpy as np
+from haversine import Unit, haversine
+
+from app.movement import MovementWindow
+
+Fix = Tuple[float, float, float]
+
+
+def synthetic_fixes(n: int, rng: np.random.Generator) -> List[Fix]:
+    times = np.cumsum(rng.choice([5.0, 30.0, 60.0], n))
+    lat = 26.1 + np.cumsum(rng.normal(0.0, 0.0002, n))
+    lng = 91.7 + np.cumsum(rng.normal(0.0, 0.0002, n))
+    return list(zip(times.tolist(), lat.tolist(), lng.tolist()))
+
+
+def recompute(recent: List[Fix]) -> float:
+    speeds, distances = [], []
+    for (t0, lat0, lng0), (t1, lat1, lng1) in zip(recent, recent[1:]):
+        if t1 > t0:
+            d = haversine((lat0, lng0), (lat1, lng1), unit=Unit.METERS)
+            speeds.append(d / (t1 - t0) * 3.6)
+            distances.append(d)
+    straight = haversine(recent[0][1:], recent[-1][1:], unit=Unit.METERS)
+    return float(np.var(speeds)) + float(np.mean(speeds)) + max(speeds) + straight / sum(distances)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, default=50_000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 20, 100])
+    args = parser.parse_args()
+
+    fixes = synthetic_fixes(args.points, np.random.default_rng(7))
+    print(f"{'window':>8}{'recompute us':>14}{'sliding us':>12}{'speedup':>9}")
+    for size in args.sizes:
+        start = time.perf_counter()
+        for i in range(size, len(fixes)):
+            recompute(fixes[i - size + 1 : i + 1])
+        before = (time.perf_counter() - start) / (len(fixes) - size) * 1e6
+
+        window = MovementWindow(size)
+        start = time.perf_counter()
+        for fix in fixes:
+            window.add(*fix)
+            window.metrics()
+        after = (time.perf_counter() - start) / len(fixes) * 1e6
+        print(f"{size:8}{before:14.1f}{after:12.1f}{before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark exposure-weighted route scoring on long multi-hundred-point routes.
+
+Compares the legacy per-segment/per-zone ``intersects`` loop against the bulk
+exposure calculator, cold (empty pair cache) and warm.
+
+    python -m benchmarks.route_scoring_bench --points 800 --zones 500
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+from shapely import STRtree, box
+from shapely.geometry import LineString
+
+from app.exposure import ExposureCalculator
+
+
+def synthetic_zones(n: int, rng: np.random.Generator) -> list:
+    # Shillong-sized bounding box, zones 100-600 m across
+    lngs = rng.uniform(91.80, 91.95, n)
+    lats = rng.uniform(25.52, 25.62, n)
+    sizes = rng.uniform(0.001, 0.006, n)
+    return [box(x, y, x + s, y + s) for x, y, s in zip(lngs, lats, sizes)]
+
+
+def synthetic_route(n: int, rng: np.random.Generator) -> np.ndarray:
+    steps = rng.normal(0, 0.0004, size=(n, 2)) + np.array([0.00015, 0.0001])
+    return np.cumsum(steps, axis=0) + np.array([91.80, 25.52])
+
+
+def legacy_flat(coords: np.ndarray, zones: list) -> int:
+    hits = 0
+    for i in range(len(coords) - 1):
+        segment = LineString([tuple(coords[i]), tuple(coords[i + 1])])
+        for polygon in zones:
+            if segment.intersects(polygon):
+                hits += 1
+    return hits
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, default=500)
+    parser.add_argument("--zones", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    zones = synthetic_zones(args.zones, rng)
+    coords = synthetic_route(args.points, rng)
+    tree = STRtree(zones)
+
+    legacy = timed(lambda: legacy_flat(coords, zones), max(1, args.repeat // 2))
+    cold = timed(lambda: ExposureCalculator().segment_exposure(coords, tree, 0), args.repeat)
+    calculator = ExposureCalculator()
+    exposures = calculator.segment_exposure(coords, tree, 0)
+    warm = timed(lambda: calculator.segment_exposure(coords, tree, 0), args.repeat)
+
+    pairs = sum(len(e) for e in exposures)
+    metres = sum(sum(e.values()) for e in exposures)
+    print(f"route points: {args.points}  zones: {args.zones}  segment/zone pairs: {pairs}")
+    print(f"metres inside zones: {metres:.0f}")
+    print(f"legacy flat loop:      {legacy * 1000:8.2f} ms")
+    print(f"bulk exposure (cold):  {cold * 1000:8.2f} ms  ({legacy / cold:.1f}x)")
+    print(f"bulk exposure (warm):  {warm * 1000:8.2f} ms  ({legacy / warm:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
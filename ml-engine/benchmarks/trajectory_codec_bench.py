@@ -0,0 +1,125 @@
+"""Benchmark the trajectory block codec against CSV rows and Pydantic objects.
+
+Generates a synthetic trip (a GPS random walk sampled every ~5 s with jitter)
+and reports bytes per point and decode throughput for:
+
+* CSV rows as appended to the historical dataset,
+* Observation objects held in memory (measured with tracemalloc),
+* codec blocks of ``--block`` points, decoded to arrays and to objects.
+
+    python -m benchmarks.trajectory_codec_bench --points 100000
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from app.schemas import Observation
+from app.trajectory_codec import decode_block, decode_observations, encode_block
+
+
+def synthetic_trip(n: int, rng: np.random.Generator) -> List[Observation]:
+    start = datetime(2025, 11, 26, 6, 0, tzinfo=timezone.utc)
+    offsets = np.cumsum(rng.choice([4.0, 5.0, 5.0, 5.0, 6.0], n))
+    speeds = np.clip(rng.normal(1.3, 0.6, n), 0.0, None)
+    headings = np.cumsum(rng.normal(0.0, 15.0, n)) % 360.0
+    step = speeds * 5.0 / 111_320.0
+    lats = 25.57 + np.cumsum(step * np.cos(np.radians(headings)))
+    lngs = 91.88 + np.cumsum(step * np.sin(np.radians(headings)))
+    accuracy = rng.uniform(3.0, 25.0, n).round(1)
+    battery = np.linspace(95.0, 20.0, n).round(0)
+    return [
+        Observation(
+            tourist_id="tg-bench",
+            trip_id="trip-bench",
+            timestamp=start + timedelta(seconds=float(offsets[i])),
+            lat=float(lats[i]),
+            lng=float(lngs[i]),
+            speed_mps=float(speeds[i]),
+            accuracy_m=float(accuracy[i]),
+            battery_pct=float(battery[i]),
+            heading_deg=float(headings[i]),
+        )
+        for i in range(n)
+    ]
+
+
+def csv_bytes(observations: List[Observation]) -> bytes:
+    rows = [
+        {
+            "tourist_id": o.tourist_id,
+            "trip_id": o.trip_id,
+            "timestamp": o.timestamp.isoformat(),
+            "lat": o.lat,
+            "lng": o.lng,
+            "speed_mps": o.speed_mps,
+            "accuracy_m": o.accuracy_m,
+            "battery_pct": o.battery_pct,
+        }
+        for o in observations
+    ]
+    return pd.DataFrame(rows).to_csv(index=False).encode()
+
+
+def pydantic_bytes(observations: List[Observation]) -> int:
+    # Rebuild the objects under tracemalloc to measure what holding them costs
+    payloads = [o.model_dump() for o in observations]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = [Observation.model_validate(p) for p in payloads]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del held
+    return size
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, default=50_000)
+    parser.add_argument("--block", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    observations = synthetic_trip(args.points, rng)
+    n = len(observations)
+
+    csv = csv_bytes(observations)
+    held = pydantic_bytes(observations)
+    start = time.perf_counter()
+    blocks = [encode_block(observations[i : i + args.block]) for i in range(0, n, args.block)]
+    encode_s = time.perf_counter() - start
+    packed = sum(len(b) for b in blocks)
+
+    csv_s = timed(lambda: pd.read_csv(io.BytesIO(csv), parse_dates=["timestamp"]), args.repeat)
+    arrays_s = timed(lambda: [decode_block(b) for b in blocks], args.repeat)
+    objects_s = timed(
+        lambda: [decode_observations(b, "tg-bench", "trip-bench") for b in blocks], args.repeat
+    )
+
+    print(f"points: {n}  block: {args.block}  encode: {n / encode_s / 1e6:.2f} M points/s")
+    print(f"{'':22}{'bytes/point':>12}{'ratio':>8}{'decode M points/s':>20}")
+    print(f"{'csv':22}{len(csv) / n:12.1f}{len(csv) / packed:8.1f}x{n / csv_s / 1e6:19.2f}")
+    print(f"{'pydantic objects':22}{held / n:12.1f}{held / packed:8.1f}x{'-':>20}")
+    print(f"{'codec -> arrays':22}{packed / n:12.1f}{1:8.1f}x{n / arrays_s / 1e6:19.2f}")
+    print(f"{'codec -> objects':22}{'':12}{'':9}{n / objects_s / 1e6:19.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark danger-zone loading: GeoJSON parsing vs an mmap'd zone-pack.
+
+Writes a synthetic nationwide-sized zone set to a temp directory, compiles it
+and times startup (GeoJSON parse vs pack open), a first point lookup and a
+full materialization of every geometry from the pack.
+
+    python -m benchmarks.zone_load_bench --zones 50000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import shapely
+from shapely.geometry import Point, mapping
+
+from app.zone_pack import ZonePack, compile_zone_pack, load_geojson_zones
+
+
+def write_synthetic_geojson(path: Path, n: int, rng: np.random.Generator) -> None:
+    # Zones scattered over India, 24-gon blobs 200 m - 2 km across
+    lngs = rng.uniform(68.0, 97.0, n)
+    lats = rng.uniform(8.0, 35.0, n)
+    radii = rng.uniform(0.001, 0.01, n)
+    polygons = shapely.buffer(shapely.points(lngs, lats), radii, quad_segs=6)
+    risks = rng.choice(["low", "medium", "high"], n)
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"name": f"Zone {i}", "risk_level": str(risks[i]), "advisory": "Take care."},
+            "geometry": mapping(polygon),
+        }
+        for i, polygon in enumerate(polygons)
+    ]
+    with path.open("w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def first_hit_geojson(path: Path, lng: float, lat: float) -> None:
+    records, _ = load_geojson_zones(path)
+    point = Point(lng, lat)
+    next((r for r in records if r[0].contains(point)), None)
+
+
+def first_hit_pack(path: Path, lng: float, lat: float) -> None:
+    pack = ZonePack(path)
+    point = Point(lng, lat)
+    next((i for i in pack.query_point(lng, lat) if pack.geometry(i).contains(point)), None)
+    pack.close()
+
+
+def materialize_pack(path: Path) -> None:
+    pack = ZonePack(path)
+    for i in range(len(pack)):
+        pack.geometry(i)
+    pack.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--zones", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        source, pack_path = Path(tmp) / "zones.geojson", Path(tmp) / "zones.zpk"
+        write_synthetic_geojson(source, args.zones, rng)
+        start = time.perf_counter()
+        compile_zone_pack(source, pack_path)
+        compile_s = time.perf_counter() - start
+
+        pack = ZonePack(pack_path)
+        lng, lat = shapely.get_coordinates(pack.geometry(len(pack) // 2).centroid)[0]
+        pack.close()
+
+        geojson = timed(lambda: first_hit_geojson(source, lng, lat), args.repeat)
+        opened = timed(lambda: ZonePack(pack_path).close(), args.repeat)
+        first_hit = timed(lambda: first_hit_pack(pack_path, lng, lat), args.repeat)
+        full = timed(lambda: materialize_pack(pack_path), args.repeat)
+
+        print(f"zones: {args.zones}  geojson: {source.stat().st_size / 1e6:.1f} MB  "
+              f"pack: {pack_path.stat().st_size / 1e6:.1f} MB  compile: {compile_s:.2f} s")
+        print(f"geojson load + lookup:   {geojson * 1000:9.2f} ms")
+        print(f"pack open:               {opened * 1000:9.2f} ms  ({geojson / opened:.0f}x)")
+        print(f"pack open + lookup:      {first_hit * 1000:9.2f} ms  ({geojson / first_hit:.0f}x)")
+        print(f"pack full materialize:   {full * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()